@@ -4,6 +4,7 @@ Author: Alims-Repo
 Date: 2025-06-17
 """
 
+import json
 import os
 from pathlib import Path
 
@@ -31,6 +32,25 @@ class Config:
     VIDEO_PATH = RESOURCES_DIR / "1.mp4"
     DEFAULT_VIDEO_URL = "https://sample-videos.com/zip/10/mp4/SampleVideo_1280x720_1mb.mp4"
     
+    # Multi-camera sources: JSON object of {camera_id: {"path": ..., "fps": ...}}
+    # e.g. VIDEO_SOURCES='{"north": {"path": "rtsp://cam1/stream", "fps": 15}}'
+    # Optional per source: "roi": [[[x, y], ...], ...] polygons (pixels or 0-1 fractions)
+    # and "roi_crop": true to detect on the ROI bounding box only
+    DEFAULT_SOURCE_ID = "default"
+    VIDEO_SOURCES = json.loads(os.getenv("VIDEO_SOURCES", "{}")) or {
+        DEFAULT_SOURCE_ID: {"path": str(VIDEO_PATH)}
+    }
+    
+    # Decoding: one thread per source (opencv | pyav)
+    DECODER = os.getenv("DECODER", "opencv")
+    DECODE_THREADS = int(os.getenv("DECODE_THREADS", 0))  # pyav codec threads, 0 = auto
+    DECODE_MAX_WIDTH = int(os.getenv("DECODE_MAX_WIDTH", 0))  # downscale wider frames at decode, 0 = off
+    DECODE_MATCH_FPS = os.getenv("DECODE_MATCH_FPS", "true").lower() == "true"  # skip source frames above target FPS
+    DECODE_HW_ACCELERATION = os.getenv("DECODE_HW_ACCELERATION", "false").lower() == "true"  # opencv only
+    DECODE_QUEUE_SIZE = int(os.getenv("DECODE_QUEUE_SIZE", 2))  # frames decoded ahead of capture
+    DECODE_PROCESS = os.getenv("DECODE_PROCESS", "false").lower() == "true"  # decode in a child process
+    DECODE_RING_SLOTS = int(os.getenv("DECODE_RING_SLOTS", 0))  # shared frame slots per source, 0 = pipeline depth
+    
     # Model settings
     MODEL_PATHS = [
         MODEL_DIR / "yolov8n.pt",
@@ -38,7 +58,26 @@ class Config:
         MODEL_DIR / "yolov8m.pt"
     ]
     VEHICLE_CLASSES = ["car", "truck", "bus", "motorcycle", "bicycle"]
-    
+
+    # Inference backends benchmarked at startup (ultralytics | onnxruntime | openvino)
+    INFERENCE_BACKENDS = [
+        name.strip() for name in os.getenv("INFERENCE_BACKENDS", "ultralytics,onnxruntime,openvino").split(",")
+        if name.strip()
+    ]
+    EXPORT_MISSING_MODELS = os.getenv("EXPORT_MISSING_MODELS", "false").lower() == "true"  # export .pt for CPU backends
+    ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", os.cpu_count() or 1))
+    ONNX_INTER_OP_THREADS = int(os.getenv("ONNX_INTER_OP_THREADS", 1))
+    OPENVINO_NUM_THREADS = int(os.getenv("OPENVINO_NUM_THREADS", 0))  # 0 = OpenVINO default
+
+    # INT8 variants built by src.tools.quantize
+    QUANTIZED_MODELS_MANIFEST = MODEL_DIR / "quantized.json"
+    QUANTIZATION_ACCURACY_BUDGET = float(os.getenv("QUANTIZATION_ACCURACY_BUDGET", 0.05))  # max count agreement loss
+    QUANTIZATION_CALIBRATION_FRAMES = int(os.getenv("QUANTIZATION_CALIBRATION_FRAMES", 64))
+
+    # Device benchmark cache (see --rebenchmark / --rebenchmark-background)
+    BENCHMARK_CACHE_PATH = MODEL_DIR / "benchmark_cache.json"
+    BACKGROUND_REBENCHMARK = os.getenv("BACKGROUND_REBENCHMARK", "false").lower() == "true"
+
     # Detection parameters
     INPUT_SIZE = 640
     CONFIDENCE_THRESHOLD = float(os.getenv("CONFIDENCE", 0.35))
@@ -48,20 +87,88 @@ class Config:
     # Performance settings
     MPS_MEMORY_FRACTION = 0.8
     BATCH_SIZE_GPU = int(os.getenv("BATCH_SIZE_GPU", 2))
-    BATCH_SIZE_CPU = 1
+    BATCH_SIZE_CPU = int(os.getenv("BATCH_SIZE_CPU", 1))
+    BATCH_SIZE_MAX = int(os.getenv("BATCH_SIZE_MAX", 8))
+    ADAPTIVE_BATCHING = os.getenv("ADAPTIVE_BATCHING", "true").lower() == "true"
+    BATCH_LATENCY_BUDGET = float(os.getenv("BATCH_LATENCY_BUDGET", 0.15))  # seconds per batch
     TARGET_FPS = int(os.getenv("FPS", 30))
     STATS_INTERVAL = 5.0
+    PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 2))  # per-stage queue bound
+    IDLE_MODE = os.getenv("IDLE_MODE", "keepalive")  # off | keepalive | stop when nobody is watching
+    IDLE_KEEPALIVE_INTERVAL = float(os.getenv("IDLE_KEEPALIVE_INTERVAL", 5.0))  # seconds between standby detections
+    SCHEDULER_BATCH_WINDOW = float(os.getenv("SCHEDULER_BATCH_WINDOW", 0.005))  # seconds to wait for more sources
+    
+    # Stage executors: worker threads and CPU pinning as lists like "0-3,6" (empty = any core)
+    INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", 1))  # the scheduler runs one batch at a time
+    ENCODE_WORKERS = int(os.getenv("ENCODE_WORKERS", 2))
+    INFERENCE_CPUS = os.getenv("INFERENCE_CPUS", "")
+    ENCODE_CPUS = os.getenv("ENCODE_CPUS", "")
+    DECODE_CPUS = os.getenv("DECODE_CPUS", "")
+    TORCH_THREADS = int(os.getenv("TORCH_THREADS", 0))  # 0 = one per inference CPU, or the torch default
+    INFERENCE_PROCESS = os.getenv("INFERENCE_PROCESS", "false").lower() == "true"  # model in a child process
+    EXECUTOR_STATS_WINDOW = 10.0  # seconds of history for utilization
+    
+    # Tracking: detect every N frames (or on scene motion) and let the tracker carry boxes in between
+    TRACKING = os.getenv("TRACKING", "false").lower() == "true"
+    TRACK_DETECT_INTERVAL = int(os.getenv("TRACK_DETECT_INTERVAL", 3))  # frames between detections
+    TRACK_MOTION_THRESHOLD = float(os.getenv("TRACK_MOTION_THRESHOLD", 0.08))  # mean grey change forcing a detection
+    TRACK_HIGH_CONFIDENCE = 0.5  # detections below this only extend existing tracks
+    TRACK_MATCH_IOU = 0.3
+    TRACK_MAX_AGE = 30  # frames a track survives without a match
+    TRACK_MIN_HITS = 2  # matches before a track is shown
+    
+    # Motion gate: skip inference while nothing moves inside the source's ROI
+    MOTION_GATE = os.getenv("MOTION_GATE", "false").lower() == "true"
+    MOTION_METHOD = os.getenv("MOTION_METHOD", "diff")  # diff (last detected frame) | mog2 (background model)
+    MOTION_MIN_AREA = float(os.getenv("MOTION_MIN_AREA", 0.002))  # changed fraction of ROI pixels counting as motion
+    MOTION_PIXEL_THRESHOLD = int(os.getenv("MOTION_PIXEL_THRESHOLD", 15))  # grey level change per pixel
+    MOTION_MAX_REUSE = int(os.getenv("MOTION_MAX_REUSE", 30))  # static frames before a detection is forced anyway, 0 = never
+    MOTION_SIZE = (160, 90)  # frames are compared at this size
     
     # Encoding settings
     JPEG_QUALITY = int(os.getenv("JPEG_QUALITY", 80))
     
+    # Adaptive quality: ladder rungs from best (first) to cheapest, stepped under load.
+    # Missing input_size / jpeg_quality use the settings above, model None keeps the benchmark winner
+    QUALITY_CONTROL = os.getenv("QUALITY_CONTROL", "false").lower() == "true"
+    QUALITY_LADDER = json.loads(os.getenv("QUALITY_LADDER", "null")) or [
+        {"model": None, "frame_skip": 1},
+        {"input_size": 512, "model": None, "frame_skip": 1},
+        {"input_size": 416, "model": None, "frame_skip": 1, "jpeg_quality": 70},
+        {"input_size": 416, "model": "yolov8n.pt", "frame_skip": 2, "jpeg_quality": 60},
+        {"input_size": 320, "model": "yolov8n.pt", "frame_skip": 3, "jpeg_quality": 50}
+    ]
+    QUALITY_SLO_INFERENCE = float(os.getenv("QUALITY_SLO_INFERENCE", 0.15))  # p95 seconds per batch
+    QUALITY_SLO_ENCODE = float(os.getenv("QUALITY_SLO_ENCODE", 0.03))  # p95 seconds per frame
+    QUALITY_SLO_FPS_RATIO = float(os.getenv("QUALITY_SLO_FPS_RATIO", 0.9))  # min broadcast FPS / target
+    QUALITY_EVAL_INTERVAL = 2.0  # seconds between controller decisions
+    QUALITY_WINDOW = 30  # recent stage samples per decision
+    QUALITY_COOLDOWN = 6.0  # seconds after a change before the next one
+    QUALITY_HEADROOM = 0.6  # step up only below this fraction of the latency SLOs
+    QUALITY_UPGRADE_HOLD = 3  # healthy evaluations in a row before stepping up
+    
     # Logging
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
     LOG_FILE = LOGS_DIR / "vehicle_detection.log"
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text | json (one JSON object per line)
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))  # records waiting for the writer thread, newer ones dropped
+    LOG_AGGREGATE_INTERVAL = float(os.getenv("LOG_AGGREGATE_INTERVAL", 10.0))  # seconds repeated hot-path messages are folded, 0 = off
+    
+    # Tracing: per-frame spans kept in memory and served as Chrome/Perfetto JSON on /trace
+    TRACING = os.getenv("TRACING", "true").lower() == "true"
+    TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 0.1))  # fraction of frames traced end to end
+    TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", 20000))  # spans kept, oldest overwritten first
+    
+    # Profiling: admin endpoints for time-boxed cProfile / torch.profiler / tracemalloc captures
+    PROFILING = os.getenv("PROFILING", "false").lower() == "true"
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")  # required in X-Admin-Token on /admin routes; unset = loopback clients only
+    PROFILE_DEFAULT_SECONDS = float(os.getenv("PROFILE_DEFAULT_SECONDS", 10.0))
+    PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 60.0))
     
     # WebSocket settings
     WS_HEARTBEAT = 30
     WS_TIMEOUT = 60
+    CLIENT_QUEUE_SIZE = int(os.getenv("CLIENT_QUEUE_SIZE", 1))  # frames buffered per client
 
 
 class DevelopmentConfig(Config):
@@ -0,0 +1,96 @@
+"""
+Frame annotation, run only for subscribers that want annotated video
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+from typing import Callable, Dict, Tuple
+import cv2
+import numpy as np
+
+
+class Annotator:
+    """Draws detection boxes and labels onto frames"""
+
+    def __init__(self, get_class_names: Callable[[], Dict[int, str]]):
+        """
+        Args:
+            get_class_names: Returns the current class id to name mapping,
+                read per frame so labels follow a backend switch
+        """
+        self.get_class_names = get_class_names
+
+    def draw_detections(self, frame: np.ndarray, detections: np.ndarray) -> np.ndarray:
+        """
+        Draw detections onto a copy of the frame
+
+        Args:
+            frame: Original frame
+            detections: Structured detections array
+
+        Returns:
+            Annotated frame
+        """
+        output_frame = frame.copy()
+        names = self.get_class_names()
+
+        # Tracked detections carry a trailing track_id column
+        tracked = "track_id" in (detections.dtype.names or ())
+
+        for x1, y1, x2, y2, conf, cls_id, *track in detections.tolist():
+            x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+            label = f"{names.get(cls_id, str(cls_id))}: {conf:.2f}"
+            if tracked:
+                label = f"#{track[0]} {label}"
+
+            # Draw bounding box with confidence-based styling
+            color = self._get_confidence_color(conf)
+            thickness = 3 if conf > 0.7 else 2
+
+            cv2.rectangle(output_frame, (x1, y1), (x2, y2), color, thickness)
+
+            # Draw label with background
+            self._draw_label(output_frame, label, (x1, y1), color)
+
+        return output_frame
+
+    def _get_confidence_color(self, confidence: float) -> Tuple[int, int, int]:
+        """Get color based on confidence level"""
+        if confidence > 0.8:
+            return (0, 255, 0)  # Green for high confidence
+        elif confidence > 0.6:
+            return (0, 255, 255)  # Yellow for medium confidence
+        else:
+            return (0, 165, 255)  # Orange for low confidence
+
+    def _draw_label(
+        self,
+        frame: np.ndarray,
+        label: str,
+        position: Tuple[int, int],
+        color: Tuple[int, int, int]
+    ):
+        """Draw label with background"""
+        x, y = position
+        font_scale = 0.6
+        text_thickness = 2
+
+        # Get text size
+        (text_width, text_height), baseline = cv2.getTextSize(
+            label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, text_thickness
+        )
+
+        # Draw background rectangle
+        cv2.rectangle(
+            frame,
+            (x, y - text_height - baseline - 5),
+            (x + text_width + 5, y),
+            color,
+            -1
+        )
+
+        # Draw text
+        cv2.putText(
+            frame, label, (x + 2, y - 5),
+            cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 0, 0), text_thickness
+        )
@@ -0,0 +1,342 @@
+"""
+Pluggable inference backends
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+import ast
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+import cv2
+import numpy as np
+import torch
+from ultralytics import YOLO
+
+from config.settings import get_config
+from src.utils.logging_config import get_logger
+
+try:
+    import onnxruntime as ort
+except ImportError:  # Optional CPU backend
+    ort = None
+
+try:
+    import openvino as ov
+except ImportError:  # Optional CPU backend
+    ov = None
+
+config = get_config()
+logger = get_logger("backends")
+
+BACKEND_ULTRALYTICS = "ultralytics"
+BACKEND_ONNXRUNTIME = "onnxruntime"
+BACKEND_OPENVINO = "openvino"
+
+
+class UnsupportedDeviceError(ValueError):
+    """Raised when a backend is asked to move to a device it cannot run on"""
+
+
+class InferenceBackend(ABC):
+    """
+    Runs a detection model on a letterboxed batch
+
+    infer() takes a float RGB BCHW tensor in [0, 1] and returns, per
+    image, an (N, 6) float array of [x1, y1, x2, y2, confidence, class_id]
+    in model input coordinates, after NMS.
+    """
+
+    name = "base"
+
+    def __init__(self, model_path: Union[str, Path], device: str = "cpu"):
+        self.model_path = Path(model_path)
+        self.device = device
+        self.names: Dict[int, str] = {}
+
+    @abstractmethod
+    def infer(self, batch: torch.Tensor) -> List[np.ndarray]:
+        """Run one forward pass (plus NMS) over the batch"""
+
+    def to(self, device: str):
+        """Move the model to another device"""
+        if device != self.device:
+            raise UnsupportedDeviceError(f"{self.name} backend only runs on {self.device}")
+
+    @property
+    def model_name(self) -> str:
+        return self.model_path.name
+
+    def describe(self) -> dict:
+        """Backend details for stats endpoints"""
+        return {
+            "backend": self.name,
+            "model": self.model_name,
+            "device": self.device
+        }
+
+
+class UltralyticsBackend(InferenceBackend):
+    """PyTorch inference through ultralytics YOLO.predict"""
+
+    name = BACKEND_ULTRALYTICS
+
+    def __init__(self, model: Union[YOLO, str, Path], device: str = "cpu"):
+        if not isinstance(model, YOLO):
+            model = YOLO(str(model))
+        super().__init__(getattr(model, "ckpt_path", None) or "yolov8n.pt", device)
+        self.model = model
+        self.names = model.names
+        self.model.to(device)
+
+    def infer(self, batch: torch.Tensor) -> List[np.ndarray]:
+        results = self.model.predict(
+            batch,
+            verbose=False,
+            device=self.device,
+            conf=config.CONFIDENCE_THRESHOLD,
+            iou=config.IOU_THRESHOLD,
+            max_det=config.MAX_DETECTIONS,
+            half=False,  # M1 Pro prefers float32
+            augment=False,
+            agnostic_nms=False,
+            retina_masks=False,
+            save=False,
+            stream=False,
+        )
+
+        if self.device == "mps":
+            torch.mps.synchronize()
+
+        # Single device -> host transfer per image: x1, y1, x2, y2, conf, cls
+        return [
+            result.boxes.data.cpu().numpy() if result.boxes is not None else np.empty((0, 6), np.float32)
+            for result in results
+        ]
+
+    def to(self, device: str):
+        self.model.to(device)
+        self.device = device
+
+
+def decode_yolo_output(output: np.ndarray) -> List[np.ndarray]:
+    """
+    Decode raw YOLOv8 head output and apply class-aware NMS
+
+    Args:
+        output: (B, 4 + num_classes, num_anchors) array with cx, cy, w, h boxes
+
+    Returns:
+        Per image (N, 6) arrays of [x1, y1, x2, y2, confidence, class_id]
+    """
+    decoded = []
+    for prediction in output:
+        prediction = prediction.T  # (anchors, 4 + classes)
+        class_scores = prediction[:, 4:]
+        class_ids = class_scores.argmax(axis=1)
+        confidences = class_scores[np.arange(len(class_ids)), class_ids]
+
+        keep = confidences >= config.CONFIDENCE_THRESHOLD
+        if not keep.any():
+            decoded.append(np.empty((0, 6), np.float32))
+            continue
+
+        boxes = prediction[keep, :4]
+        confidences = confidences[keep]
+        class_ids = class_ids[keep]
+
+        # cx, cy, w, h -> x, y, w, h for OpenCV NMS
+        xywh = boxes.copy()
+        xywh[:, :2] -= xywh[:, 2:] / 2
+        indices = cv2.dnn.NMSBoxesBatched(
+            xywh.tolist(), confidences.tolist(), class_ids.tolist(),
+            config.CONFIDENCE_THRESHOLD, config.IOU_THRESHOLD
+        )
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)[:config.MAX_DETECTIONS]
+
+        detections = np.empty((len(indices), 6), np.float32)
+        detections[:, 0:2] = xywh[indices, :2]
+        detections[:, 2:4] = xywh[indices, :2] + xywh[indices, 2:4]
+        detections[:, 4] = confidences[indices]
+        detections[:, 5] = class_ids[indices]
+        decoded.append(detections)
+
+    return decoded
+
+
+def _parse_names(names) -> Dict[int, str]:
+    """Class names from exported model metadata (stored as a dict literal)"""
+    if isinstance(names, str):
+        names = ast.literal_eval(names)
+    return {int(k): v for k, v in (names or {}).items()}
+
+
+class OnnxRuntimeBackend(InferenceBackend):
+    """ONNX Runtime CPU inference on an exported model"""
+
+    name = BACKEND_ONNXRUNTIME
+
+    def __init__(
+        self,
+        model_path: Union[str, Path],
+        intra_op_threads: int = config.ONNX_INTRA_OP_THREADS,
+        inter_op_threads: int = config.ONNX_INTER_OP_THREADS
+    ):
+        if ort is None:
+            raise RuntimeError("onnxruntime is not installed")
+        super().__init__(model_path, "cpu")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        if inter_op_threads:
+            options.inter_op_num_threads = inter_op_threads
+
+        self.session = ort.InferenceSession(
+            str(self.model_path), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # Exports without dynamic=True have a fixed batch dimension of 1
+        self.fixed_batch = model_input.shape[0] if isinstance(model_input.shape[0], int) else None
+
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = _parse_names(metadata.get("names"))
+        self.threads = {"intra_op": intra_op_threads, "inter_op": inter_op_threads}
+
+    def infer(self, batch: torch.Tensor) -> List[np.ndarray]:
+        inputs = batch.cpu().numpy()
+        if self.fixed_batch is None or self.fixed_batch == len(inputs):
+            output = self.session.run(None, {self.input_name: inputs})[0]
+        else:
+            output = np.concatenate([
+                self.session.run(None, {self.input_name: inputs[i:i + 1]})[0]
+                for i in range(len(inputs))
+            ])
+        return decode_yolo_output(output)
+
+    def describe(self) -> dict:
+        info = super().describe()
+        info["threads"] = self.threads
+        info["dynamic_batch"] = self.fixed_batch is None
+        return info
+
+
+class OpenVinoBackend(InferenceBackend):
+    """OpenVINO CPU inference on an exported model"""
+
+    name = BACKEND_OPENVINO
+
+    def __init__(self, model_path: Union[str, Path], num_threads: int = config.OPENVINO_NUM_THREADS):
+        if ov is None:
+            raise RuntimeError("openvino is not installed")
+        super().__init__(model_path, "cpu")
+
+        # Ultralytics exports a directory holding <name>.xml/.bin and metadata.yaml
+        xml_path = self.model_path
+        if xml_path.is_dir():
+            xml_path = next(xml_path.glob("*.xml"))
+
+        core = ov.Core()
+        model = core.read_model(str(xml_path))
+        model.reshape({model.inputs[0]: [-1, 3, -1, -1]})  # Dynamic batch and input size
+
+        compile_config = {"PERFORMANCE_HINT": "LATENCY"}
+        if num_threads:
+            compile_config["INFERENCE_NUM_THREADS"] = num_threads
+        self.compiled = core.compile_model(model, "CPU", compile_config)
+        self.request = self.compiled.create_infer_request()
+
+        self.names = self._load_names(xml_path)
+
+    @staticmethod
+    def _load_names(xml_path: Path) -> Dict[int, str]:
+        metadata = xml_path.parent / "metadata.yaml"
+        if not metadata.exists():
+            return {}
+        import yaml
+        with open(metadata) as f:
+            return _parse_names(yaml.safe_load(f).get("names"))
+
+    def infer(self, batch: torch.Tensor) -> List[np.ndarray]:
+        output = self.request.infer({0: batch.cpu().numpy()})
+        return decode_yolo_output(next(iter(output.values())))
+
+
+def exported_model_path(model_path: Path, backend: str) -> Optional[Path]:
+    """Where ultralytics puts the export of model_path for a backend"""
+    if backend == BACKEND_ONNXRUNTIME:
+        return model_path.with_suffix(".onnx")
+    if backend == BACKEND_OPENVINO:
+        return model_path.parent / f"{model_path.stem}_openvino_model"
+    return model_path
+
+
+def backend_available(backend: str) -> bool:
+    """Whether the runtime for a backend is installed"""
+    if backend == BACKEND_ONNXRUNTIME:
+        return ort is not None
+    if backend == BACKEND_OPENVINO:
+        return ov is not None
+    return backend == BACKEND_ULTRALYTICS
+
+
+def export_model(model_path: Path, backend: str) -> Path:
+    """Export a .pt checkpoint for a CPU backend with a dynamic batch dimension"""
+    export_format = "onnx" if backend == BACKEND_ONNXRUNTIME else "openvino"
+    logger.info(f"📦 Exporting {model_path.name} to {export_format}...")
+    exported = YOLO(str(model_path)).export(
+        format=export_format,
+        imgsz=config.INPUT_SIZE,
+        dynamic=True,
+        half=False
+    )
+    return Path(exported)
+
+
+def create_backend(backend: str, model_path: Path, device: str = "cpu") -> InferenceBackend:
+    """
+    Build a backend for a model checkpoint
+
+    Args:
+        backend: Backend name
+        model_path: Path of the .pt checkpoint (exports are looked up next to it)
+        device: Device for the ultralytics backend
+
+    Returns:
+        Ready-to-use backend
+    """
+    if backend == BACKEND_ULTRALYTICS:
+        return UltralyticsBackend(model_path, device)
+
+    path = exported_model_path(model_path, backend)
+    if not path.exists():
+        if not config.EXPORT_MISSING_MODELS:
+            raise FileNotFoundError(f"No {backend} export for {model_path.name}: {path}")
+        path = export_model(model_path, backend)
+
+    if backend == BACKEND_ONNXRUNTIME:
+        return OnnxRuntimeBackend(path)
+    if backend == BACKEND_OPENVINO:
+        return OpenVinoBackend(path)
+    raise ValueError(f"Unknown backend: {backend}")
+
+
+def load_backend(backend: str, path: Union[str, Path], device: str = "cpu") -> InferenceBackend:
+    """
+    Rebuild a backend from its own model_path, e.g. in another process
+
+    Args:
+        backend: Backend name
+        path: The backend's model_path (checkpoint, .onnx file or OpenVINO export)
+        device: Device for the ultralytics backend
+    """
+    if backend == BACKEND_ULTRALYTICS:
+        return UltralyticsBackend(path, device)
+    if backend == BACKEND_ONNXRUNTIME:
+        return OnnxRuntimeBackend(path)
+    if backend == BACKEND_OPENVINO:
+        return OpenVinoBackend(path)
+    raise ValueError(f"Unknown backend: {backend}")
\ No newline at end of file
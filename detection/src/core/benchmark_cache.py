@@ -0,0 +1,144 @@
+"""
+Persisted device benchmark results
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+import hashlib
+import json
+import os
+import platform
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+import torch
+
+from config.settings import get_config
+from src.utils.logging_config import get_logger
+from src.core.backends import exported_model_path
+
+config = get_config()
+logger = get_logger("benchmark_cache")
+
+CACHE_VERSION = 1
+
+
+def file_hash(path: Path, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 of a model file"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def artifact_hash(path: Path) -> str:
+    """SHA-256 of a model file, or of every file in an export directory"""
+    if path.is_file():
+        return file_hash(path)
+    digest = hashlib.sha256()
+    for child in sorted(p for p in path.rglob("*") if p.is_file()):
+        digest.update(str(child.relative_to(path)).encode("utf-8"))
+        digest.update(file_hash(child).encode("ascii"))
+    return digest.hexdigest()
+
+
+def model_artifacts(model_paths: Iterable[Path], backends: Iterable[str]) -> List[Path]:
+    """Existing files each backend would load for the models, exports included"""
+    artifacts = set()
+    for path in model_paths:
+        for artifact in [path] + [exported_model_path(path, backend) for backend in backends]:
+            if artifact.exists():
+                artifacts.add(artifact)
+    return sorted(artifacts)
+
+
+def _package_version(name: str) -> Optional[str]:
+    try:
+        module = __import__(name)
+    except ImportError:
+        return None
+    return getattr(module, "__version__", "unknown")
+
+
+def host_fingerprint() -> dict:
+    """Hardware and software that benchmark results depend on"""
+    return {
+        "system": platform.system(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "mps": torch.backends.mps.is_available(),
+        "cuda": torch.cuda.get_device_name(0) if torch.cuda.is_available() else None,
+        "versions": {
+            name: _package_version(name)
+            for name in ("torch", "ultralytics", "onnxruntime", "openvino")
+        }
+    }
+
+
+class BenchmarkCache:
+    """
+    Benchmark winners on disk, keyed by everything that affects the result
+
+    The key covers the host fingerprint, library versions, the hash of
+    every file the backends load (checkpoints, quantized models and their
+    ONNX/OpenVINO exports), the input size and the backend list, so any
+    change there simply misses the cache and triggers a new benchmark.
+    """
+
+    def __init__(self, path: Path = config.BENCHMARK_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def key(self, model_paths: Iterable[Path]) -> str:
+        """Cache key for the current host and candidate models"""
+        backends = sorted(config.INFERENCE_BACKENDS)
+        material = {
+            "version": CACHE_VERSION,
+            "host": host_fingerprint(),
+            "models": {str(path.name): artifact_hash(path) for path in model_artifacts(model_paths, backends)},
+            "input_size": config.INPUT_SIZE,
+            "backends": backends,
+            "accuracy_budget": config.QUANTIZATION_ACCURACY_BUDGET
+        }
+        encoded = json.dumps(material, sort_keys=True).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def _load(self) -> Dict[str, dict]:
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️  Ignoring unreadable benchmark cache {self.path}: {e}")
+            return {}
+
+    def get(self, key: str) -> Optional[dict]:
+        """Cached entry for a key, if any"""
+        with self._lock:
+            return self._load().get(key)
+
+    def put(self, key: str, winner: dict, results: List[dict]):
+        """Store the winner and full results for a key"""
+        with self._lock:
+            entries = self._load()
+            entries[key] = {
+                "winner": winner,
+                "results": results,
+                "created_at": time.time()
+            }
+            # Write then rename so a crash never leaves a truncated cache
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(entries, f, indent=2)
+            os.replace(tmp_path, self.path)
+        logger.info(f"💾 Benchmark results cached in {self.path.name}")
+
+    def clear(self):
+        """Drop every cached entry"""
+        with self._lock:
+            if self.path.exists():
+                self.path.unlink()
\ No newline at end of file
@@ -5,85 +5,166 @@ Date: 2025-06-17
 """
 
 import asyncio
-import base64
-import json
 import time
-from typing import List, Tuple, Optional, Set
-import cv2
+from typing import Dict, List, Tuple, Optional, Set, Union
 import numpy as np
 
 from config.settings import get_config
 from src.utils.logging_config import get_logger
 from src.utils.helpers import async_timer, PerformanceTracker
-from src.core.detector import VehicleDetector
+from src.utils.tracing import TRACER
+from src.core.detector import DETECTION_DTYPE, VehicleDetector
+from src.core.pipeline import PipelineStage
+from src.core.protocol import PROTOCOL_BINARY, PROTOCOL_JSON, VIEWS
+from src.core.annotator import Annotator
+from src.core.frame_cache import EncodedFrameCache, StreamOptions
+from src.core.clients import ClientSession
+from src.core.tracker import VehicleTracker
+from src.core.motion import MotionGate, RegionOfInterest
+from src.core.decoder import DecodeProcess, DecodeThread, create_decoder
+from src.core.executors import STAGE_ENCODE, get_executor, run_inference
 
 config = get_config()
 logger = get_logger("broadcaster")
 
+# What inference_stage does with each captured frame
+FRAME_DETECT = "detect"  # Run the detector
+FRAME_TRACK = "track"  # Propagate tracked boxes
+FRAME_REUSE = "reuse"  # Repeat the previous detections
+
 
 class VideoBroadcaster:
     """Handles video streaming and broadcasting to WebSocket clients"""
     
-    def __init__(self, video_path: str, detector: VehicleDetector, device: str):
+    def __init__(
+        self,
+        video_path: Union[str, int],
+        detector: VehicleDetector,
+        device: str,
+        source_id: str = config.DEFAULT_SOURCE_ID,
+        target_fps: Optional[int] = None,
+        scheduler=None,
+        roi: Optional[List] = None,
+        roi_crop: bool = False
+    ):
         self.video_path = video_path
         self.detector = detector
         self.device = device
+        self.source_id = source_id
+        self._target_fps = target_fps
+        
+        # Shared inference scheduler (None = call the detector directly)
+        self.scheduler = scheduler
         
-        # Video capture setup
-        self.cap = cv2.VideoCapture(str(video_path))
-        if not self.cap.isOpened():
-            raise RuntimeError(f"Failed to open video: {video_path}")
+        # Video capture setup: decoding runs on its own thread, or in a process
+        # writing into a shared frame ring
+        capture_arg = video_path if isinstance(video_path, int) else str(video_path)
+        self.decoder = create_decoder(capture_arg)
+        reader_class = DecodeProcess if config.DECODE_PROCESS else DecodeThread
+        self.reader = reader_class(self.decoder, self._decode_stride(), source_id=source_id)
         
         self._configure_capture()
         
         # State management
         self.vehicle_count = 0
         self.latest_frame = None
+        self.latest_detections = np.empty(0, dtype=DETECTION_DTYPE)
         self.frame_count = 0
         self.is_running = False
         
-        # Batching for GPU optimization
-        self.batch_size = config.BATCH_SIZE_GPU if device == "mps" else config.BATCH_SIZE_CPU
-        self.frame_buffer = []
+        # Pipeline stages, each fed by a bounded drop-oldest queue
+        self.stages: Dict[str, PipelineStage] = {
+            "capture": PipelineStage("capture", source_id=source_id),
+            "inference": PipelineStage("inference", config.PIPELINE_QUEUE_SIZE, source_id),
+            "encode": PipelineStage("encode", config.PIPELINE_QUEUE_SIZE, source_id),
+            "fanout": PipelineStage("fanout", config.PIPELINE_QUEUE_SIZE, source_id)
+        }
         
         # Client management
         self.clients: Set = set()
+        self.sessions: Dict[object, ClientSession] = {}
+        self.total_connections = 0
+        self.closed_client_drops = 0  # Frames dropped by clients that have left
+        
+        # Encoded variants of the current frame
+        self.annotator = Annotator(lambda: self.detector.class_names)
+        self.frame_cache = EncodedFrameCache(self.annotator.draw_detections, lambda: self.detector.class_names)
         self.lock = asyncio.Lock()
         
+        # Set by the quality controller: detect every Nth frame, reuse boxes in between
+        self.frame_skip = 1
+        self.skipped_frames = 0
+        
+        # Persistent vehicle ids, and boxes carried between detections
+        self.tracker: Optional[VehicleTracker] = VehicleTracker() if config.TRACKING else None
+        
+        # Region of interest, and the motion gate skipping inference on static frames
+        self.roi: Optional[RegionOfInterest] = RegionOfInterest(roi) if roi else None
+        self.roi_crop = roi_crop and self.roi is not None
+        self.motion_gate: Optional[MotionGate] = MotionGate(self.roi) if config.MOTION_GATE else None
+        
+        # Idle mode: skip capture and inference while nobody is watching
+        self.analytics_consumers = 0
+        self.idle_since: Optional[float] = None
+        self.idle_time_total = 0.0
+        self.keepalive_frames = 0
+        self._wakeup = asyncio.Event()
+        
         # Performance tracking
         self.broadcast_tracker = PerformanceTracker()
         
         # Task management
         self.broadcast_task: Optional[asyncio.Task] = None
         
-        logger.info(f"🎥 Broadcaster initialized: {video_path}")
+        logger.info(f"🎥 Broadcaster initialized [{source_id}]: {video_path}")
         logger.info(f"📊 Batch size: {self.batch_size}")
     
+    @property
+    def batch_size(self) -> int:
+        """Current inference batch size for this source"""
+        if self.scheduler:
+            return self.scheduler.source_batch_size()
+        return self.detector.batch_size
+    
+    @property
+    def target_fps(self) -> int:
+        """Per-source FPS target, falling back to the global setting"""
+        return self._target_fps or config.TARGET_FPS
+    
+    def _decode_stride(self) -> int:
+        """Source frames per delivered frame when the source runs faster than the target FPS"""
+        if not config.DECODE_MATCH_FPS or self.decoder.fps <= 0:
+            return 1
+        return max(1, round(self.decoder.fps / self.target_fps))
+    
     def _configure_capture(self):
-        """Configure video capture for optimal performance"""
-        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-        
-        # Get video properties
-        fps = self.cap.get(cv2.CAP_PROP_FPS)
-        frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        
-        logger.info(f"📹 Video properties: {width}x{height}, {fps:.1f}fps, {frame_count} frames")
+        """Log video properties and decoder setup"""
+        decoder = self.decoder
+        logger.info(
+            f"📹 Video properties: {decoder.width}x{decoder.height}, {decoder.fps:.1f}fps, {decoder.frame_count} frames"
+        )
+        output_size = decoder.output_size
+        logger.info(
+            f"🎞️  Decoder: {decoder.name}, every {self.reader.stride} frame(s)"
+            + (f", scaled to {output_size[0]}x{output_size[1]}" if output_size else "")
+        )
     
     @async_timer
     async def read_frame(self) -> Tuple[bool, Optional[np.ndarray]]:
         """
-        Async frame reading to avoid blocking
+        Next frame from the decode thread
         
         Returns:
             Tuple of (success, frame)
         """
-        loop = asyncio.get_event_loop()
-        ret, frame = await loop.run_in_executor(None, self.cap.read)
-        return ret, frame
+        return await self.reader.read()
     
-    async def process_frame_batch(self, frames: List[np.ndarray]) -> Tuple[List[np.ndarray], List[int]]:
+    def seek(self, frame_number: int):
+        """Restart capture at a source frame"""
+        self.reader.seek(frame_number)
+        self.frame_count = frame_number
+    
+    async def process_frame_batch(self, frames: List[np.ndarray]) -> List[np.ndarray]:
         """
         Process a batch of frames
         
@@ -91,30 +172,34 @@ class VideoBroadcaster:
             frames: List of frames to process
             
         Returns:
-            Tuple of (processed_frames, vehicle_counts)
+            Structured detections array per frame
         """
-        # Run detection in thread pool for CPU-bound work
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, self.detector.detect_vehicles, frames)
-    
-    @async_timer
-    async def broadcast_frame(self):
-        """Broadcast current frame to all connected clients"""
-        if not self.clients or self.latest_frame is None:
-            return
+        # Share the model with other sources through the scheduler
+        if self.scheduler:
+            return await self.scheduler.submit(self.source_id, frames)
         
-        # Encode frame
-        encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), config.JPEG_QUALITY]
-        _, buffer = cv2.imencode('.jpg', self.latest_frame, encode_params)
-        image_base64 = base64.b64encode(buffer).decode('utf-8')
+        # Run detection on the inference executor
+        return await run_inference(self.detector, frames)
+    
+    def frame_metadata(self, frame: np.ndarray, vehicle_count: int, frame_id: int) -> dict:
+        """
+        Build the per-frame metadata shared by every protocol
         
-        # Create message
-        message = json.dumps({
-            "image": image_base64,
-            "vehicleCount": self.vehicle_count,
+        Args:
+            frame: Raw frame
+            vehicle_count: Vehicles detected in the frame
+            frame_id: Capture sequence number of the frame
+            
+        Returns:
+            Metadata dictionary
+        """
+        return {
+            "vehicleCount": vehicle_count,
             "timestamp": time.time(),
             "device": self.device,
-            "frameCount": self.frame_count,
+            "source": self.source_id,
+            "frameCount": frame_id,
+            "frameSize": [frame.shape[1], frame.shape[0]],
             "performance": {
                 "avgDetectionTime": self.detector.avg_detection_time,
                 "detectionFps": self.detector.detection_fps,
@@ -125,112 +210,274 @@ class VideoBroadcaster:
                 "clients": len(self.clients),
                 "m1ProOptimized": True
             }
-        })
+        }
+    
+    def set_quality(self, frame_skip: int, jpeg_quality: int):
+        """
+        Apply a quality level chosen by the quality controller
+        
+        Args:
+            frame_skip: Run detection on every Nth frame
+            jpeg_quality: JPEG quality for clients that did not pick one
+        """
+        self.frame_skip = max(1, frame_skip)
+        self.frame_cache.default_quality = jpeg_quality
+    
+    def plan_frame(self, frame_id: int, frame: np.ndarray) -> str:
+        """
+        Decide how a frame gets its detections
         
-        # Broadcast to all clients
-        await self._send_to_all_clients(message)
+        Frames without motion inside the ROI since the last detected frame
+        reuse the previous detections, up to the gate's max_reuse frames.
+        Otherwise the tracker (or, without it, the quality controller's
+        frame skip) picks the frames that go to the detector.
+        
+        Must be called once per frame, in capture order.
+        """
+        if self.motion_gate:
+            if self.motion_gate.has_motion(frame):
+                action = self._plan_moving(frame_id, frame)
+            else:
+                action = FRAME_DETECT if self.motion_gate.refresh_due() else FRAME_REUSE
+            if action == FRAME_DETECT:
+                self.motion_gate.mark_detected()
+            return action
+        return self._plan_moving(frame_id, frame)
     
-    async def _send_to_all_clients(self, message: str):
-        """Send message to all connected clients"""
-        if not self.clients:
-            return
+    def _plan_moving(self, frame_id: int, frame: np.ndarray) -> str:
+        """Detect or carry boxes for a frame the motion gate let through"""
+        if self.tracker:
+            return FRAME_DETECT if self.tracker.needs_detection(frame, self.frame_skip) else FRAME_TRACK
+        return FRAME_DETECT if frame_id % self.frame_skip == 0 else FRAME_REUSE
+    
+    def _send_to_all_clients(self, messages: Dict[StreamOptions, Union[str, bytes]], frame_id: Optional[int] = None):
+        """Queue each client the message for its stream options without waiting"""
+        for session in list(self.sessions.values()):
+            message = messages.get(session.options)
+            if message is not None:
+                session.offer(message, frame_id)
+    
+    async def capture_stage(self):
+        """Read frames at the target FPS and hand them to inference"""
+        stage = self.stages["capture"]
+        output = self.stages["inference"].input_queue
         
-        async with self.lock:
-            disconnected = set()
+        while self.is_running:
+            # Nobody watching: park until a subscriber arrives or a keepalive is due
+            if self.is_idle:
+                await self._wait_while_idle()
+                if not self.is_running:
+                    break
+            elif self.idle_since is not None:
+                # A subscriber arrived during a keepalive frame
+                self._leave_idle()
             
-            # Send to all clients concurrently
-            send_tasks = []
-            for client in self.clients:
-                task = asyncio.create_task(self._send_to_client(client, message))
-                send_tasks.append((client, task))
+            stage_start = time.time()
             
-            # Wait for all sends to complete
-            for client, task in send_tasks:
-                try:
-                    await task
-                except Exception as e:
-                    logger.warning(f"🔌 Client send failed: {e}")
-                    disconnected.add(client)
+            # Read frame
+            ret, frame = await self.read_frame()
+            if not ret:
+                continue  # Files loop in the decode thread; streams retry
+            
+            self.frame_count += 1
+            output.put_nowait((self.frame_count, frame))
+            
+            # The decode span is only known per frame id once the frame is numbered
+            if TRACER.sampled(self.frame_count) and self.reader.last_span:
+                start, end, pid, tid = self.reader.last_span
+                TRACER.add("decode", start, end, self.source_id, self.frame_count, pid=pid, tid=tid)
             
-            # Remove disconnected clients
-            if disconnected:
-                self.clients -= disconnected
-                logger.info(f"🔌 Removed {len(disconnected)} disconnected clients")
+            service_time = time.time() - stage_start
+            stage.record(service_time)
+            
+            # Frame rate control
+            actual_delay = 1.0 / self.target_fps - service_time
+            if actual_delay > 0:
+                await asyncio.sleep(actual_delay)
+    
+    @property
+    def is_idle(self) -> bool:
+        """True when there are no subscribers or analytics consumers"""
+        return (
+            config.IDLE_MODE != "off"
+            and not self.clients
+            and not self.analytics_consumers
+        )
     
-    async def _send_to_client(self, client, message: str):
-        """Send message to a single client"""
+    async def _wait_while_idle(self):
+        """Block capture while idle, waking on a subscriber or keepalive timeout"""
+        if self.idle_since is None:
+            self.idle_since = time.time()
+            if self.scheduler:
+                self.scheduler.set_source_idle(self.source_id, True)
+            logger.info(f"💤 No subscribers, entering idle mode [{self.source_id}]")
+        
+        self._wakeup.clear()
+        timeout = config.IDLE_KEEPALIVE_INTERVAL if config.IDLE_MODE == "keepalive" else None
         try:
-            await client.send_str(message)
-        except Exception as e:
-            logger.debug(f"Failed to send to client: {e}")
-            raise
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            # Low-rate standby detection keeps the model warm
+            self.keepalive_frames += 1
+            return
+        
+        self._leave_idle()
+    
+    def _leave_idle(self):
+        """Account idle time and rejoin scheduling"""
+        if self.idle_since is None:
+            return
+        self.idle_time_total += time.time() - self.idle_since
+        self.idle_since = None
+        if self.scheduler:
+            self.scheduler.set_source_idle(self.source_id, False)
+        logger.info(f"⚡ Subscriber connected, resuming full rate [{self.source_id}]")
+    
+    def add_analytics_consumer(self):
+        """Register a non-WebSocket consumer that needs live detections"""
+        self.analytics_consumers += 1
+        self._wakeup.set()
+    
+    def remove_analytics_consumer(self):
+        """Unregister an analytics consumer"""
+        self.analytics_consumers = max(0, self.analytics_consumers - 1)
+    
+    async def inference_stage(self):
+        """Batch captured frames and run detection"""
+        stage = self.stages["inference"]
+        output = self.stages["encode"].input_queue
+        last_detections = self.latest_detections
+        
+        while self.is_running:
+            # Wait for the first frame, then fill the batch for up to one frame interval
+            batch = [await stage.input_queue.get()]
+            deadline = time.time() + 1.0 / self.target_fps
+            while len(batch) < self.batch_size:
+                item = await stage.input_queue.get_with_timeout(deadline - time.time())
+                if item is None:
+                    break
+                batch.append(item)
+            
+            # Only some frames are detected, the rest reuse or propagate boxes
+            plan = [self.plan_frame(frame_id, frame) for frame_id, frame in batch]
+            detect = [item for item, action in zip(batch, plan) if action == FRAME_DETECT]
+            results = {}
+            if detect:
+                inputs = [self.roi.crop(frame) if self.roi_crop else frame for _, frame in detect]
+                stage_start = time.time()
+                detections_list = await self.process_frame_batch(inputs)
+                stage_end = time.time()
+                stage.record(stage_end - stage_start, len(detect))
+                for frame_id, _ in detect:
+                    if TRACER.sampled(frame_id):
+                        TRACER.add("infer", stage_start, stage_end, self.source_id, frame_id, args={"batch": len(detect)})
+                if self.roi:
+                    detections_list = [self.roi.to_frame(d, self.roi_crop) for d in detections_list]
+                results = {frame_id: detections for (frame_id, _), detections in zip(detect, detections_list)}
+            
+            for (frame_id, frame), action in zip(batch, plan):
+                if action == FRAME_DETECT:
+                    detections = self.tracker.update(results[frame_id]) if self.tracker else results[frame_id]
+                elif action == FRAME_TRACK:
+                    detections = self.tracker.propagate()
+                else:
+                    detections = last_detections
+                if action != FRAME_DETECT:
+                    self.skipped_frames += 1
+                last_detections = detections
+                output.put_nowait((frame_id, frame, detections))
+    
+    async def encode_stage(self):
+        """Annotate (on demand) and encode frames into client messages"""
+        stage = self.stages["encode"]
+        output = self.stages["fanout"].input_queue
+        executor = get_executor(STAGE_ENCODE)
+        
+        while self.is_running:
+            frame_id, frame, detections = await stage.input_queue.get()
+            self.latest_frame = frame
+            self.latest_detections = detections
+            self.vehicle_count = len(detections)
+            
+            # Nothing to encode without an audience
+            if not self.clients:
+                continue
+            
+            # Encode each requested variant once, shared by all its subscribers
+            stage_start = time.time()
+            self.frame_cache.set_frame(
+                frame_id, frame, detections, self.frame_metadata(frame, len(detections), frame_id)
+            )
+            messages = await executor.run(
+                self.frame_cache.get_many, [session.options for session in self.sessions.values()]
+            )
+            stage_end = time.time()
+            stage.record(stage_end - stage_start)
+            if TRACER.sampled(frame_id):
+                TRACER.add("encode", stage_start, stage_end, self.source_id, frame_id, args={"variants": len(messages)})
+            output.put_nowait((frame_id, messages))
+    
+    async def fanout_stage(self):
+        """Send encoded messages to all connected clients"""
+        stage = self.stages["fanout"]
+        last_sent = None
+        
+        while self.is_running:
+            frame_id, messages = await stage.input_queue.get()
+            
+            stage_start = time.time()
+            self._send_to_all_clients(messages, frame_id)
+            stage.record(time.time() - stage_start)
+            
+            # Track broadcast performance as the interval between sends
+            now = time.time()
+            if last_sent is not None:
+                self.broadcast_tracker.add_sample(now - last_sent)
+            last_sent = now
     
     async def broadcast_loop(self):
-        """Main broadcasting loop"""
-        logger.info("🚀 Starting broadcast loop")
+        """Main broadcasting loop: runs all pipeline stages concurrently"""
+        logger.info(f"🚀 Starting broadcast loop [{self.source_id}]")
         self.is_running = True
-        last_stats = time.time()
+        
+        stage_tasks = [
+            asyncio.create_task(self.capture_stage()),
+            asyncio.create_task(self.inference_stage()),
+            asyncio.create_task(self.encode_stage()),
+            asyncio.create_task(self.fanout_stage())
+        ]
         
         try:
             while self.is_running:
-                loop_start = time.time()
+                done, _ = await asyncio.wait(stage_tasks, timeout=config.STATS_INTERVAL)
                 
-                # Read frame
-                ret, frame = await self.read_frame()
-                if not ret:
-                    # Loop video
-                    logger.debug("📹 Looping video")
-                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                    continue
-                
-                self.frame_count += 1
-                
-                # Handle batching for GPU optimization
-                if self.device == "mps" and len(self.frame_buffer) < self.batch_size:
-                    self.frame_buffer.append(frame)
-                    if len(self.frame_buffer) < self.batch_size:
-                        continue
-                    
-                    # Process batch
-                    processed_frames, counts = await self.process_frame_batch(self.frame_buffer)
-                    self.latest_frame = processed_frames[-1]
-                    self.vehicle_count = counts[-1]
-                    self.frame_buffer = []
-                else:
-                    # Single frame processing
-                    processed_frames, counts = await self.process_frame_batch([frame])
-                    self.latest_frame = processed_frames[0]
-                    self.vehicle_count = counts[0]
-                
-                # Broadcast to clients
-                await self.broadcast_frame()
-                
-                # Track broadcast performance
-                loop_time = time.time() - loop_start
-                self.broadcast_tracker.add_sample(loop_time)
+                # A stage failing stops the whole pipeline
+                for task in done:
+                    if task.exception():
+                        raise task.exception()
+                if done:
+                    break
                 
                 # Print stats periodically
-                if time.time() - last_stats > config.STATS_INTERVAL:
-                    await self.print_stats()
-                    last_stats = time.time()
-                
-                # Frame rate control
-                target_delay = 1.0 / config.TARGET_FPS
-                actual_delay = max(0, target_delay - loop_time)
-                if actual_delay > 0:
-                    await asyncio.sleep(actual_delay)
+                await self.print_stats()
                 
         except Exception as e:
             logger.error(f"🚨 Broadcast loop error: {e}")
         finally:
             self.is_running = False
+            for task in stage_tasks:
+                task.cancel()
+            await asyncio.gather(*stage_tasks, return_exceptions=True)
+            for stage in self.stages.values():
+                if stage.input_queue:
+                    stage.input_queue.clear()
             logger.info("🛑 Broadcast loop stopped")
     
     async def print_stats(self):
         """Print performance statistics"""
         detection_stats = self.detector.get_performance_stats()
         
-        logger.info("📊 Performance Stats:")
+        logger.info(f"📊 Performance Stats [{self.source_id}]:")
         logger.info(f"   Device: {self.device.upper()}")
         logger.info(f"   Frames processed: {self.frame_count}")
         logger.info(f"   Current vehicles: {self.vehicle_count}")
@@ -240,19 +487,32 @@ class VideoBroadcaster:
         logger.info(f"   Avg detection time: {detection_stats.get('avg_time', 0):.3f}s")
         logger.info(f"   Avg vehicles/frame: {detection_stats.get('avg_count', 0):.1f}")
     
-    def add_client(self, websocket):
+    def add_client(self, websocket, options: Optional[StreamOptions] = None):
         """Add WebSocket client"""
+        options = options or StreamOptions()
+        session = ClientSession(websocket, options, on_disconnect=self.remove_client, source_id=self.source_id)
         self.clients.add(websocket)
-        logger.info(f"🔌 Client connected (total: {len(self.clients)})")
+        self.sessions[websocket] = session
+        self.total_connections += 1
+        session.start()
+        self._wakeup.set()
+        logger.info(f"🔌 Client connected [{options.format}] (total: {len(self.clients)})")
     
     def remove_client(self, websocket):
         """Remove WebSocket client"""
+        if websocket not in self.clients:
+            return
         self.clients.discard(websocket)
+        session = self.sessions.pop(websocket, None)
+        if session:
+            session.stop()
+            self.closed_client_drops += session.frames_dropped
         logger.info(f"🔌 Client disconnected (total: {len(self.clients)})")
     
     def start(self):
         """Start broadcasting"""
         if self.broadcast_task is None or self.broadcast_task.done():
+            self.reader.start()
             self.broadcast_task = asyncio.create_task(self.broadcast_loop())
             logger.info("▶️  Broadcasting started")
     
@@ -271,15 +531,14 @@ class VideoBroadcaster:
         # Close all client connections
         async with self.lock:
             for client in list(self.clients):
+                self.remove_client(client)
                 try:
                     await client.close(code=1000, message="Server shutdown")
                 except:
                     pass
-            self.clients.clear()
         
-        # Release video capture
-        if self.cap:
-            self.cap.release()
+        # Stop decoding and release the source
+        self.reader.stop()
         
         logger.info("✅ Broadcaster stopped")
     
@@ -290,25 +549,56 @@ class VideoBroadcaster:
         
         return {
             "video": {
+                "source_id": self.source_id,
                 "path": str(self.video_path),
                 "frame_count": self.frame_count,
                 "current_vehicles": self.vehicle_count,
+                "skipped_frames": self.skipped_frames,
+                "decoder": self.reader.get_stats(),
                 "is_running": self.is_running
             },
+            "idle": {
+                "mode": config.IDLE_MODE,
+                "is_idle": self.idle_since is not None,
+                "analytics_consumers": self.analytics_consumers,
+                "idle_time_total": self.idle_time_total + (
+                    time.time() - self.idle_since if self.idle_since is not None else 0.0
+                ),
+                "keepalive_frames": self.keepalive_frames
+            },
             "clients": {
                 "connected": len(self.clients),
-                "total_connected": len(self.clients)  # Could track historical
+                "protocols": {
+                    protocol: sum(1 for s in self.sessions.values() if s.options.format == protocol)
+                    for protocol in (PROTOCOL_JSON, PROTOCOL_BINARY)
+                },
+                "views": {
+                    view: sum(1 for s in self.sessions.values() if s.options.view == view)
+                    for view in VIEWS
+                },
+                "variants": len({s.options for s in self.sessions.values()}),
+                "frames_dropped": sum(s.frames_dropped for s in self.sessions.values()),
+                "total_connected": self.total_connections
             },
             "performance": {
                 "detection": detection_stats,
                 "broadcast": broadcast_stats,
                 "device": self.device,
-                "batch_size": self.batch_size
+                "batch_size": self.batch_size,
+                "frame_cache": self.frame_cache.get_stats(),
+                "tracking": self.tracker.get_stats() if self.tracker else None,
+                "motion": self.motion_gate.get_stats() if self.motion_gate else None,
+                "pipeline": {
+                    name: stage.get_stats() for name, stage in self.stages.items()
+                }
             },
             "configuration": {
-                "target_fps": config.TARGET_FPS,
-                "jpeg_quality": config.JPEG_QUALITY,
-                "input_size": config.INPUT_SIZE,
+                "target_fps": self.target_fps,
+                "jpeg_quality": self.frame_cache.default_quality,
+                "input_size": self.detector.input_size,
+                "frame_skip": self.frame_skip,
+                "roi": self.roi.get_stats() if self.roi else None,
+                "roi_crop": self.roi_crop,
                 "confidence_threshold": config.CONFIDENCE_THRESHOLD
             }
         }
\ No newline at end of file
@@ -0,0 +1,116 @@
+"""
+Per-client streaming sessions
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+import asyncio
+import itertools
+import time
+from typing import Callable, Optional, Union
+
+from config.settings import get_config
+from src.utils.logging_config import AGGREGATE, get_logger
+from src.core.pipeline import DropOldestQueue
+from src.core.frame_cache import StreamOptions
+from src.utils.metrics import SOURCE_STAGE_SECONDS
+from src.utils.tracing import TRACER
+
+config = get_config()
+logger = get_logger("clients")
+
+_client_ids = itertools.count(1)
+
+
+class ClientSession:
+    """A subscriber with its own bounded send queue and writer task"""
+
+    def __init__(
+        self,
+        websocket,
+        options: StreamOptions,
+        on_disconnect: Optional[Callable] = None,
+        source_id: str = config.DEFAULT_SOURCE_ID
+    ):
+        self.websocket = websocket
+        self.options = options
+        self.on_disconnect = on_disconnect
+        self.source_id = source_id
+        self.client_id = next(_client_ids)
+        self.send_latency = SOURCE_STAGE_SECONDS.labels(source_id, "send")
+
+        # Keeps only the newest frames: slow clients skip instead of blocking
+        self.queue = DropOldestQueue(config.CLIENT_QUEUE_SIZE)
+        self.connected_at = time.time()
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.last_send_time = 0.0
+
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def frames_dropped(self) -> int:
+        """Frames replaced before the client could take them"""
+        return self.queue.dropped
+
+    def start(self):
+        """Start the writer task"""
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.writer())
+
+    def stop(self):
+        """Stop the writer task"""
+        if self.task and not self.task.done():
+            self.task.cancel()
+        self.queue.clear()
+
+    def offer(self, message: Union[str, bytes], frame_id: Optional[int] = None):
+        """Queue a message without waiting for the client"""
+        self.queue.put_nowait((frame_id, message))
+
+    async def writer(self):
+        """Send queued messages to the client one at a time"""
+        try:
+            while True:
+                frame_id, message = await self.queue.get()
+
+                send_start = time.time()
+                if isinstance(message, bytes):
+                    await self.websocket.send_bytes(message)
+                else:
+                    await self.websocket.send_str(message)
+                send_end = time.time()
+                self.last_send_time = send_end - send_start
+                self.send_latency.observe(self.last_send_time)
+                if frame_id is not None and TRACER.sampled(frame_id):
+                    TRACER.add(
+                        "send", send_start, send_end, self.source_id, frame_id,
+                        args={"client": self.client_id, "bytes": len(message)}
+                    )
+
+                self.frames_sent += 1
+                self.bytes_sent += len(message)
+
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.warning(f"🔌 Client send failed: {e}", extra=AGGREGATE)
+            if self.on_disconnect:
+                self.on_disconnect(self.websocket)
+
+    def get_stats(self) -> dict:
+        """Get client statistics"""
+        return {
+            "client_id": self.client_id,
+            "address": str(self.websocket),
+            "connected_at": self.connected_at,
+            "format": self.options.format,
+            "view": self.options.view,
+            "quality": self.options.quality or config.JPEG_QUALITY,
+            "width": self.options.width,
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "bytes_sent": self.bytes_sent,
+            "backlog": self.queue.qsize(),
+            "last_send_time": self.last_send_time
+        }
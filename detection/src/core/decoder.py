@@ -0,0 +1,546 @@
+"""
+Video decoding on a dedicated thread, with decoder-side frame skipping and downscaling
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+import asyncio
+import multiprocessing as mp
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Optional, Tuple, Union
+import cv2
+import numpy as np
+
+from config.settings import get_config
+from src.utils.logging_config import AGGREGATE, get_logger
+from src.utils.metrics import SOURCE_STAGE_SECONDS
+from src.core.executors import parse_cpus, pin_current_thread
+from src.core.shared_ring import SharedFrameRing
+
+try:
+    import av
+except ImportError:  # Optional FFmpeg decoder
+    av = None
+
+config = get_config()
+logger = get_logger("decoder")
+
+DECODER_OPENCV = "opencv"
+DECODER_PYAV = "pyav"
+DECODERS = (DECODER_OPENCV, DECODER_PYAV)
+
+
+def is_live_source(source: Union[str, int]) -> bool:
+    """Cameras and network streams cannot be rewound"""
+    return isinstance(source, int) or "://" in str(source)
+
+
+def scaled_size(width: int, height: int, max_width: int) -> Optional[Tuple[int, int]]:
+    """Output size for frames wider than max_width (None = keep, 0 = off)"""
+    if not max_width or width <= max_width:
+        return None
+    return max_width, int(round(height * max_width / width / 2)) * 2
+
+
+class VideoDecoder(ABC):
+    """Source of BGR frames that can skip frames without converting them"""
+
+    name: str = ""
+
+    def __init__(self, source: Union[str, int], max_width: int = 0):
+        self.source = source
+        self.max_width = max_width
+        self.fps = 0.0
+        self.frame_count = 0
+        self.width = 0
+        self.height = 0
+
+    @property
+    def output_size(self) -> Optional[Tuple[int, int]]:
+        return scaled_size(self.width, self.height, self.max_width)
+
+    @abstractmethod
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        """Decode and convert the next frame"""
+
+    @abstractmethod
+    def skip(self, frames: int) -> bool:
+        """Advance past frames without producing images; False at end of stream"""
+
+    @abstractmethod
+    def seek(self, frame_number: int):
+        """Jump to a frame (files only)"""
+
+    @abstractmethod
+    def release(self):
+        """Close the source"""
+
+    def describe(self) -> dict:
+        size = self.output_size
+        return {
+            "decoder": self.name,
+            "source_fps": self.fps,
+            "frame_count": self.frame_count,
+            "source_size": [self.width, self.height],
+            "output_size": list(size) if size else [self.width, self.height]
+        }
+
+
+class OpenCVDecoder(VideoDecoder):
+    """cv2.VideoCapture, skipping with grab() and converting only retrieved frames"""
+
+    name = DECODER_OPENCV
+
+    def __init__(self, source: Union[str, int], max_width: int = 0, hw_acceleration: bool = False):
+        super().__init__(source, max_width)
+        params = [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY] if hw_acceleration else []
+        self.cap = cv2.VideoCapture(source, cv2.CAP_ANY, params)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"Failed to open video: {source}")
+
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.hw_acceleration = hw_acceleration and self.cap.get(cv2.CAP_PROP_HW_ACCELERATION) > 0
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        ret, frame = self.cap.read()
+        size = self.output_size
+        if ret and size:
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        return ret, frame
+
+    def skip(self, frames: int) -> bool:
+        for _ in range(frames):
+            if not self.cap.grab():
+                return False
+        return True
+
+    def seek(self, frame_number: int):
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+
+    def release(self):
+        self.cap.release()
+
+    def describe(self) -> dict:
+        return {**super().describe(), "hw_acceleration": self.hw_acceleration}
+
+
+class PyAVDecoder(VideoDecoder):
+    """
+    FFmpeg through PyAV with codec threading
+
+    Downscaling happens in the pixel format conversion, so full-resolution
+    BGR frames are never built. Skipped frames are decoded (later frames
+    reference them) but not converted.
+    """
+
+    name = DECODER_PYAV
+
+    def __init__(self, source: str, max_width: int = 0, threads: int = 0):
+        if av is None:
+            raise RuntimeError("PyAV is not installed")
+        super().__init__(source, max_width)
+        self.container = av.open(str(source))
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = "AUTO"
+        if threads > 0:
+            self.stream.codec_context.thread_count = threads
+        self.threads = self.stream.codec_context.thread_count
+
+        self.fps = float(self.stream.average_rate or 0)
+        self.frame_count = self.stream.frames
+        self.width = self.stream.codec_context.width
+        self.height = self.stream.codec_context.height
+        self._frames = self.container.decode(self.stream)
+
+    def _next(self):
+        try:
+            return next(self._frames)
+        except (StopIteration, av.error.FFmpegError):
+            return None
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        frame = self._next()
+        if frame is None:
+            return False, None
+        size = self.output_size
+        if size:
+            return True, frame.to_ndarray(format="bgr24", width=size[0], height=size[1])
+        return True, frame.to_ndarray(format="bgr24")
+
+    def skip(self, frames: int) -> bool:
+        return all(self._next() is not None for _ in range(frames))
+
+    def seek(self, frame_number: int):
+        """Seek to the keyframe at or before frame_number"""
+        offset = 0
+        if frame_number and self.fps and self.stream.time_base:
+            offset = int(frame_number / self.fps / self.stream.time_base)
+        self.container.seek(offset, stream=self.stream)
+        self._frames = self.container.decode(self.stream)
+
+    def release(self):
+        self.container.close()
+
+    def describe(self) -> dict:
+        return {**super().describe(), "threads": self.threads}
+
+
+def create_decoder(
+    source: Union[str, int],
+    decoder: str = config.DECODER,
+    max_width: int = config.DECODE_MAX_WIDTH
+) -> VideoDecoder:
+    """
+    Open a source with the configured decoder
+
+    PyAV falls back to OpenCV when it is missing or for camera indices.
+    """
+    if decoder not in DECODERS:
+        raise ValueError(f"Unknown decoder: {decoder}. Use: {', '.join(DECODERS)}")
+
+    if decoder == DECODER_PYAV and not isinstance(source, int):
+        if av is not None:
+            try:
+                return PyAVDecoder(source, max_width, config.DECODE_THREADS)
+            except Exception as e:
+                logger.warning(f"⚠️  PyAV cannot open {source}, using OpenCV: {e}")
+        else:
+            logger.warning("⚠️  PyAV is not installed, using OpenCV decoder")
+
+    return OpenCVDecoder(source, max_width, config.DECODE_HW_ACCELERATION)
+
+
+def decode_next(decoder: VideoDecoder, stride: int, live: bool) -> Tuple[bool, Optional[np.ndarray], bool]:
+    """
+    Skip stride - 1 frames and decode the next one, rewinding files at the end
+
+    Returns:
+        Tuple of (success, frame, looped)
+    """
+    ok = decoder.skip(stride - 1)
+    if ok:
+        ok, frame = decoder.read()
+    if ok or live:
+        return ok, frame if ok else None, False
+
+    logger.debug("📹 Looping video")
+    decoder.seek(0)
+    ok, frame = decoder.read()
+    return ok, frame, True
+
+
+class DecodeThread:
+    """
+    Decodes a source on its own thread, ahead of the capture stage
+
+    At most queue_size frames are decoded ahead; the thread blocks until
+    the consumer takes one, so an idle or slow pipeline also pauses
+    decoding. Only every stride-th source frame is converted, the others
+    are skipped inside the decoder. Files loop at the end.
+    """
+
+    def __init__(
+        self,
+        decoder: VideoDecoder,
+        stride: int = 1,
+        queue_size: int = config.DECODE_QUEUE_SIZE,
+        source_id: Optional[str] = None
+    ):
+        self.decoder = decoder
+        self.stride = max(1, stride)
+        self.live = is_live_source(decoder.source)
+        self.queue_size = max(1, queue_size)
+        self.latency = SOURCE_STAGE_SECONDS.labels(source_id or decoder.source, "decode")
+
+        self._slots = threading.Semaphore(self.queue_size)
+        self._frames: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._running = threading.Event()
+        self._lock = threading.Lock()  # Guards the decoder between the thread and seek()
+        self._seek_to: Optional[int] = None
+        self.started_at: Optional[float] = None
+        self.last_span: Optional[Tuple[float, float, int, int]] = None  # start, end, pid, tid of the last frame read
+
+        # Statistics
+        self.frames_decoded = 0
+        self.frames_skipped = 0
+        self.decode_time = 0.0
+        self.loops = 0
+
+    def start(self):
+        """Start decoding for the running event loop"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._loop = asyncio.get_event_loop()
+        self._frames = asyncio.Queue()
+        self._slots = threading.Semaphore(self.queue_size)
+        self._running.set()
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name=f"decode-{self.decoder.source}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the thread and close the source"""
+        self._running.clear()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+        self.decoder.release()
+
+    def seek(self, frame_number: int):
+        """Restart decoding at a frame"""
+        with self._lock:
+            self._seek_to = frame_number
+
+    async def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        """Next decoded frame, as (success, frame)"""
+        ok, frame, self.last_span = await self._frames.get()
+        self._slots.release()
+        return ok, frame
+
+    def _decode_next(self) -> Tuple[bool, Optional[np.ndarray], Optional[Tuple[float, float, int, int]]]:
+        with self._lock:
+            if self._seek_to is not None:
+                self.decoder.seek(self._seek_to)
+                self._seek_to = None
+
+            start = time.time()
+            ok, frame, looped = decode_next(self.decoder, self.stride, self.live)
+            self.loops += looped
+            if not ok:
+                return False, None, None
+
+            end = time.time()
+            self.decode_time += end - start
+            self.latency.observe(end - start)
+            self.frames_decoded += 1
+            self.frames_skipped += self.stride - 1
+            return True, frame, (start, end, os.getpid(), threading.get_ident())
+
+    def _run(self):
+        pin_current_thread(parse_cpus(config.DECODE_CPUS))
+        while self._running.is_set():
+            if not self._slots.acquire(timeout=0.1):
+                continue
+            try:
+                item = self._decode_next()
+            except Exception as e:
+                logger.error(f"❌ Decode error [{self.decoder.source}]: {e}", extra=AGGREGATE)
+                item = (False, None, None)
+            if not item[0]:
+                time.sleep(0.1)  # Stream hiccup: do not spin
+            try:
+                self._loop.call_soon_threadsafe(self._frames.put_nowait, item)
+            except RuntimeError:  # Event loop closed
+                break
+
+    def get_stats(self) -> dict:
+        """Get decoder statistics"""
+        return {
+            **self.decoder.describe(),
+            "stride": self.stride,
+            "frames_decoded": self.frames_decoded,
+            "frames_skipped": self.frames_skipped,
+            "avg_decode_time": self.decode_time / self.frames_decoded if self.frames_decoded else 0.0,
+            "utilization": self.decode_time / (time.time() - self.started_at) if self.started_at else 0.0,
+            "queued": self._frames.qsize() if self._frames else 0,
+            "loops": self.loops
+        }
+
+
+def _decode_worker(conn, source, decoder_name: str, max_width: int, stride: int, ring_spec: tuple, credits, cpus):
+    """
+    Decode process main loop
+
+    Writes frames into the shared ring while it holds credits and reports
+    ("frame", slot, sequence, start, end, looped) or ("error",) per frame.
+    Waits for a free slot while every slot is still leased downstream.
+    Accepts ("seek", frame_number) and ("stop",).
+    """
+    pin_current_thread(cpus)
+    decoder = create_decoder(source, decoder_name, max_width)
+    ring = SharedFrameRing.attach(*ring_spec)
+    live = is_live_source(source)
+
+    while True:
+        if conn.poll():
+            command = conn.recv()
+            if command[0] == "stop":
+                break
+            if command[0] == "seek":
+                decoder.seek(command[1])
+            continue
+        if not credits.acquire(timeout=0.1):
+            continue
+
+        start = time.time()
+        try:
+            ok, frame, looped = decode_next(decoder, stride, live)
+        except Exception as e:
+            logger.error(f"❌ Decode error [{source}]: {e}", extra=AGGREGATE)
+            ok, frame, looped = False, None, False
+        if not ok:
+            conn.send(("error",))
+            time.sleep(0.1)  # Stream hiccup: do not spin
+            continue
+
+        written = ring.write(frame)
+        while written is None and not conn.poll():
+            time.sleep(0.002)  # Every slot is still in use downstream
+            written = ring.write(frame)
+        if written is None:
+            credits.release()  # Drop the frame and handle the command first
+            continue
+
+        slot, sequence = written
+        conn.send(("frame", slot, sequence, start, time.time(), looped))
+
+    decoder.release()
+    ring.close()
+
+
+class DecodeProcess(DecodeThread):
+    """
+    Decodes a source in a child process, writing into a shared frame ring
+
+    Frames reach the pipeline as zero-copy views of ring slots, and an
+    inference process can read the same slots without any transfer. The
+    child holds at most queue_size unread frames. A slot stays leased
+    while any array viewing its frame is alive (inference batch, encode,
+    latest frame), so it is never overwritten in use; ring_slots should
+    cover those frames, or decoding waits for slots to come back.
+    """
+
+    def __init__(
+        self,
+        decoder: VideoDecoder,
+        stride: int = 1,
+        queue_size: int = config.DECODE_QUEUE_SIZE,
+        ring_slots: int = config.DECODE_RING_SLOTS,
+        source_id: Optional[str] = None
+    ):
+        super().__init__(decoder, stride, queue_size, source_id)
+        self.ring_slots = ring_slots or (
+            self.queue_size + 2 * config.PIPELINE_QUEUE_SIZE + config.BATCH_SIZE_MAX + 4
+        )
+        self.ring: Optional[SharedFrameRing] = None
+        self.process: Optional[mp.Process] = None
+        self.conn = None
+        self.credits = None
+
+        # Statistics
+        self.overwritten = 0
+        self.restarts = 0
+
+    def start(self):
+        """Start the decode process for the running event loop"""
+        if self.process is not None and self.process.is_alive():
+            return
+        self._loop = asyncio.get_event_loop()
+        self._frames = asyncio.Queue()
+        self.started_at = self.started_at or time.time()
+
+        if self.ring is None:
+            width, height = self.decoder.output_size or (self.decoder.width, self.decoder.height)
+            self.ring = SharedFrameRing(self.ring_slots, height, width)
+            self.decoder.release()  # The child opens its own
+        else:
+            # Frames the previous child wrote but nobody read are gone with its queue
+            self.ring.reclaim()
+
+        context = mp.get_context("spawn")
+        self.credits = context.Semaphore(self.queue_size)
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_decode_worker,
+            args=(
+                child_conn, self.decoder.source, self.decoder.name, self.decoder.max_width,
+                self.stride, self.ring.spec, self.credits, parse_cpus(config.DECODE_CPUS)
+            ),
+            name=f"decode-{self.decoder.source}",
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self._loop.add_reader(self.conn.fileno(), self._receive)
+        logger.info(f"🎞️  Decode process started (pid {self.process.pid}), ring of {self.ring.slots} frames")
+
+    def _receive(self):
+        """Move child messages onto the frame queue (event loop reader callback)"""
+        try:
+            while self.conn.poll():
+                message = self.conn.recv()
+                if message[0] == "frame":
+                    _, slot, sequence, start, end, looped = message
+                    self.frames_decoded += 1
+                    self.frames_skipped += self.stride - 1
+                    self.decode_time += end - start
+                    self.latency.observe(end - start)
+                    self.loops += looped
+                    self._frames.put_nowait((slot, sequence, (start, end, self.process.pid, self.process.pid)))
+                else:
+                    self._frames.put_nowait(None)
+        except (EOFError, OSError):
+            logger.error(f"❌ Decode process exited [{self.decoder.source}]")
+            self._loop.remove_reader(self.conn.fileno())
+            self._frames.put_nowait(None)
+
+    async def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        """Next decoded frame as a view of its ring slot, as (success, frame)"""
+        if not self.process.is_alive() and self._frames.empty():
+            self.restarts += 1
+            self.start()
+
+        item = await self._frames.get()
+        self.credits.release()
+        if item is None:
+            self.last_span = None
+            return False, None
+
+        slot, sequence, self.last_span = item
+        frame = self.ring.lease(slot, sequence)
+        if frame is None:
+            self.overwritten += 1  # Slot reclaimed after a decode process restart
+            return False, None
+        return True, frame
+
+    def seek(self, frame_number: int):
+        """Restart decoding at a frame"""
+        if self.process is not None and self.process.is_alive():
+            self.conn.send(("seek", frame_number))
+
+    def stop(self):
+        """Stop the child and free the ring"""
+        if self.process is not None:
+            if self._loop is not None and not self._loop.is_closed():
+                self._loop.remove_reader(self.conn.fileno())
+            if self.process.is_alive():
+                try:
+                    self.conn.send(("stop",))
+                except OSError:
+                    pass
+                self.process.join(timeout=2.0)
+                if self.process.is_alive():
+                    self.process.terminate()
+            self.process = None
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+    def get_stats(self) -> dict:
+        """Get decoder and ring statistics"""
+        stats = super().get_stats()
+        stats.update({
+            "process": self.process.pid if self.process is not None else None,
+            "ring": self.ring.get_stats() if self.ring is not None else None,
+            "overwritten": self.overwritten,
+            "restarts": self.restarts
+        })
+        return stats
\ No newline at end of file
@@ -4,213 +4,350 @@ Author: Alims-Repo
 Date: 2025-06-17
 """
 
-from typing import List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional
+import threading
 import time
-import cv2
 import numpy as np
 import torch
-from ultralytics import YOLO
 
 from config.settings import get_config
-from src.utils.logging_config import get_logger
+from src.utils.logging_config import AGGREGATE, get_logger
 from src.utils.helpers import PerformanceTracker, timer
+from src.utils.metrics import MODEL_FRAMES, MODEL_STAGE_SECONDS, observe_stages
+from src.core.backends import InferenceBackend
+from src.core.preprocess import LetterboxPreprocessor, LetterboxTransform
 
 config = get_config()
 logger = get_logger("detector")
 
+# One row per detected vehicle, in original frame coordinates
+DETECTION_DTYPE = np.dtype([
+    ("x1", np.float32),
+    ("y1", np.float32),
+    ("x2", np.float32),
+    ("y2", np.float32),
+    ("confidence", np.float32),
+    ("class_id", np.int32)
+])
+
+
+class AdaptiveBatchSizer:
+    """Adapts the inference batch size to measured batch latency"""
+
+    def __init__(
+        self,
+        initial_size: int,
+        max_size: int,
+        latency_budget: float,
+        enabled: bool = True,
+        smoothing: float = 0.3
+    ):
+        self.max_size = max(1, max_size)
+        self.size = max(1, min(initial_size, self.max_size))
+        self.latency_budget = latency_budget
+        self.enabled = enabled
+        self.smoothing = smoothing
+
+        # Smoothed per-frame latency for every batch size seen so far
+        self.per_frame_latency: Dict[int, float] = {}
+
+    def record(self, batch_size: int, latency: float):
+        """
+        Record a finished batch and adjust the next batch size
+
+        Args:
+            batch_size: Number of frames in the batch
+            latency: Wall-clock time for the batch
+        """
+        if batch_size <= 0:
+            return
+
+        per_frame = latency / batch_size
+        previous = self.per_frame_latency.get(batch_size)
+        if previous is None:
+            self.per_frame_latency[batch_size] = per_frame
+        else:
+            self.per_frame_latency[batch_size] = (
+                self.smoothing * per_frame + (1 - self.smoothing) * previous
+            )
+
+        # Only adapt on batches of the currently requested size
+        if not self.enabled or batch_size != self.size:
+            return
+
+        current = self.per_frame_latency[self.size]
+        smaller = self.per_frame_latency.get(self.size - 1)
+        larger = self.per_frame_latency.get(self.size + 1)
+
+        if latency > self.latency_budget and self.size > 1:
+            # Over budget: shrink to bring latency down
+            self.size -= 1
+        elif smaller is not None and smaller < current:
+            # Bigger batches stopped paying off
+            self.size -= 1
+        elif (
+            latency * (self.size + 1) / self.size < self.latency_budget
+            and self.size < self.max_size
+            and (larger is None or larger < current)
+        ):
+            # Headroom left and a larger batch amortizes better (or is untested)
+            self.size += 1
+
+    def reset(self):
+        """Forget measured latencies after the model or input size changed"""
+        self.per_frame_latency = {}
+
+    def get_stats(self) -> dict:
+        """Get batch sizing statistics"""
+        return {
+            "batch_size": self.size,
+            "max_batch_size": self.max_size,
+            "latency_budget": self.latency_budget,
+            "adaptive": self.enabled,
+            "per_frame_latency": {
+                str(size): latency for size, latency in sorted(self.per_frame_latency.items())
+            }
+        }
+
 
 class VehicleDetector:
     """Handles vehicle detection with M1 Pro optimizations"""
 
-    def __init__(self, model: YOLO, device: str):
-        self.model = model
+    def __init__(self, backend: InferenceBackend, device: str):
+        self.backend = backend
         self.device = device
+        self.input_size = config.INPUT_SIZE
         self.performance_tracker = PerformanceTracker()
+        self.last_stage_times: Dict[str, float] = {}
+        self._class_mask = np.zeros(0, dtype=bool)
+        self._class_mask_key: Optional[Tuple[str, ...]] = None
+        self._pending_config: Dict = {}
+        self._pending_lock = threading.Lock()
+        self.batch_sizer = AdaptiveBatchSizer(
+            initial_size=config.BATCH_SIZE_GPU if device == "mps" else config.BATCH_SIZE_CPU,
+            max_size=config.BATCH_SIZE_MAX,
+            latency_budget=config.BATCH_LATENCY_BUDGET,
+            enabled=config.ADAPTIVE_BATCHING
+        )
+        self.preprocessor = LetterboxPreprocessor(self.input_size, device, self.batch_sizer.size)
 
-        logger.info(f"🔧 Detector initialized: {device.upper()}")
+        logger.info(f"🔧 Detector initialized: {backend.name} on {device.upper()}")
         logger.info(f"📋 Vehicle classes: {', '.join(config.VEHICLE_CLASSES)}")
+        logger.info(f"📦 Initial batch size: {self.batch_sizer.size}")
 
     @timer
-    def preprocess_frame(self, frame: np.ndarray) -> np.ndarray:
+    def preprocess_batch(self, frames: List[np.ndarray]) -> Tuple[torch.Tensor, List[LetterboxTransform]]:
         """
-        Preprocess frame for optimal inference
+        Letterbox frames into the reusable buffer for inference
 
         Args:
-            frame: Input frame
+            frames: Input frames
 
         Returns:
-            Preprocessed frame
+            Tuple of (model-ready batch tensor, per-frame letterbox transforms)
         """
-        if frame.shape[:2] != (config.INPUT_SIZE, config.INPUT_SIZE):
-            return cv2.resize(frame, (config.INPUT_SIZE, config.INPUT_SIZE))
-        return frame
+        return self.preprocessor.prepare_batch(frames, self.input_size)
+
+    def _vehicle_class_mask(self) -> np.ndarray:
+        """Boolean mask over model class ids, True for vehicle classes"""
+        key = tuple(config.VEHICLE_CLASSES)
+        if key != self._class_mask_key:
+            names = self.backend.names
+            mask = np.zeros(max(names) + 1 if names else 0, dtype=bool)
+            for cls_id, cls_name in names.items():
+                mask[cls_id] = cls_name in key
+            self._class_mask = mask
+            self._class_mask_key = key
+        return self._class_mask
 
     def postprocess_detections(
         self,
-        frame: np.ndarray,
-        result,
-        scale_x: float,
-        scale_y: float
-    ) -> Tuple[np.ndarray, int]:
+        data: np.ndarray,
+        frame_shape: Tuple[int, ...],
+        transform: LetterboxTransform
+    ) -> np.ndarray:
         """
-        Process detection results and draw annotations
+        Convert raw backend detections into vehicle detections in frame coordinates
 
         Args:
-            frame: Original frame
-            result: YOLO detection result
-            scale_x: X-axis scaling factor
-            scale_y: Y-axis scaling factor
+            data: (N, 6) array of x1, y1, x2, y2, conf, cls in model input coordinates
+            frame_shape: Shape of the original frame
+            transform: Letterbox transform used for this frame
 
         Returns:
-            Tuple of (annotated_frame, vehicle_count)
+            Structured array of DETECTION_DTYPE, one row per vehicle
         """
-        vehicle_count = 0
-        output_frame = frame.copy()
-
-        if result.boxes is None or len(result.boxes) == 0:
-            return output_frame, vehicle_count
-
-        for box in result.boxes:
-            cls_id = int(box.cls[0])
-            cls_name = self.model.names[cls_id]
+        if len(data) == 0:
+            return np.empty(0, dtype=DETECTION_DTYPE)
+
+        class_ids = data[:, 5].astype(np.int32)
+
+        # Keep vehicle classes only
+        mask = self._vehicle_class_mask()
+        keep = np.zeros(len(class_ids), dtype=bool)
+        known = class_ids < len(mask)
+        keep[known] = mask[class_ids[known]]
+        data = data[keep]
+
+        # Undo the letterbox and clip to frame bounds
+        height, width = frame_shape[:2]
+        boxes = transform.boxes_to_frame(data[:, :4].astype(np.float32))
+        np.clip(boxes, 0, np.array([width - 1, height - 1, width - 1, height - 1]), out=boxes)
+
+        detections = np.empty(len(data), dtype=DETECTION_DTYPE)
+        detections["x1"] = boxes[:, 0]
+        detections["y1"] = boxes[:, 1]
+        detections["x2"] = boxes[:, 2]
+        detections["y2"] = boxes[:, 3]
+        detections["confidence"] = data[:, 4]
+        detections["class_id"] = class_ids[keep]
+        return detections
+
+    def detect_vehicles(self, frames: List[np.ndarray]) -> List[np.ndarray]:
+        """
+        Perform batched vehicle detection on frame(s)
 
-            if cls_name not in config.VEHICLE_CLASSES:
-                continue
+        All frames are stacked into one tensor and sent through a single
+        forward pass and NMS, results are then mapped back per frame.
 
-            vehicle_count += 1
+        Annotation is left to downstream consumers, so no frame is copied
+        or drawn on here.
 
-            # Scale coordinates back to original size
-            x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-            x1, x2 = int(x1 * scale_x), int(x2 * scale_x)
-            y1, y2 = int(y1 * scale_y), int(y2 * scale_y)
+        Args:
+            frames: List of input frames
 
-            # Ensure coordinates are within frame bounds
-            x1 = max(0, min(x1, frame.shape[1] - 1))
-            y1 = max(0, min(y1, frame.shape[0] - 1))
-            x2 = max(0, min(x2, frame.shape[1] - 1))
-            y2 = max(0, min(y2, frame.shape[0] - 1))
+        Returns:
+            Structured detections array (DETECTION_DTYPE) per frame
+        """
+        self.apply_pending_config()
+        start_time = time.time()
 
-            conf = float(box.conf[0])
-            label = f"{cls_name}: {conf:.2f}"
+        detections_list = []
 
-            # Draw bounding box with confidence-based styling
-            color = self._get_confidence_color(conf)
-            thickness = 3 if conf > 0.7 else 2
+        try:
+            # Preprocess straight into the reused letterbox buffer
+            stage_start = time.perf_counter()
+            batch, transforms = self.preprocess_batch(frames)
+            preprocessed = time.perf_counter()
+
+            # Inference - one forward pass (plus NMS) for the whole batch
+            results = self.backend.infer(batch)
+            inferred = time.perf_counter()
+
+            # Postprocess, mapping each result back to its source frame
+            for frame, data, transform in zip(frames, results, transforms):
+                detections_list.append(self.postprocess_detections(data, frame.shape, transform))
+
+            self.last_stage_times = {
+                "preprocess": preprocessed - stage_start,
+                "inference": inferred - preprocessed,
+                "postprocess": time.perf_counter() - inferred
+            }
+            self.record_batch(len(frames), time.time() - start_time, detections_list, self.last_stage_times)
+            return detections_list
 
-            cv2.rectangle(output_frame, (x1, y1), (x2, y2), color, thickness)
+        except Exception as e:
+            logger.error(f"🚨 Detection error: {e}", extra=AGGREGATE)
+            # Return no detections on error
+            return [np.empty(0, dtype=DETECTION_DTYPE) for _ in frames]
 
-            # Draw label with background
-            self._draw_label(output_frame, label, (x1, y1), color)
+    def record_batch(
+        self,
+        frame_count: int,
+        detection_time: float,
+        detections_list: List[np.ndarray],
+        stage_times: Optional[Dict[str, float]] = None
+    ):
+        """
+        Account a finished batch, also for batches run in an inference process
 
-        return output_frame, vehicle_count
+        Args:
+            frame_count: Frames in the batch
+            detection_time: Wall-clock time for the batch
+            detections_list: Detections per frame
+            stage_times: Seconds spent in preprocess, inference and postprocess
+        """
+        total_vehicles = sum(len(detections) for detections in detections_list)
+        self.performance_tracker.add_sample(detection_time, total_vehicles, frame_count)
+        self.batch_sizer.record(frame_count, detection_time)
 
-    def _get_confidence_color(self, confidence: float) -> Tuple[int, int, int]:
-        """Get color based on confidence level"""
-        if confidence > 0.8:
-            return (0, 255, 0)  # Green for high confidence
-        elif confidence > 0.6:
-            return (0, 255, 255)  # Yellow for medium confidence
-        else:
-            return (0, 165, 255)  # Orange for low confidence
+        model_name = self.backend.model_name
+        MODEL_FRAMES.labels(model_name).inc(frame_count)
+        observe_stages(MODEL_STAGE_SECONDS, model_name, stage_times)
 
-    def _draw_label(
-        self,
-        frame: np.ndarray,
-        label: str,
-        position: Tuple[int, int],
-        color: Tuple[int, int, int]
-    ):
-        """Draw label with background"""
-        x, y = position
-        font_scale = 0.6
-        text_thickness = 2
-
-        # Get text size
-        (text_width, text_height), baseline = cv2.getTextSize(
-            label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, text_thickness
-        )
+        if detection_time > 0.2:  # Log slow detections
+            logger.warning(f"⚠️  Slow detection: {detection_time:.3f}s for {frame_count} frames", extra=AGGREGATE)
 
-        # Draw background rectangle
-        cv2.rectangle(
-            frame,
-            (x, y - text_height - baseline - 5),
-            (x + text_width + 5, y),
-            color,
-            -1
-        )
+    def set_device(self, device: str):
+        """
+        Move inference to another device
 
-        # Draw text
-        cv2.putText(
-            frame, label, (x + 2, y - 5),
-            cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 0, 0), text_thickness
-        )
+        Args:
+            device: Target device ('cpu', 'mps', ...)
+        """
+        self.backend.to(device)
+        self.device = device
+        self.preprocessor = LetterboxPreprocessor(self.input_size, device, self.batch_sizer.size)
+        logger.info(f"🔄 Detector moved to {device.upper()}")
 
-    def detect_vehicles(self, frames: List[np.ndarray]) -> Tuple[List[np.ndarray], List[int]]:
+    def configure(self, backend: Optional[InferenceBackend] = None, input_size: Optional[int] = None):
         """
-        Perform vehicle detection on frame(s)
+        Swap the model backend and/or input size between batches
 
         Args:
-            frames: List of input frames
+            backend: New backend (must run on the current device)
+            input_size: New square model input size (multiple of 32)
+        """
+        changed = False
+        if backend is not None and backend is not self.backend:
+            self.backend = backend
+            self._class_mask_key = None  # Class ids may differ between models
+            changed = True
+        if input_size and input_size != self.input_size:
+            self.input_size = input_size  # The preprocessor reallocates on the next batch
+            changed = True
+        if changed:
+            # Latency per batch size no longer applies
+            self.batch_sizer.reset()
+
+    def request_config(self, backend: Optional[InferenceBackend] = None, input_size: Optional[int] = None):
+        """
+        Queue a configure() for the start of the next batch
 
-        Returns:
-            Tuple of (processed_frames, vehicle_counts)
+        Safe to call from the event loop while a batch is running on the
+        inference executor; later requests override earlier pending ones.
+
+        Args:
+            backend: New backend (must run on the current device)
+            input_size: New square model input size (multiple of 32)
         """
-        start_time = time.time()
+        with self._pending_lock:
+            if backend is not None:
+                self._pending_config["backend"] = backend
+            if input_size:
+                self._pending_config["input_size"] = input_size
+
+    def apply_pending_config(self):
+        """Apply a queued configuration, called between batches"""
+        with self._pending_lock:
+            pending, self._pending_config = self._pending_config, {}
+        if pending:
+            self.configure(**pending)
 
-        results_list = []
-        counts_list = []
+    @property
+    def model(self):
+        """Underlying YOLO model, None for exported backends"""
+        return getattr(self.backend, "model", None)
 
-        try:
-            for frame in frames:
-                # Preprocess
-                original_shape = frame.shape
-                processed_frame = self.preprocess_frame(frame)
-
-                # Calculate scaling factors
-                scale_x = original_shape[1] / config.INPUT_SIZE
-                scale_y = original_shape[0] / config.INPUT_SIZE
-
-                # Inference
-                results = self.model.predict(
-                    processed_frame,
-                    verbose=False,
-                    device=self.device,
-                    conf=config.CONFIDENCE_THRESHOLD,
-                    iou=config.IOU_THRESHOLD,
-                    max_det=config.MAX_DETECTIONS,
-                    half=False,  # M1 Pro prefers float32
-                    augment=False,
-                    agnostic_nms=False,
-                    retina_masks=False,
-                    save=False,
-                    stream=False,
-                )
-
-                if self.device == "mps":
-                    torch.mps.synchronize()
-
-                # Postprocess
-                output_frame, vehicle_count = self.postprocess_detections(
-                    frame, results[0], scale_x, scale_y
-                )
-
-                results_list.append(output_frame)
-                counts_list.append(vehicle_count)
-
-            # Track performance
-            detection_time = time.time() - start_time
-            total_vehicles = sum(counts_list)
-            self.performance_tracker.add_sample(detection_time, total_vehicles)
-
-            if detection_time > 0.2:  # Log slow detections
-                logger.warning(f"⚠️  Slow detection: {detection_time:.3f}s for {len(frames)} frames")
-
-            return results_list, counts_list
+    @property
+    def class_names(self) -> Dict[int, str]:
+        """Class id to name mapping of the loaded model"""
+        return self.backend.names
 
-        except Exception as e:
-            logger.error(f"🚨 Detection error: {e}")
-            # Return original frames with zero counts on error
-            return frames, [0] * len(frames)
+    @property
+    def batch_size(self) -> int:
+        """Get recommended batch size for the next detection call"""
+        return self.batch_sizer.size
 
     @property
     def avg_detection_time(self) -> float:
@@ -232,10 +369,12 @@ class VehicleDetector:
         stats = self.performance_tracker.get_stats()
         stats.update({
             "device": self.device,
-            "model_name": getattr(self.model, 'ckpt_path', 'unknown'),
-            "input_size": config.INPUT_SIZE,
+            "backend": self.backend.describe(),
+            "model_name": self.backend.model_name,
+            "input_size": self.input_size,
             "confidence_threshold": config.CONFIDENCE_THRESHOLD,
-            "vehicle_classes": config.VEHICLE_CLASSES
+            "vehicle_classes": config.VEHICLE_CLASSES,
+            "batching": self.batch_sizer.get_stats()
         })
         return stats
 
@@ -5,7 +5,8 @@ Date: 2025-06-17
 """
 
 import time
-from typing import List, Tuple
+from pathlib import Path
+from typing import List, Optional, Tuple
 import numpy as np
 import torch
 from ultralytics import YOLO
@@ -13,6 +14,18 @@ from ultralytics import YOLO
 from config.settings import get_config
 from src.utils.logging_config import get_logger
 from src.utils.helpers import timer
+from src.core.backends import (
+    BACKEND_ONNXRUNTIME,
+    BACKEND_ULTRALYTICS,
+    InferenceBackend,
+    OnnxRuntimeBackend,
+    UltralyticsBackend,
+    backend_available,
+    create_backend
+)
+from src.core.benchmark_cache import BenchmarkCache
+from src.core.preprocess import LetterboxPreprocessor
+from src.core.quantization import load_quantized_models, sample_video_frames
 
 config = get_config()
 logger = get_logger("device_optimizer")
@@ -21,6 +34,9 @@ logger = get_logger("device_optimizer")
 class DeviceOptimizer:
     """Handles device selection and optimization for M1 Pro"""
     
+    # How the current backend was chosen (benchmark, cache or fallback)
+    selection: dict = {}
+    
     @staticmethod
     def setup_mps() -> bool:
         """Configure MPS if available"""
@@ -39,161 +55,266 @@ class DeviceOptimizer:
     
     @staticmethod
     @timer
-    def benchmark_device(model: YOLO, device: str, test_frames: List[np.ndarray]) -> float:
+    def benchmark_backend(backend: InferenceBackend, test_frames: List[np.ndarray]) -> float:
         """
-        Benchmark model performance on specific device
+        Benchmark an inference backend on its device
         
         Args:
-            model: YOLO model instance
-            device: Device to test ('cpu' or 'mps')
+            backend: Backend to test
             test_frames: List of test frames
             
         Returns:
             Average time per frame
         """
-        logger.info(f"🔍 Benchmarking {device.upper()}...")
+        label = f"{backend.name}/{backend.device.upper()}"
+        logger.info(f"🔍 Benchmarking {label}...")
         
         try:
-            model.to(device)
+            preprocessor = LetterboxPreprocessor(config.INPUT_SIZE, backend.device)
+            batches = [preprocessor.prepare_batch([frame], config.INPUT_SIZE)[0] for frame in test_frames]
             
-            if device == "mps":
+            if backend.device == "mps":
                 torch.mps.empty_cache()
-                # Warmup run
-                _ = model.predict(
-                    test_frames[0], 
-                    verbose=False, 
-                    device=device, 
-                    half=False,
-                    imgsz=config.INPUT_SIZE
-                )
-                torch.mps.synchronize()
+            
+            # Warmup run (graph optimization, kernel selection, allocations)
+            backend.infer(batches[0])
             
             # Actual benchmark
             start_time = time.time()
-            for frame in test_frames:
-                _ = model.predict(
-                    frame,
-                    verbose=False,
-                    device=device,
-                    half=False,
-                    imgsz=config.INPUT_SIZE,
-                    conf=config.CONFIDENCE_THRESHOLD,
-                    iou=config.IOU_THRESHOLD,
-                    max_det=config.MAX_DETECTIONS
-                )
-            
-            if device == "mps":
-                torch.mps.synchronize()
+            for batch in batches:
+                backend.infer(batch)
             
             total_time = time.time() - start_time
             avg_time = total_time / len(test_frames)
             
-            logger.info(f"📊 {device.upper()}: {avg_time:.3f}s/frame ({total_time:.3f}s total)")
+            logger.info(f"📊 {label}: {avg_time:.3f}s/frame ({total_time:.3f}s total)")
             return avg_time
             
         except Exception as e:
-            logger.error(f"✗ {device} benchmark failed: {e}")
+            logger.error(f"✗ {label} benchmark failed: {e}")
             return float('inf')
     
+    @staticmethod
+    def benchmark_frames(count: int = 4) -> List[np.ndarray]:
+        """Real traffic frames, so NMS and postprocessing see actual detections"""
+        try:
+            frames = sample_video_frames(config.VIDEO_PATH, count)
+            logger.info(f"📋 Sampled {len(frames)} test frames from {config.VIDEO_PATH.name}")
+            return frames
+        except (FileNotFoundError, ValueError) as e:
+            logger.warning(f"⚠️  No video frames for benchmarking ({e}), using random frames")
+        
+        return [
+            np.random.randint(0, 255, (config.INPUT_SIZE, config.INPUT_SIZE, 3), dtype=np.uint8)
+            for _ in range(count)
+        ]
+    
+    @staticmethod
+    def candidate_devices(backend: str, mps_available: bool) -> List[str]:
+        """Devices a backend can run on here"""
+        if backend == BACKEND_ULTRALYTICS and mps_available:
+            return ["cpu", "mps"]
+        return ["cpu"]
+    
+    @staticmethod
+    def candidate_model_paths() -> List[Path]:
+        """Model files taking part in the benchmark"""
+        paths = [path for path in config.MODEL_PATHS if path.exists()]
+        paths.extend(quantized.path for quantized in load_quantized_models())
+        return paths
+    
+    @staticmethod
+    def load_candidate(candidate: dict) -> InferenceBackend:
+        """Rebuild the backend for a benchmark result entry"""
+        path = Path(candidate["path"])
+        if candidate.get("quantized"):
+            return OnnxRuntimeBackend(path)
+        return create_backend(candidate["backend"], path, candidate["device"])
+    
     @classmethod
-    def find_optimal_config(cls) -> Tuple[YOLO, str]:
+    def run_benchmarks(cls) -> Tuple[Optional[InferenceBackend], Optional[dict], List[dict]]:
         """
-        Find the best model and device combination
+        Benchmark every model, backend and device combination
         
         Returns:
-            Tuple of (best_model, best_device)
+            Tuple of (best_backend, best_result, all_results)
         """
-        logger.info("🚀 Starting device optimization...")
-        
         # Setup MPS if available
         mps_available = cls.setup_mps()
         
-        # Generate test data
-        test_frames = [
-            np.random.randint(0, 255, (config.INPUT_SIZE, config.INPUT_SIZE, 3), dtype=np.uint8)
-            for _ in range(4)
-        ]
-        logger.info(f"📋 Generated {len(test_frames)} test frames")
+        backends = [name for name in config.INFERENCE_BACKENDS if backend_available(name)]
+        skipped = [name for name in config.INFERENCE_BACKENDS if name not in backends]
+        if skipped:
+            logger.info(f"📋 Backends not installed: {', '.join(skipped)}")
         
-        best_model = None
-        best_device = "cpu"
-        best_time = float('inf')
-        results = []
+        test_frames = cls.benchmark_frames()
         
-        # Test each available model
+        candidates = []
         for model_path in config.MODEL_PATHS:
             if not model_path.exists():
                 logger.warning(f"⚠️  Model not found: {model_path}")
                 continue
+            for backend_name in backends:
+                for device in cls.candidate_devices(backend_name, mps_available):
+                    candidates.append({
+                        "model": model_path.name,
+                        "path": str(model_path),
+                        "backend": backend_name,
+                        "device": device,
+                        "quantized": False
+                    })
+        
+        # INT8 variants are candidates only while they stay within the accuracy budget
+        if BACKEND_ONNXRUNTIME in backends:
+            for quantized in load_quantized_models():
+                label = f"{quantized.path.name} ({quantized.count_agreement:.1%} count agreement)"
+                if quantized.accuracy_loss > config.QUANTIZATION_ACCURACY_BUDGET:
+                    logger.info(f"⏭️  Skipping {label}: over accuracy budget")
+                    continue
+                candidates.append({
+                    "model": quantized.path.name,
+                    "path": str(quantized.path),
+                    "backend": BACKEND_ONNXRUNTIME,
+                    "device": "cpu",
+                    "quantized": True
+                })
+        
+        best_backend = None
+        best_result = None
+        best_time = float('inf')
+        results = []
+        
+        for candidate in candidates:
+            label = f"{candidate['model']} on {candidate['backend']}/{candidate['device'].upper()}"
+            logger.info(f"🧠 Testing {label}")
+            try:
+                backend = cls.load_candidate(candidate)
+            except Exception as e:
+                logger.warning(f"⚠️  Skipping {label}: {e}")
+                continue
             
-            model_name = model_path.name
-            logger.info(f"🧠 Testing model: {model_name}")
+            avg_time = cls.benchmark_backend(backend, test_frames)
             
+            # Record results
+            result = dict(candidate)
+            result.update({
+                "time": avg_time,
+                "fps": 1.0 / avg_time if 0 < avg_time < float('inf') else 0
+            })
+            results.append(result)
+            
+            # Update best configuration
+            if avg_time < best_time:
+                best_time = avg_time
+                best_backend = backend
+                best_result = result
+                logger.info(f"🏆 New best: {label}")
+        
+        # Log all results for comparison
+        if results:
+            logger.info("📊 Complete benchmark results:")
+            for result in results:
+                logger.info(
+                    f"   {result['model']} {result['backend']}/{result['device'].upper()}: {result['fps']:.1f}fps"
+                )
+        
+        return best_backend, best_result, results
+    
+    @classmethod
+    def refresh_benchmark_cache(cls) -> Optional[dict]:
+        """
+        Re-run the benchmark and store the result without touching the live backend
+        
+        Returns:
+            New best result, if any model could be benchmarked
+        """
+        logger.info("🔁 Re-benchmarking in the background...")
+        cache = BenchmarkCache()
+        key = cache.key(cls.candidate_model_paths())
+        _, best_result, results = cls.run_benchmarks()
+        if best_result is None:
+            return None
+        
+        # Exports written during the benchmark are part of the key
+        key = cache.key(cls.candidate_model_paths())
+        cache.put(key, best_result, results)
+        previous = cls.selection.get("winner") or {}
+        if (previous.get("path"), previous.get("backend"), previous.get("device")) != (
+            best_result["path"], best_result["backend"], best_result["device"]
+        ):
+            logger.info(
+                f"💡 New best configuration {best_result['model']} on "
+                f"{best_result['backend']}/{best_result['device'].upper()}, used from the next start"
+            )
+        return best_result
+    
+    @classmethod
+    def find_optimal_config(cls, rebenchmark: bool = False) -> Tuple[InferenceBackend, str]:
+        """
+        Find the best model, backend and device combination
+        
+        The winner is cached on disk; later starts on the same host with the
+        same libraries and model files load it directly without benchmarking.
+        
+        Args:
+            rebenchmark: Ignore the cache and benchmark again
+        
+        Returns:
+            Tuple of (best_backend, best_device)
+        """
+        logger.info("🚀 Starting device optimization...")
+        
+        cache = BenchmarkCache()
+        key = cache.key(cls.candidate_model_paths())
+        
+        best_backend = None
+        best_result = None
+        source = "benchmark"
+        
+        cached = None if rebenchmark else cache.get(key)
+        if cached:
+            best_result = cached["winner"]
             try:
-                model = YOLO(str(model_path))
-                
-                # Test CPU
-                cpu_time = cls.benchmark_device(model, "cpu", test_frames)
-                
-                # Test MPS if available
-                mps_time = float('inf')
-                if mps_available:
-                    mps_time = cls.benchmark_device(model, "mps", test_frames)
-                
-                # Record results
-                result = {
-                    "model": model_name,
-                    "cpu_time": cpu_time,
-                    "mps_time": mps_time,
-                    "cpu_fps": 1.0 / cpu_time if cpu_time > 0 else 0,
-                    "mps_fps": 1.0 / mps_time if mps_time > 0 and mps_time != float('inf') else 0
-                }
-                results.append(result)
-                
-                logger.info(f"📊 {model_name} results:")
-                logger.info(f"   CPU: {cpu_time:.3f}s ({result['cpu_fps']:.1f} FPS)")
-                if mps_available:
-                    logger.info(f"   MPS: {mps_time:.3f}s ({result['mps_fps']:.1f} FPS)")
-                
-                # Update best configuration
-                if cpu_time < best_time:
-                    best_time = cpu_time
-                    best_device = "cpu"
-                    best_model = model
-                    logger.info(f"🏆 New best: {model_name} on CPU")
-                
-                if mps_time < best_time:
-                    best_time = mps_time
-                    best_device = "mps"
-                    best_model = model
-                    logger.info(f"🏆 New best: {model_name} on MPS")
-                
+                best_backend = cls.load_candidate(best_result)
+                source = "cache"
+                logger.info("⚡ Using cached benchmark result (run with --rebenchmark to refresh)")
+                if best_result["device"] == "mps":
+                    cls.setup_mps()
             except Exception as e:
-                logger.error(f"✗ Failed to test {model_name}: {e}")
+                logger.warning(f"⚠️  Cached winner unusable, benchmarking: {e}")
+                best_backend = None
+        
+        if best_backend is None:
+            best_backend, best_result, results = cls.run_benchmarks()
+            if best_result is not None:
+                # Exports written during the benchmark are part of the key
+                key = cache.key(cls.candidate_model_paths())
+                cache.put(key, best_result, results)
         
         # Fallback to default if no models found
-        if best_model is None:
+        if best_backend is None:
             logger.warning("⚠️  No models found, using fallback")
-            best_model = YOLO("yolov8n.pt")  # This will download if not present
-            best_device = "cpu"
-            best_time = float('inf')
+            best_backend = UltralyticsBackend(YOLO("yolov8n.pt"), "cpu")  # This will download if not present
+            best_result = None
+            source = "fallback"
         
-        # Move model to selected device
-        best_model.to(best_device)
+        best_device = best_backend.device
+        best_time = best_result["time"] if best_result else float('inf')
+        cls.selection = {
+            "source": source,
+            "cache_key": key,
+            "cached_at": cached["created_at"] if source == "cache" else None,
+            "winner": best_result
+        }
         
         # Log final selection
         logger.info("🎯 Final Selection:")
-        logger.info(f"   Model: {best_model.ckpt_path if hasattr(best_model, 'ckpt_path') else 'yolov8n.pt'}")
+        logger.info(f"   Model: {best_backend.model_name}")
+        logger.info(f"   Backend: {best_backend.name}")
         logger.info(f"   Device: {best_device.upper()}")
         logger.info(f"   Performance: {best_time:.3f}s/frame ({1.0/best_time:.1f} FPS)")
         
-        # Log all results for comparison
-        if results:
-            logger.info("📊 Complete benchmark results:")
-            for result in results:
-                logger.info(f"   {result['model']}: CPU={result['cpu_fps']:.1f}fps, MPS={result['mps_fps']:.1f}fps")
-        
-        return best_model, best_device
+        return best_backend, best_device
     
     @staticmethod
     def get_device_info() -> dict:
@@ -201,7 +322,10 @@ class DeviceOptimizer:
         info = {
             "mps_available": torch.backends.mps.is_available(),
             "torch_version": torch.__version__,
-            "device_count": 1 if torch.backends.mps.is_available() else 0
+            "device_count": 1 if torch.backends.mps.is_available() else 0,
+            "inference_backends": {
+                name: backend_available(name) for name in config.INFERENCE_BACKENDS
+            }
         }
         
         if torch.backends.mps.is_available():
@@ -0,0 +1,431 @@
+"""
+Dedicated, sized executors per pipeline stage
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+import asyncio
+import itertools
+import multiprocessing as mp
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
+import numpy as np
+import torch
+
+from config.settings import get_config
+from src.utils.logging_config import get_logger
+from src.core.backends import load_backend
+from src.core.detector import DETECTION_DTYPE, VehicleDetector
+from src.core.shared_ring import SharedFrameRing
+
+config = get_config()
+logger = get_logger("executors")
+
+STAGE_INFERENCE = "inference"
+STAGE_ENCODE = "encode"
+
+# Runtime-tunable settings mirrored into the inference process with every batch
+SYNCED_SETTINGS = ("VEHICLE_CLASSES", "CONFIDENCE_THRESHOLD", "IOU_THRESHOLD", "MAX_DETECTIONS")
+
+
+def parse_cpus(spec: str) -> Optional[Set[int]]:
+    """Parse a CPU list like "0-3,6" (empty = no pinning)"""
+    cpus = set()
+    for part in spec.replace(" ", "").split(","):
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-")
+            cpus.update(range(int(first), int(last) + 1))
+        else:
+            cpus.add(int(part))
+    return cpus or None
+
+
+def pin_current_thread(cpus: Optional[Set[int]]):
+    """Restrict the calling thread to a set of CPUs (Linux only)"""
+    if not cpus:
+        return
+    if not hasattr(os, "sched_setaffinity"):
+        logger.debug("📌 CPU affinity is not supported on this platform")
+        return
+    try:
+        os.sched_setaffinity(0, cpus)  # 0 = calling thread
+    except OSError as e:
+        logger.warning(f"⚠️  Cannot pin {threading.current_thread().name} to CPUs {sorted(cpus)}: {e}")
+
+
+def configure_torch_threads(cpus: Optional[Set[int]]):
+    """Size torch's intra-op pool to the inference CPUs so it does not oversubscribe the cores"""
+    threads = config.TORCH_THREADS or len(cpus or ())
+    if threads:
+        torch.set_num_threads(threads)
+        logger.info(f"🧵 Torch intra-op threads: {threads}")
+
+
+class StageExecutor:
+    """
+    Thread pool for one pipeline stage
+
+    Workers are optionally pinned to CPUs. Busy intervals are kept for
+    the last EXECUTOR_STATS_WINDOW seconds to report utilization, i.e.
+    the fraction of worker time spent running tasks.
+
+    task_hook, when set, runs every task as task_hook(stage, func, args);
+    profilers use it to reach the worker threads.
+    """
+
+    task_hook: Optional[Callable] = None
+
+    def __init__(self, name: str, workers: int, cpus: Optional[Set[int]] = None):
+        self.name = name
+        self.workers = max(1, workers)
+        self.cpus = cpus
+        self.pool = ThreadPoolExecutor(
+            max_workers=self.workers,
+            thread_name_prefix=f"{name}-worker",
+            initializer=pin_current_thread,
+            initargs=(cpus,)
+        )
+        self.created_at = time.time()
+
+        self._lock = threading.Lock()
+        self._busy: Deque[Tuple[float, float]] = deque(maxlen=4096)
+        self._active: Dict[int, float] = {}
+        self._ids = itertools.count()
+
+        # Statistics
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.busy_time = 0.0
+
+    def _timed(self, func: Callable, *args):
+        task_id = next(self._ids)
+        start = time.time()
+        with self._lock:
+            self._active[task_id] = start
+        hook = StageExecutor.task_hook
+        try:
+            return hook(self.name, func, args) if hook else func(*args)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            end = time.time()
+            with self._lock:
+                del self._active[task_id]
+                self._busy.append((start, end))
+                self.busy_time += end - start
+                self.completed += 1
+
+    async def run(self, func: Callable, *args):
+        """Run func(*args) on this stage's pool"""
+        self.submitted += 1
+        return await asyncio.get_running_loop().run_in_executor(self.pool, self._timed, func, *args)
+
+    def utilization(self, window: float = config.EXECUTOR_STATS_WINDOW) -> float:
+        """Busy fraction of all workers over the last window seconds"""
+        now = time.time()
+        window = min(window, now - self.created_at)
+        if window <= 0:
+            return 0.0
+        since = now - window
+        with self._lock:
+            busy = sum(end - max(start, since) for start, end in self._busy if end > since)
+            busy += sum(now - max(start, since) for start in self._active.values())
+        return min(1.0, busy / (window * self.workers))
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def get_stats(self) -> dict:
+        """Get pool statistics"""
+        return {
+            "workers": self.workers,
+            "cpus": sorted(self.cpus) if self.cpus else None,
+            "active": len(self._active),
+            "queued": max(0, self.submitted - self.completed - len(self._active)),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "busy_time": self.busy_time,
+            "utilization": self.utilization()
+        }
+
+
+def _inference_worker(conn, cpus: Optional[Set[int]], torch_threads: int):
+    """
+    Inference process main loop
+
+    Receives ("detect", segment, layout, spec, settings) and answers
+    ("ok", detections_list, seconds, torn, stage_times) or
+    ("error", message, 0.0, 0, None).
+    Layout entries are ("copy", offset, shape) for frames copied into the
+    segment, or ("ring", ring_spec, slot, sequence) for frames read in
+    place from a decoder's ring; torn counts ring frames overwritten
+    before detection finished, which get empty detections since the
+    detector may have seen parts of two frames.
+    """
+    pin_current_thread(cpus)
+    if torch_threads:
+        torch.set_num_threads(torch_threads)
+
+    detector: Optional[VehicleDetector] = None
+    spec = None
+    segment: Optional[shared_memory.SharedMemory] = None
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message[0] == "stop":
+            break
+
+        _, segment_name, layout, request_spec, settings = message
+        frames = []
+        try:
+            for name, value in settings.items():
+                setattr(config, name, value)
+
+            if request_spec != spec:
+                backend_name, model_path, device, input_size = request_spec
+                detector = VehicleDetector(load_backend(backend_name, model_path, device), device)
+                detector.configure(input_size=input_size)
+                spec = request_spec
+
+            if segment_name and (segment is None or segment.name != segment_name):
+                if segment is not None:
+                    segment.close()
+                segment = shared_memory.SharedMemory(name=segment_name)
+
+            for entry in layout:
+                if entry[0] == "ring":
+                    _, ring_spec, slot, sequence = entry
+                    frames.append(SharedFrameRing.attach(*ring_spec).read(slot, sequence))
+                else:
+                    _, offset, shape = entry
+                    frames.append(np.ndarray(shape, np.uint8, segment.buf, offset))
+
+            # Frames overwritten before we got to them get no detections
+            present = [i for i, frame in enumerate(frames) if frame is not None]
+            start = time.time()
+            detected = detector.detect_vehicles([frames[i] for i in present]) if present else []
+            detections_list = [np.empty(0, dtype=DETECTION_DTYPE) for _ in frames]
+            for i, detections in zip(present, detected):
+                detections_list[i] = detections
+
+            # A slot rewritten during detection may have mixed two frames: drop its detections
+            torn = len(frames) - len(present)
+            for i in present:
+                entry = layout[i]
+                if entry[0] == "ring" and not SharedFrameRing.attach(*entry[1]).is_current(entry[2], entry[3]):
+                    detections_list[i] = np.empty(0, dtype=DETECTION_DTYPE)
+                    torn += 1
+            frames = []  # Release the views before the segment can be closed
+            stage_times = detector.last_stage_times if present else None
+            conn.send(("ok", detections_list, time.time() - start, torn, stage_times))
+        except Exception as e:
+            frames = []
+            spec = None
+            conn.send(("error", str(e), 0.0, 0, None))
+
+    if segment is not None:
+        segment.close()
+
+
+class InferenceProcess:
+    """
+    Runs the detector in a child process, outside this process's GIL
+
+    Frames that live in a decoder's SharedFrameRing are passed by slot
+    and sequence, others are copied once into a shared memory segment;
+    only their layout and the small detection arrays cross the pipe. The child
+    rebuilds the backend whenever the parent's detector changes model,
+    device or input size, and is restarted if it dies.
+    """
+
+    def __init__(self, cpus: Optional[Set[int]] = None):
+        self.cpus = cpus
+        self.process: Optional[mp.Process] = None
+        self.conn = None
+        self.segment: Optional[shared_memory.SharedMemory] = None
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.batches = 0
+        self.restarts = 0
+        self.transfer_time = 0.0
+        self.ring_frames = 0
+        self.copied_frames = 0
+        self.torn_frames = 0
+
+    def start(self):
+        context = mp.get_context("spawn")
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_inference_worker,
+            args=(child_conn, self.cpus, config.TORCH_THREADS),
+            name="inference-process",
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        logger.info(f"🧠 Inference process started (pid {self.process.pid})")
+
+    def _buffer(self, size: int) -> shared_memory.SharedMemory:
+        """Shared segment large enough for a batch, grown on demand"""
+        if self.segment is None or self.segment.size < size:
+            self._release_segment()
+            self.segment = shared_memory.SharedMemory(create=True, size=size)
+        return self.segment
+
+    def _release_segment(self):
+        if self.segment is not None:
+            self.segment.close()
+            self.segment.unlink()
+            self.segment = None
+
+    def detect(self, detector: VehicleDetector, frames: List[np.ndarray]) -> List[np.ndarray]:
+        """
+        Detect vehicles in the child process
+
+        Args:
+            detector: Parent detector, whose configuration is mirrored and
+                whose statistics are updated
+            frames: BGR frames
+
+        Returns:
+            Structured detections array per frame
+        """
+        start_time = time.time()
+        with self._lock:
+            if self.process is None or not self.process.is_alive():
+                if self.process is not None:
+                    self.restarts += 1
+                    logger.warning("⚠️  Inference process exited, restarting")
+                self.start()
+
+            # Ring frames go by reference, everything else through the copy segment
+            located = [SharedFrameRing.find(frame) for frame in frames]
+            copied = [frame for frame, found in zip(frames, located) if found is None]
+            segment = self._buffer(sum(frame.nbytes for frame in copied)) if copied else None
+
+            layout = []
+            offset = 0
+            for frame, found in zip(frames, located):
+                if found is not None:
+                    ring, slot = found
+                    layout.append(("ring", ring.spec, slot, ring.sequence(slot)))
+                    continue
+                np.ndarray(frame.shape, np.uint8, segment.buf, offset)[...] = frame
+                layout.append(("copy", offset, frame.shape))
+                offset += frame.nbytes
+            self.transfer_time += time.time() - start_time
+            self.ring_frames += len(frames) - len(copied)
+            self.copied_frames += len(copied)
+
+            detector.apply_pending_config()
+            backend = detector.backend
+            spec = (backend.name, str(backend.model_path), detector.device, detector.input_size)
+            settings = {name: getattr(config, name) for name in SYNCED_SETTINGS}
+            try:
+                self.conn.send(("detect", segment.name if segment else None, layout, spec, settings))
+                status, payload, _, torn, stage_times = self.conn.recv()
+            except (EOFError, OSError) as e:
+                raise RuntimeError(f"Inference process failed: {e}")
+
+        if status != "ok":
+            raise RuntimeError(f"Inference process error: {payload}")
+
+        self.batches += 1
+        self.torn_frames += torn
+        detector.record_batch(len(frames), time.time() - start_time, payload, stage_times)
+        return payload
+
+    def stop(self):
+        """Stop the child and free the shared segment"""
+        with self._lock:
+            if self.process is not None and self.process.is_alive():
+                try:
+                    self.conn.send(("stop",))
+                except OSError:
+                    pass
+                self.process.join(timeout=5.0)
+                if self.process.is_alive():
+                    self.process.terminate()
+            self.process = None
+            self._release_segment()
+
+    def get_stats(self) -> dict:
+        """Get inference process statistics"""
+        return {
+            "pid": self.process.pid if self.process is not None else None,
+            "alive": self.process is not None and self.process.is_alive(),
+            "batches": self.batches,
+            "restarts": self.restarts,
+            "avg_transfer_time": self.transfer_time / self.batches if self.batches else 0.0,
+            "ring_frames": self.ring_frames,
+            "copied_frames": self.copied_frames,
+            "torn_frames": self.torn_frames,
+            "shared_memory_bytes": self.segment.size if self.segment is not None else 0
+        }
+
+
+# Created on first use, shared by every source
+_executors: Dict[str, StageExecutor] = {}
+_inference_process: Optional[InferenceProcess] = None
+
+
+def get_executor(stage: str) -> StageExecutor:
+    """Executor for a stage, created from config on first use"""
+    executor = _executors.get(stage)
+    if executor is None:
+        if stage == STAGE_INFERENCE:
+            workers, cpus = config.INFERENCE_WORKERS, parse_cpus(config.INFERENCE_CPUS)
+            if not config.INFERENCE_PROCESS:
+                configure_torch_threads(cpus)
+        elif stage == STAGE_ENCODE:
+            workers, cpus = config.ENCODE_WORKERS, parse_cpus(config.ENCODE_CPUS)
+        else:
+            raise ValueError(f"Unknown executor stage: {stage}")
+        executor = StageExecutor(stage, workers, cpus)
+        _executors[stage] = executor
+        logger.info(f"🧵 {stage} executor: {executor.workers} worker(s)" + (f" on CPUs {sorted(cpus)}" if cpus else ""))
+    return executor
+
+
+async def run_inference(detector: VehicleDetector, frames: List[np.ndarray]) -> List[np.ndarray]:
+    """Detect on the inference executor, in the inference process when enabled"""
+    global _inference_process
+    executor = get_executor(STAGE_INFERENCE)
+    if not config.INFERENCE_PROCESS:
+        return await executor.run(detector.detect_vehicles, frames)
+
+    if _inference_process is None:
+        _inference_process = InferenceProcess(parse_cpus(config.INFERENCE_CPUS))
+    return await executor.run(_inference_process.detect, detector, frames)
+
+
+def shutdown_executors():
+    """Stop every pool and the inference process"""
+    global _inference_process
+    for executor in _executors.values():
+        executor.shutdown()
+    _executors.clear()
+    if _inference_process is not None:
+        _inference_process.stop()
+        _inference_process = None
+
+
+def get_executor_stats() -> dict:
+    """Utilization of every stage executor"""
+    stats = {stage: executor.get_stats() for stage, executor in _executors.items()}
+    stats["inference_process"] = _inference_process.get_stats() if _inference_process else None
+    return stats
\ No newline at end of file
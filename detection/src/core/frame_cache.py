@@ -0,0 +1,157 @@
+"""
+Encoded frame cache shared by all subscribers
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+import threading
+from typing import Callable, Dict, Iterable, NamedTuple, Optional, Tuple, Union
+import cv2
+import numpy as np
+
+from config.settings import get_config
+from src.core.protocol import PROTOCOL_JSON, VIEW_ANNOTATED, VIEW_BOXES, build_payload
+
+config = get_config()
+
+Payload = Union[str, bytes]
+
+
+class StreamOptions(NamedTuple):
+    """What a subscriber wants to receive"""
+    format: str = PROTOCOL_JSON
+    quality: Optional[int] = None  # None = cache default (config.JPEG_QUALITY unless degraded)
+    width: Optional[int] = None  # None = native resolution
+    view: str = VIEW_ANNOTATED
+
+
+class EncodedFrameCache:
+    """
+    Encodes each frame variant at most once and shares the result
+
+    Entries are keyed by (frame_count, view, quality, resolution, format).
+    Annotation runs lazily once per frame and only when an annotated variant
+    is requested, JPEG encodes are shared between formats of the same view,
+    quality and resolution, and everything is evicted as soon as a newer
+    frame is set.
+    """
+
+    def __init__(
+        self,
+        annotate: Callable[[np.ndarray, np.ndarray], np.ndarray],
+        get_class_names: Callable[[], Dict[int, str]]
+    ):
+        self.annotate = annotate
+        self.get_class_names = get_class_names  # read per payload, so labels follow a backend switch
+        self.default_quality = config.JPEG_QUALITY  # Lowered by the quality controller under load
+        self._lock = threading.Lock()
+
+        self.frame_id: Optional[int] = None
+        self.frame: Optional[np.ndarray] = None
+        self.detections: Optional[np.ndarray] = None
+        self.metadata: dict = {}
+        self._annotated: Optional[np.ndarray] = None
+        self._jpegs: Dict[Tuple, bytes] = {}
+        self._payloads: Dict[Tuple, Payload] = {}
+
+        # Statistics
+        self.encodes = 0
+        self.annotations = 0
+        self.hits = 0
+        self.evictions = 0
+
+    def set_frame(self, frame_id: int, frame: np.ndarray, detections: np.ndarray, metadata: dict):
+        """Make frame the current one, evicting every variant of the previous frame"""
+        with self._lock:
+            self.evictions += len(self._jpegs) + len(self._payloads)
+            self._jpegs = {}
+            self._payloads = {}
+            self._annotated = None
+            self.frame_id = frame_id
+            self.frame = frame
+            self.detections = detections
+            self.metadata = metadata
+
+    def _source_frame(self, view: str) -> np.ndarray:
+        """Frame to encode for a view, annotating on first use"""
+        if view != VIEW_ANNOTATED:
+            return self.frame
+        if self._annotated is None:
+            self._annotated = self.annotate(self.frame, self.detections)
+            self.annotations += 1
+        return self._annotated
+
+    def _encode_jpeg(self, view: str, quality: int, width: Optional[int]) -> bytes:
+        """Encode the current frame for a view, optionally downscaled to width"""
+        key = (self.frame_id, view, quality, width)
+        jpeg = self._jpegs.get(key)
+        if jpeg is not None:
+            return jpeg
+
+        frame = self._source_frame(view)
+        if width and width < frame.shape[1]:
+            height = int(round(frame.shape[0] * width / frame.shape[1]))
+            frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+
+        encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+        _, buffer = cv2.imencode('.jpg', frame, encode_params)
+        jpeg = buffer.tobytes()
+        self._jpegs[key] = jpeg
+        self.encodes += 1
+        return jpeg
+
+    def get(self, options: StreamOptions) -> Optional[Payload]:
+        """
+        Get the payload for a variant of the current frame
+
+        Args:
+            options: Requested view, format, quality and resolution
+
+        Returns:
+            Immutable payload shared with every subscriber of this variant
+        """
+        if options.view == VIEW_BOXES:
+            quality, width = None, None  # No image in this view
+        else:
+            quality, width = options.quality or self.default_quality, options.width
+
+        with self._lock:
+            if self.frame is None:
+                return None
+
+            key = (self.frame_id, options.view, quality, width, options.format)
+            payload = self._payloads.get(key)
+            if payload is not None:
+                self.hits += 1
+                return payload
+
+            jpeg = None
+            if options.view != VIEW_BOXES:
+                jpeg = self._encode_jpeg(options.view, quality, width)
+
+            payload = build_payload(
+                options.view, options.format, jpeg, self.detections, self.metadata, self.get_class_names()
+            )
+            self._payloads[key] = payload
+            return payload
+
+    def get_many(self, variants: Iterable[StreamOptions]) -> Dict[StreamOptions, Payload]:
+        """Get payloads for the variants requested by a set of subscribers"""
+        payloads = {}
+        for options in variants:
+            if options in payloads:
+                self.hits += 1  # Shared with an earlier subscriber
+                continue
+            payloads[options] = self.get(options)
+        return payloads
+
+    def get_stats(self) -> dict:
+        """Get cache statistics"""
+        return {
+            "frame_id": self.frame_id,
+            "cached_variants": len(self._payloads),
+            "encodes": self.encodes,
+            "annotations": self.annotations,
+            "hits": self.hits,
+            "evictions": self.evictions
+        }
@@ -0,0 +1,220 @@
+"""
+Region-of-interest masks and motion gating in front of the detector
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+from typing import List, Optional, Sequence, Tuple
+import cv2
+import numpy as np
+
+from config.settings import get_config
+from src.utils.logging_config import get_logger
+
+config = get_config()
+logger = get_logger("motion")
+
+Polygon = Sequence[Sequence[float]]
+
+MOTION_DIFF = "diff"  # Difference against the last frame sent to detection
+MOTION_MOG2 = "mog2"  # Background subtraction
+MOTION_METHODS = (MOTION_DIFF, MOTION_MOG2)
+
+
+def small_grey(frame: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    """Downscaled greyscale copy of a BGR frame, for cheap change detection"""
+    return cv2.cvtColor(cv2.resize(frame, size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+
+
+class RegionOfInterest:
+    """
+    Polygons of a camera view that matter for detection
+
+    Points are pixels, or fractions of the frame size when every
+    coordinate is <= 1. The mask is rasterized lazily for the first frame
+    seen and rebuilt if the resolution changes.
+    """
+
+    def __init__(self, polygons: List[Polygon]):
+        self.polygons = [np.asarray(polygon, dtype=np.float64).reshape(-1, 2) for polygon in polygons]
+        self.normalized = all((polygon <= 1.0).all() for polygon in self.polygons)
+        self.shape: Optional[Tuple[int, int]] = None
+        self.mask: Optional[np.ndarray] = None
+        self.bbox: Tuple[int, int, int, int] = (0, 0, 0, 0)  # x1, y1, x2, y2 (exclusive)
+
+    def _build(self, shape: Tuple[int, int]):
+        height, width = shape
+        scale = np.array([width, height]) if self.normalized else np.ones(2)
+        points = [np.round(polygon * scale).astype(np.int32) for polygon in self.polygons]
+
+        self.mask = np.zeros((height, width), dtype=np.uint8)
+        cv2.fillPoly(self.mask, points, 255)
+        x, y, w, h = cv2.boundingRect(cv2.findNonZero(self.mask)) if self.mask.any() else (0, 0, width, height)
+        self.bbox = (x, y, x + w, y + h)
+        self.shape = shape
+
+    def mask_for(self, frame: np.ndarray) -> np.ndarray:
+        """Full-resolution mask (255 inside) for a frame"""
+        if frame.shape[:2] != self.shape:
+            self._build(frame.shape[:2])
+        return self.mask
+
+    def crop(self, frame: np.ndarray) -> np.ndarray:
+        """View of the frame limited to the ROI bounding box"""
+        self.mask_for(frame)
+        x1, y1, x2, y2 = self.bbox
+        return frame[y1:y2, x1:x2]
+
+    def to_frame(self, detections: np.ndarray, cropped: bool) -> np.ndarray:
+        """
+        Map detections back to full-frame coordinates and keep those centred inside the ROI
+
+        Args:
+            detections: Structured detections from the (possibly cropped) frame
+            cropped: Whether the detector saw the crop
+
+        Returns:
+            Detections in frame coordinates
+        """
+        if cropped and len(detections):
+            detections = detections.copy()
+            x1, y1 = self.bbox[:2]
+            detections["x1"] += x1
+            detections["x2"] += x1
+            detections["y1"] += y1
+            detections["y2"] += y1
+
+        if not len(detections):
+            return detections
+
+        height, width = self.shape
+        cx = np.clip(((detections["x1"] + detections["x2"]) / 2).astype(np.int32), 0, width - 1)
+        cy = np.clip(((detections["y1"] + detections["y2"]) / 2).astype(np.int32), 0, height - 1)
+        return detections[self.mask[cy, cx] > 0]
+
+    def get_stats(self) -> dict:
+        return {
+            "polygons": [polygon.tolist() for polygon in self.polygons],
+            "bbox": list(self.bbox),
+            "coverage": float(self.mask.mean() / 255) if self.mask is not None else None
+        }
+
+
+class MotionGate:
+    """
+    Cheap per-frame check for motion inside the ROI
+
+    Frames are compared at low resolution, by difference against the
+    last frame sent to detection (see mark_detected) or by MOG2 background
+    subtraction. A frame counts as moving when more than min_area of the
+    ROI pixels changed, so slow changes add up until they trigger a
+    detection. After max_reuse static frames refresh_due() asks for a
+    detection anyway.
+    """
+
+    def __init__(
+        self,
+        roi: Optional[RegionOfInterest] = None,
+        method: str = config.MOTION_METHOD,
+        min_area: float = config.MOTION_MIN_AREA,
+        pixel_threshold: int = config.MOTION_PIXEL_THRESHOLD,
+        max_reuse: int = config.MOTION_MAX_REUSE
+    ):
+        if method not in MOTION_METHODS:
+            raise ValueError(f"Unknown motion method: {method}. Use: {', '.join(MOTION_METHODS)}")
+        self.roi = roi
+        self.method = method
+        self.min_area = min_area
+        self.pixel_threshold = pixel_threshold
+        self.max_reuse = max_reuse
+
+        self._reference: Optional[np.ndarray] = None  # last frame sent to detection
+        self._latest: Optional[np.ndarray] = None  # last frame checked
+        self.reused = 0  # static frames since the last detection
+        self._small_mask: Optional[np.ndarray] = None
+        self._mask_shape: Optional[Tuple[int, ...]] = None
+        self._subtractor = None
+
+        # Statistics
+        self.frames_checked = 0
+        self.frames_static = 0
+        self.forced_refreshes = 0
+        self.last_motion = 0.0
+
+    def _roi_mask(self, frame: np.ndarray) -> Optional[np.ndarray]:
+        """ROI mask at motion resolution, None for the whole frame"""
+        if self.roi is None:
+            return None
+        if frame.shape[:2] != self._mask_shape:
+            mask = self.roi.mask_for(frame)
+            self._small_mask = cv2.resize(mask, config.MOTION_SIZE, interpolation=cv2.INTER_NEAREST) > 0
+            self._mask_shape = frame.shape[:2]
+        return self._small_mask
+
+    def has_motion(self, frame: np.ndarray) -> bool:
+        """
+        Check a frame for motion inside the ROI
+
+        Args:
+            frame: BGR frame, in capture order
+
+        Returns:
+            False when the frame can reuse the previous detections
+        """
+        self.frames_checked += 1
+        grey = cv2.GaussianBlur(small_grey(frame, config.MOTION_SIZE), (5, 5), 0)
+        self._latest = grey
+
+        if self.method == MOTION_MOG2:
+            if self._subtractor is None:
+                self._subtractor = cv2.createBackgroundSubtractorMOG2(detectShadows=False)
+            changed = self._subtractor.apply(grey) > 0
+        else:
+            if self._reference is None:
+                self.last_motion = 1.0
+                return True
+            changed = cv2.absdiff(grey, self._reference) > self.pixel_threshold
+
+        mask = self._roi_mask(frame)
+        if mask is not None:
+            changed = changed & mask
+            area = max(int(mask.sum()), 1)
+        else:
+            area = changed.size
+
+        self.last_motion = float(changed.sum()) / area
+        if self.last_motion > self.min_area:
+            return True
+
+        self.reused += 1
+        if not self._reuse_exhausted():
+            self.frames_static += 1  # refresh_due() sends the others to detection
+        return False
+
+    def _reuse_exhausted(self) -> bool:
+        return 0 < self.max_reuse < self.reused
+
+    def refresh_due(self) -> bool:
+        """True when a static frame should be detected anyway, after max_reuse reused frames"""
+        if not self._reuse_exhausted():
+            return False
+        self.forced_refreshes += 1
+        return True
+
+    def mark_detected(self):
+        """The frame last passed to has_motion goes to the detector and becomes the reference"""
+        self._reference = self._latest
+        self.reused = 0
+
+    def get_stats(self) -> dict:
+        """Get gating statistics"""
+        return {
+            "method": self.method,
+            "min_area": self.min_area,
+            "frames_checked": self.frames_checked,
+            "frames_static": self.frames_static,
+            "skip_rate": self.frames_static / self.frames_checked if self.frames_checked else 0.0,
+            "forced_refreshes": self.forced_refreshes,
+            "last_motion": self.last_motion,
+            "roi": self.roi.get_stats() if self.roi else None
+        }
\ No newline at end of file
@@ -0,0 +1,96 @@
+"""
+Pipeline primitives for concurrent broadcast stages
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+import asyncio
+from collections import deque
+from typing import Any, Deque, Optional
+
+from src.utils.helpers import PerformanceTracker
+from src.utils.metrics import SOURCE_STAGE_SECONDS
+
+
+class DropOldestQueue:
+    """Bounded asyncio queue that drops the oldest item instead of blocking"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = max(1, maxsize)
+        self._items: Deque[Any] = deque()
+        self._not_empty = asyncio.Event()
+        self.dropped = 0
+
+    def put_nowait(self, item: Any):
+        """Add item, evicting the oldest one when the queue is full"""
+        if len(self._items) >= self.maxsize:
+            self._items.popleft()
+            self.dropped += 1
+        self._items.append(item)
+        self._not_empty.set()
+
+    def get_nowait(self) -> Optional[Any]:
+        """Pop the oldest item or return None when empty"""
+        if not self._items:
+            return None
+        return self._items.popleft()
+
+    async def get(self) -> Any:
+        """Wait for and pop the oldest item"""
+        while not self._items:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        return self._items.popleft()
+
+    async def get_with_timeout(self, timeout: float) -> Optional[Any]:
+        """Wait up to timeout seconds for an item"""
+        if self._items:
+            return self._items.popleft()
+        try:
+            return await asyncio.wait_for(self.get(), timeout=max(0.0, timeout))
+        except asyncio.TimeoutError:
+            return None
+
+    def clear(self):
+        """Drop everything currently queued"""
+        self._items.clear()
+
+    def qsize(self) -> int:
+        return len(self._items)
+
+
+class PipelineStage:
+    """Bookkeeping for one stage: its input queue and service times"""
+
+    def __init__(self, name: str, queue_size: Optional[int] = None, source_id: Optional[str] = None):
+        self.name = name
+        self.input_queue = DropOldestQueue(queue_size) if queue_size else None
+        self.tracker = PerformanceTracker()
+        self.latency = SOURCE_STAGE_SECONDS.labels(source_id, name) if source_id is not None else None
+        self.processed = 0
+
+    def record(self, service_time: float, items: int = 1):
+        """Record the time spent handling a unit of work"""
+        self.tracker.add_sample(service_time, items, items)
+        self.processed += items
+        if self.latency is not None:
+            self.latency.observe(service_time)
+
+    def get_stats(self) -> dict:
+        """Get stage statistics"""
+        tracker_stats = self.tracker.get_stats()
+        stats = {
+            "processed": self.processed,
+            "avg_service_time": tracker_stats["avg_time"],
+            "max_service_time": tracker_stats["max_time"],
+            "p95_service_time": tracker_stats["p95_time"],
+            "throughput": tracker_stats["fps"],
+            "avg_items": tracker_stats["avg_count"]
+        }
+        if self.input_queue:
+            stats.update({
+                "queue_depth": self.input_queue.qsize(),
+                "queue_capacity": self.input_queue.maxsize,
+                "dropped": self.input_queue.dropped
+            })
+        return stats
@@ -0,0 +1,138 @@
+"""
+Letterbox preprocessing into reusable batch buffers
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+from typing import List, NamedTuple, Optional, Tuple
+import cv2
+import numpy as np
+import torch
+
+from src.utils.logging_config import get_logger
+
+logger = get_logger("preprocess")
+
+PAD_VALUE = 114  # Same grey as the ultralytics letterbox
+
+
+class LetterboxTransform(NamedTuple):
+    """Mapping between original frame and letterboxed model input"""
+    scale: float
+    pad_x: int
+    pad_y: int
+    resized_width: int
+    resized_height: int
+
+    @classmethod
+    def for_shape(cls, frame_shape: Tuple[int, ...], input_size: int) -> "LetterboxTransform":
+        """Compute the aspect-preserving fit of a frame into a square input"""
+        height, width = frame_shape[:2]
+        scale = min(input_size / height, input_size / width)
+        resized_width = int(round(width * scale))
+        resized_height = int(round(height * scale))
+        pad_x = (input_size - resized_width) // 2
+        pad_y = (input_size - resized_height) // 2
+        return cls(scale, pad_x, pad_y, resized_width, resized_height)
+
+    def boxes_to_frame(self, boxes: np.ndarray) -> np.ndarray:
+        """Map (N, 4) xyxy boxes from model input back to frame coordinates, in place"""
+        boxes -= np.array([self.pad_x, self.pad_y, self.pad_x, self.pad_y], dtype=boxes.dtype)
+        boxes /= self.scale
+        return boxes
+
+
+class LetterboxPreprocessor:
+    """
+    Letterboxes frames straight into a preallocated uint8 batch buffer
+
+    The buffer is reused across calls (pinned when CUDA is present) and
+    padding is only repainted when a slot's geometry changes, so steady
+    state preprocessing is one resize per frame and no allocations.
+    """
+
+    def __init__(self, input_size: int, device: str, max_batch: int = 1):
+        self.device = device
+        self.input_size = input_size
+        self.host_buffer: Optional[torch.Tensor] = None
+        self._host_array: Optional[np.ndarray] = None
+        self._slot_transforms: List[Optional[LetterboxTransform]] = []
+        self._allocate(input_size, max_batch)
+
+    def _allocate(self, input_size: int, batch: int):
+        """(Re)allocate the host buffer"""
+        self.input_size = input_size
+        self.host_buffer = torch.empty(
+            (batch, input_size, input_size, 3),
+            dtype=torch.uint8,
+            pin_memory=torch.cuda.is_available()
+        )
+        self._host_array = self.host_buffer.numpy()
+        self._host_array.fill(PAD_VALUE)
+        self._slot_transforms = [None] * batch
+        logger.debug(f"Allocated letterbox buffer: {batch}x{input_size}x{input_size}")
+
+    def _ensure_capacity(self, input_size: int, batch: int):
+        """Grow or resize the buffer when the batch or input size changes"""
+        if input_size != self.input_size or batch > len(self._slot_transforms):
+            self._allocate(input_size, max(batch, len(self._slot_transforms)))
+
+    def letterbox_into(self, frame: np.ndarray, slot: int) -> LetterboxTransform:
+        """
+        Letterbox one frame into a buffer slot
+
+        Args:
+            frame: BGR frame of any size
+            slot: Batch index to write
+
+        Returns:
+            Transform for mapping boxes back to the frame
+        """
+        transform = LetterboxTransform.for_shape(frame.shape, self.input_size)
+        target = self._host_array[slot]
+
+        # Repaint padding only when the geometry of this slot changed
+        if transform != self._slot_transforms[slot]:
+            target.fill(PAD_VALUE)
+            self._slot_transforms[slot] = transform
+
+        region = target[
+            transform.pad_y:transform.pad_y + transform.resized_height,
+            transform.pad_x:transform.pad_x + transform.resized_width
+        ]
+        if frame.shape[:2] == region.shape[:2]:
+            np.copyto(region, frame)
+        else:
+            resized = cv2.resize(
+                frame,
+                (transform.resized_width, transform.resized_height),
+                dst=region,
+                interpolation=cv2.INTER_LINEAR
+            )
+            if not np.shares_memory(resized, target):
+                np.copyto(region, resized)
+
+        return transform
+
+    def prepare_batch(
+        self,
+        frames: List[np.ndarray],
+        input_size: int
+    ) -> Tuple[torch.Tensor, List[LetterboxTransform]]:
+        """
+        Letterbox frames and build a model-ready tensor
+
+        Args:
+            frames: BGR frames
+            input_size: Square model input size
+
+        Returns:
+            Tuple of (float RGB BCHW tensor in [0, 1], per-frame transforms)
+        """
+        self._ensure_capacity(input_size, len(frames))
+        transforms = [self.letterbox_into(frame, slot) for slot, frame in enumerate(frames)]
+
+        batch = self.host_buffer[:len(frames)].to(self.device, non_blocking=True)
+        # BHWC BGR uint8 -> BCHW RGB float (new tensor, so the buffer can be reused)
+        batch = batch.permute(0, 3, 1, 2).flip(1)
+        return batch.float().div_(255.0), transforms
@@ -0,0 +1,242 @@
+"""
+WebSocket frame protocols
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+import base64
+import json
+import struct
+from typing import Dict, Optional
+import numpy as np
+
+# Protocol identifiers
+PROTOCOL_JSON = "json"
+PROTOCOL_BINARY = "binary"
+PROTOCOLS = (PROTOCOL_JSON, PROTOCOL_BINARY)
+
+# Sec-WebSocket-Protocol values accepted during the /ws handshake
+WS_SUBPROTOCOLS = {
+    "vd.json.v1": PROTOCOL_JSON,
+    "vd.binary.v1": PROTOCOL_BINARY
+}
+
+# Stream views
+VIEW_ANNOTATED = "annotated"  # JPEG with boxes drawn by the server (legacy)
+VIEW_RAW = "raw"  # Clean JPEG plus boxes, drawn by the client
+VIEW_BOXES = "boxes"  # Boxes only, no image
+VIEWS = (VIEW_ANNOTATED, VIEW_RAW, VIEW_BOXES)
+
+# Binary frame header, little endian:
+#   magic, version, flags, header_size, vehicleCount, timestamp, frameCount,
+#   avgDetectionTime, detectionFps, broadcastFps
+# then, if FLAG_BOXES, a box block (count, frame width, frame height,
+# count * BOX_DTYPE records), then, if FLAG_IMAGE, the raw JPEG bytes
+BINARY_MAGIC = b"VDF1"
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct("<4sBBHIdIfff")
+BOX_BLOCK_HEADER = struct.Struct("<IHH")
+
+FLAG_IMAGE = 0x01
+FLAG_BOXES = 0x02
+FLAG_ANNOTATED = 0x04
+
+# Box record on the wire: x1, y1, x2, y2, confidence, class_id
+BOX_DTYPE = np.dtype([
+    ("x1", "<f4"),
+    ("y1", "<f4"),
+    ("x2", "<f4"),
+    ("y2", "<f4"),
+    ("confidence", "<f4"),
+    ("class_id", "<i4")
+])
+
+
+def negotiate_protocol(subprotocol: Optional[str], requested: Optional[str] = None) -> str:
+    """
+    Pick the frame protocol for a client
+
+    Args:
+        subprotocol: Negotiated Sec-WebSocket-Protocol value, if any
+        requested: Explicit ?protocol= query parameter, if any
+
+    Returns:
+        PROTOCOL_JSON or PROTOCOL_BINARY
+    """
+    if requested:
+        requested = requested.lower()
+        if requested not in PROTOCOLS:
+            raise ValueError(f"Unknown protocol: {requested}. Use: {', '.join(PROTOCOLS)}")
+        return requested
+    return WS_SUBPROTOCOLS.get(subprotocol, PROTOCOL_JSON)
+
+
+def negotiate_view(requested: Optional[str] = None) -> str:
+    """Pick the stream view for a client (annotated unless asked otherwise)"""
+    if not requested:
+        return VIEW_ANNOTATED
+    requested = requested.lower()
+    if requested not in VIEWS:
+        raise ValueError(f"Unknown view: {requested}. Use: {', '.join(VIEWS)}")
+    return requested
+
+
+def pack_binary_frame(
+    jpeg: Optional[bytes],
+    vehicle_count: int,
+    timestamp: float,
+    frame_count: int,
+    avg_detection_time: float,
+    detection_fps: float,
+    broadcast_fps: float,
+    flags: int = FLAG_IMAGE,
+    boxes: Optional[np.ndarray] = None,
+    frame_size: tuple = (0, 0)
+) -> bytes:
+    """Build a binary frame: compact header, optional box block, optional JPEG"""
+    parts = [BINARY_HEADER.pack(
+        BINARY_MAGIC,
+        BINARY_VERSION,
+        flags,
+        BINARY_HEADER.size,
+        vehicle_count,
+        timestamp,
+        frame_count,
+        avg_detection_time,
+        detection_fps,
+        broadcast_fps
+    )]
+
+    if flags & FLAG_BOXES:
+        records = _box_records(boxes)
+        parts.append(BOX_BLOCK_HEADER.pack(len(records), *frame_size))
+        parts.append(records.tobytes())
+
+    if flags & FLAG_IMAGE:
+        parts.append(bytes(jpeg))
+
+    return b"".join(parts)
+
+
+def _box_records(boxes: Optional[np.ndarray]) -> np.ndarray:
+    """Wire records for detections, dropping fields the binary format does not carry"""
+    if boxes is None:
+        return np.empty(0, BOX_DTYPE)
+    if boxes.dtype.names == BOX_DTYPE.names:
+        return boxes.astype(BOX_DTYPE, copy=False)
+    records = np.empty(len(boxes), BOX_DTYPE)
+    for name in BOX_DTYPE.names:
+        records[name] = boxes[name]
+    return records
+
+
+def _frame_size(metadata: dict) -> tuple:
+    return tuple(metadata.get("frameSize", (0, 0)))
+
+
+def _box_labels(detections: np.ndarray, class_names: Dict[int, str]) -> Dict[str, str]:
+    """Names for the class ids present in detections"""
+    return {
+        str(cls_id): class_names.get(cls_id, str(cls_id))
+        for cls_id in np.unique(detections["class_id"]).tolist()
+    }
+
+
+def build_payload(
+    view: str,
+    protocol: str,
+    jpeg: Optional[bytes],
+    detections: np.ndarray,
+    metadata: dict,
+    class_names: Dict[int, str]
+):
+    """
+    Build the message for one (view, protocol) combination
+
+    Args:
+        view: VIEW_ANNOTATED, VIEW_RAW or VIEW_BOXES
+        protocol: PROTOCOL_JSON or PROTOCOL_BINARY
+        jpeg: Encoded image, None for the boxes view
+        detections: Structured detections for the frame
+        metadata: Per-frame metadata
+        class_names: Class id to name mapping
+
+    Returns:
+        str for JSON, bytes for binary
+    """
+    with_boxes = view in (VIEW_RAW, VIEW_BOXES)
+
+    if protocol == PROTOCOL_BINARY:
+        flags = 0
+        if jpeg is not None:
+            flags |= FLAG_IMAGE
+        if with_boxes:
+            flags |= FLAG_BOXES
+        if view == VIEW_ANNOTATED:
+            flags |= FLAG_ANNOTATED
+
+        performance = metadata["performance"]
+        return pack_binary_frame(
+            jpeg,
+            metadata["vehicleCount"],
+            metadata["timestamp"],
+            metadata["frameCount"],
+            performance["avgDetectionTime"],
+            performance["detectionFps"],
+            performance["broadcastFps"],
+            flags=flags,
+            boxes=detections if with_boxes else None,
+            frame_size=_frame_size(metadata)
+        )
+
+    # JSON: legacy base64 JPEG document, optionally with boxes
+    message = {"view": view}
+    if jpeg is not None:
+        message["image"] = base64.b64encode(jpeg).decode('utf-8')
+    if with_boxes:
+        columns = [detections[name].astype(np.float64) for name in ("x1", "y1", "x2", "y2", "confidence")]
+        message["boxes"] = np.round(np.stack(columns, axis=1), 3).tolist() if len(detections) else []
+        message["classIds"] = detections["class_id"].tolist()
+        message["classes"] = _box_labels(detections, class_names)
+        if "track_id" in detections.dtype.names:
+            message["trackIds"] = detections["track_id"].tolist()
+    message.update(metadata)
+    return json.dumps(message)
+
+
+def unpack_binary_frame(data: bytes) -> dict:
+    """Parse a binary frame (reference decoder for clients)"""
+    (
+        magic, version, flags, header_size, vehicle_count, timestamp,
+        frame_count, avg_detection_time, detection_fps, broadcast_fps
+    ) = BINARY_HEADER.unpack_from(data)
+
+    if magic != BINARY_MAGIC:
+        raise ValueError("Not a vehicle detection binary frame")
+
+    frame = {
+        "version": version,
+        "flags": flags,
+        "annotated": bool(flags & FLAG_ANNOTATED),
+        "vehicleCount": vehicle_count,
+        "timestamp": timestamp,
+        "frameCount": frame_count,
+        "performance": {
+            "avgDetectionTime": avg_detection_time,
+            "detectionFps": detection_fps,
+            "broadcastFps": broadcast_fps
+        }
+    }
+
+    offset = header_size
+    if flags & FLAG_BOXES:
+        count, width, height = BOX_BLOCK_HEADER.unpack_from(data, offset)
+        offset += BOX_BLOCK_HEADER.size
+        frame["boxes"] = np.frombuffer(data, dtype=BOX_DTYPE, count=count, offset=offset)
+        frame["frameSize"] = (width, height)
+        offset += count * BOX_DTYPE.itemsize
+
+    if flags & FLAG_IMAGE:
+        frame["image"] = memoryview(data)[offset:]
+
+    return frame
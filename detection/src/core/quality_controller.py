@@ -0,0 +1,240 @@
+"""
+Closed-loop quality controller: trades model size, resolution and FPS under load
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, List, NamedTuple, Optional
+import numpy as np
+
+from config.settings import get_config
+from src.utils.logging_config import get_logger
+from src.core.backends import InferenceBackend, create_backend
+from src.core.detector import VehicleDetector
+
+config = get_config()
+logger = get_logger("quality")
+
+
+class QualityLevel(NamedTuple):
+    """One rung of the quality ladder (0 is the best quality)"""
+    index: int
+    input_size: int
+    model: Optional[str]  # None = model chosen by DeviceOptimizer
+    frame_skip: int  # Run detection on every Nth frame
+    jpeg_quality: int
+
+    @classmethod
+    def from_dict(cls, index: int, data: dict) -> "QualityLevel":
+        return cls(
+            index=index,
+            input_size=int(data.get("input_size") or config.INPUT_SIZE),
+            model=data.get("model"),
+            frame_skip=max(1, int(data.get("frame_skip", 1))),
+            jpeg_quality=int(data.get("jpeg_quality") or config.JPEG_QUALITY)
+        )
+
+
+def _p95(samples: List[float]) -> float:
+    return float(np.percentile(samples, 95)) if samples else 0.0
+
+
+class QualityController:
+    """
+    Steps down the quality ladder when latency SLOs are missed and back up
+    when there is sustained headroom
+
+    Each evaluation looks at recent inference and encode latency, frames
+    dropped in front of inference and the achieved broadcast FPS of every
+    source that has subscribers. Changes are rate limited by a cooldown,
+    and stepping up needs several healthy evaluations in a row, so the
+    controller does not oscillate around a threshold.
+    """
+
+    def __init__(self, detector: VehicleDetector, broadcasters: Dict):
+        self.detector = detector
+        self.broadcasters = broadcasters  # Live view of the registry's sources
+        self.ladder = [QualityLevel.from_dict(i, rung) for i, rung in enumerate(config.QUALITY_LADDER)]
+        self.level = self.ladder[0]
+        self.enabled = config.QUALITY_CONTROL
+
+        # Backends per ladder model, the benchmark winner under None
+        self._backends: Dict[Optional[str], InferenceBackend] = {None: detector.backend}
+
+        self.healthy_streak = 0
+        self.last_change = 0.0
+        self.last_observation: dict = {}
+        self._dropped: Dict[str, int] = {}
+        self.decisions: Deque[dict] = deque(maxlen=50)
+        self.task: Optional[asyncio.Task] = None
+
+    def observe(self) -> Optional[dict]:
+        """
+        Collect load signals from every source with subscribers
+
+        Returns:
+            Worst-case observation, or None when nobody is watching
+        """
+        window = config.QUALITY_WINDOW
+        inference_times, encode_times, fps_ratios = [], [], []
+        dropped = 0
+
+        for source_id, broadcaster in self.broadcasters.items():
+            inference_drops = broadcaster.stages["inference"].input_queue.dropped
+            dropped += inference_drops - self._dropped.get(source_id, inference_drops)
+            self._dropped[source_id] = inference_drops
+
+            if not broadcaster.clients:
+                continue
+            inference_times.extend(broadcaster.stages["inference"].tracker.recent_times(window))
+            encode_times.extend(broadcaster.stages["encode"].tracker.recent_times(window))
+            fps_ratios.append(broadcaster.broadcast_tracker.fps / broadcaster.target_fps)
+
+        if not fps_ratios:
+            return None
+
+        return {
+            "inference_p95": _p95(inference_times),
+            "encode_p95": _p95(encode_times),
+            "fps_ratio": min(fps_ratios),
+            "dropped": dropped
+        }
+
+    def violations(self, observation: dict, margin: float = 1.0) -> List[str]:
+        """
+        SLOs missed by an observation
+
+        Args:
+            observation: Output of observe()
+            margin: Fraction of the latency SLOs to test against (< 1 tests
+                for headroom; FPS is capped at the target so it is not scaled)
+        """
+        missed = []
+        if observation["inference_p95"] > config.QUALITY_SLO_INFERENCE * margin:
+            missed.append(f"inference p95 {observation['inference_p95'] * 1000:.0f}ms")
+        if observation["encode_p95"] > config.QUALITY_SLO_ENCODE * margin:
+            missed.append(f"encode p95 {observation['encode_p95'] * 1000:.0f}ms")
+        if observation["fps_ratio"] < config.QUALITY_SLO_FPS_RATIO:
+            missed.append(f"fps at {observation['fps_ratio']:.0%} of target")
+        if observation["dropped"] > 0:
+            missed.append(f"{observation['dropped']} frames dropped before inference")
+        return missed
+
+    def decide(self, observation: Optional[dict], now: float) -> Optional[QualityLevel]:
+        """
+        Pick the next level for an observation
+
+        Returns:
+            Level to switch to, or None to hold
+        """
+        self.last_observation = observation or {}
+        if observation is None:
+            self.healthy_streak = 0
+            return None
+
+        cooling = now - self.last_change < config.QUALITY_COOLDOWN
+        missed = self.violations(observation)
+
+        if missed:
+            self.healthy_streak = 0
+            if not cooling and self.level.index < len(self.ladder) - 1:
+                return self._record(self.ladder[self.level.index + 1], "down", missed, observation, now)
+            return None
+
+        if self.violations(observation, config.QUALITY_HEADROOM):
+            self.healthy_streak = 0  # Within SLO, but not enough headroom to step up
+            return None
+
+        self.healthy_streak += 1
+        if (
+            not cooling
+            and self.level.index > 0
+            and self.healthy_streak >= config.QUALITY_UPGRADE_HOLD
+        ):
+            self.healthy_streak = 0
+            return self._record(self.ladder[self.level.index - 1], "up", ["headroom"], observation, now)
+        return None
+
+    def _record(self, level: QualityLevel, direction: str, reasons: List[str], observation: dict, now: float):
+        self.last_change = now
+        self.decisions.append({
+            "time": now,
+            "direction": direction,
+            "from": self.level.index,
+            "to": level.index,
+            "reasons": reasons,
+            "observation": observation
+        })
+        return level
+
+    def _backend_for(self, model: Optional[str]) -> InferenceBackend:
+        """Backend for a ladder model, built once with the winner's runtime and device"""
+        backend = self._backends.get(model)
+        if backend is None:
+            base = self._backends[None]
+            backend = create_backend(base.name, config.MODEL_PATHS[0].parent / model, base.device)
+            self._backends[model] = backend
+        return backend
+
+    async def apply(self, level: QualityLevel):
+        """Push a level to the detector and every broadcaster"""
+        loop = asyncio.get_event_loop()
+        try:
+            backend = await loop.run_in_executor(None, self._backend_for, level.model)
+        except Exception as e:
+            logger.warning(f"⚠️  Ladder model {level.model} unavailable, keeping current model: {e}")
+            backend = self.detector.backend
+
+        # Applied by the inference thread before its next batch
+        self.detector.request_config(backend=backend, input_size=level.input_size)
+        for broadcaster in self.broadcasters.values():
+            broadcaster.set_quality(level.frame_skip, level.jpeg_quality)
+
+        logger.info(
+            f"🎚️  Quality level {self.level.index} -> {level.index}: input {level.input_size}, "
+            f"model {backend.model_name}, skip {level.frame_skip}, JPEG {level.jpeg_quality}"
+        )
+        self.level = level
+
+    async def run(self):
+        """Evaluate load and adjust quality every QUALITY_EVAL_INTERVAL"""
+        logger.info(f"🎚️  Quality controller started ({len(self.ladder)} levels)")
+        try:
+            while True:
+                await asyncio.sleep(config.QUALITY_EVAL_INTERVAL)
+                level = self.decide(self.observe(), time.time())
+                if level is not None:
+                    await self.apply(level)
+        except asyncio.CancelledError:
+            pass
+
+    def start(self):
+        """Start the control loop"""
+        if self.enabled and len(self.ladder) > 1 and (self.task is None or self.task.done()):
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Stop the control loop"""
+        if self.task and not self.task.done():
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+    def get_stats(self) -> dict:
+        """Current level, SLOs and recent decisions"""
+        return {
+            "enabled": self.enabled,
+            "level": self.level._asdict(),
+            "ladder": [level._asdict() for level in self.ladder],
+            "slo": {
+                "inference_p95": config.QUALITY_SLO_INFERENCE,
+                "encode_p95": config.QUALITY_SLO_ENCODE,
+                "fps_ratio": config.QUALITY_SLO_FPS_RATIO
+            },
+            "healthy_streak": self.healthy_streak,
+            "last_change": self.last_change,
+            "last_observation": self.last_observation,
+            "decisions": list(self.decisions)
+        }
\ No newline at end of file
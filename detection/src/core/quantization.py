@@ -0,0 +1,329 @@
+"""
+INT8 model quantization and accuracy-vs-speed evaluation
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+import json
+import time
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple
+import cv2
+import numpy as np
+
+from config.settings import get_config
+from src.utils.logging_config import get_logger
+from src.core.backends import (
+    BACKEND_ONNXRUNTIME,
+    OnnxRuntimeBackend,
+    export_model,
+    exported_model_path
+)
+from src.core.detector import VehicleDetector
+from src.core.preprocess import LetterboxPreprocessor
+
+try:
+    from onnxruntime.quantization import (
+        CalibrationDataReader,
+        CalibrationMethod,
+        QuantFormat,
+        QuantType,
+        quantize_dynamic,
+        quantize_static
+    )
+except ImportError:  # Optional, only needed to build quantized models
+    CalibrationDataReader = object
+    quantize_dynamic = quantize_static = None
+
+config = get_config()
+logger = get_logger("quantization")
+
+QUANT_DYNAMIC = "dynamic"
+QUANT_STATIC = "static"
+QUANT_MODES = (QUANT_DYNAMIC, QUANT_STATIC)
+
+
+class QuantizedModel(NamedTuple):
+    """A registered INT8 variant of an FP32 checkpoint"""
+    path: Path
+    base_model: str
+    mode: str
+    count_agreement: float
+    fp32_latency: float
+    int8_latency: float
+    calibration_frames: int
+    created_at: float
+
+    @property
+    def speedup(self) -> float:
+        return self.fp32_latency / self.int8_latency if self.int8_latency > 0 else 0.0
+
+    @property
+    def accuracy_loss(self) -> float:
+        return 1.0 - self.count_agreement
+
+    def to_dict(self) -> dict:
+        return {
+            "path": self.path.name,
+            "base_model": self.base_model,
+            "mode": self.mode,
+            "count_agreement": self.count_agreement,
+            "fp32_latency": self.fp32_latency,
+            "int8_latency": self.int8_latency,
+            "speedup": self.speedup,
+            "calibration_frames": self.calibration_frames,
+            "created_at": self.created_at
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict, model_dir: Path) -> "QuantizedModel":
+        return cls(
+            path=model_dir / data["path"],
+            base_model=data["base_model"],
+            mode=data["mode"],
+            count_agreement=data["count_agreement"],
+            fp32_latency=data["fp32_latency"],
+            int8_latency=data["int8_latency"],
+            calibration_frames=data["calibration_frames"],
+            created_at=data["created_at"]
+        )
+
+
+def load_quantized_models(manifest: Path = config.QUANTIZED_MODELS_MANIFEST) -> List[QuantizedModel]:
+    """Read the registered INT8 models, skipping entries whose file is gone"""
+    if not manifest.exists():
+        return []
+    try:
+        with open(manifest) as f:
+            entries = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"⚠️  Unreadable quantized model manifest {manifest}: {e}")
+        return []
+
+    models = [QuantizedModel.from_dict(entry, manifest.parent) for entry in entries]
+    return [model for model in models if model.path.exists()]
+
+
+def register_quantized_model(model: QuantizedModel, manifest: Path = config.QUANTIZED_MODELS_MANIFEST):
+    """Add or replace a model in the manifest"""
+    models = [m for m in load_quantized_models(manifest) if m.path != model.path]
+    models.append(model)
+    with open(manifest, "w") as f:
+        json.dump([m.to_dict() for m in models], f, indent=2)
+    logger.info(f"📝 Registered {model.path.name} in {manifest.name}")
+
+
+def _read_video_frames(video_path: Path, indices: List[int]) -> List[np.ndarray]:
+    """Decode the frames at the given (sorted) indices"""
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        raise FileNotFoundError(f"Cannot open video: {video_path}")
+
+    wanted = set(indices)
+    frames = []
+    index = 0
+    while len(frames) < len(wanted):
+        ret = cap.grab()
+        if not ret:
+            break
+        if index in wanted:
+            ret, frame = cap.retrieve()
+            if ret:
+                frames.append(frame)
+        index += 1
+    cap.release()
+
+    if not frames:
+        raise ValueError(f"No frames read from {video_path}")
+    return frames
+
+
+def _video_frame_count(video_path: Path) -> int:
+    """Frame count reported by the container (0 when unknown)"""
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        raise FileNotFoundError(f"Cannot open video: {video_path}")
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return total
+
+
+def _spread(total: int, count: int) -> List[int]:
+    """Indices of `count` positions spread evenly over range(total)"""
+    return sorted({i * total // count for i in range(count)})
+
+
+def sample_video_frames(video_path: Path, count: int) -> List[np.ndarray]:
+    """
+    Take frames spread evenly over a video
+
+    Args:
+        video_path: Video to sample
+        count: Number of frames
+
+    Returns:
+        BGR frames
+    """
+    total = _video_frame_count(video_path) or count
+    return _read_video_frames(video_path, _spread(total, min(count, total)))
+
+
+def split_video_frames(video_path: Path, calibration_count: int,
+                       eval_count: int) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+    """
+    Take disjoint calibration and evaluation frame sets, both spread over the video
+
+    Args:
+        video_path: Video to sample
+        calibration_count: Number of calibration frames
+        eval_count: Number of held-out evaluation frames
+
+    Returns:
+        (calibration frames, evaluation frames)
+
+    Raises:
+        ValueError: The video has too few frames for two disjoint sets
+    """
+    total = _video_frame_count(video_path)
+    needed = calibration_count + eval_count
+    if total < needed:
+        raise ValueError(
+            f"{video_path} has {total} frames, {needed} needed for disjoint "
+            f"calibration ({calibration_count}) and evaluation ({eval_count}) sets"
+        )
+
+    indices = _spread(total, needed)
+    eval_positions = set(_spread(needed, eval_count))
+    frames = _read_video_frames(video_path, indices)
+    if len(frames) < needed:
+        raise ValueError(f"Only {len(frames)} of {needed} frames decoded from {video_path}")
+
+    calibration = [frame for i, frame in enumerate(frames) if i not in eval_positions]
+    evaluation = [frame for i, frame in enumerate(frames) if i in eval_positions]
+    return calibration, evaluation
+
+
+class FrameCalibrationReader(CalibrationDataReader):
+    """Feeds letterboxed video frames to static quantization calibration"""
+
+    def __init__(self, frames: List[np.ndarray], input_name: str):
+        preprocessor = LetterboxPreprocessor(config.INPUT_SIZE, "cpu")
+        self.batches = [
+            preprocessor.prepare_batch([frame], config.INPUT_SIZE)[0].numpy()
+            for frame in frames
+        ]
+        self.input_name = input_name
+        self._iterator = iter(self.batches)
+
+    def get_next(self) -> Optional[dict]:
+        batch = next(self._iterator, None)
+        return None if batch is None else {self.input_name: batch}
+
+    def rewind(self):
+        self._iterator = iter(self.batches)
+
+
+def quantize_model(
+    model_path: Path,
+    mode: str,
+    calibration_frames: Optional[List[np.ndarray]] = None
+) -> Path:
+    """
+    Build an INT8 ONNX variant of a checkpoint
+
+    Args:
+        model_path: FP32 .pt checkpoint (exported to ONNX when needed)
+        mode: QUANT_DYNAMIC (weights only) or QUANT_STATIC (weights and activations)
+        calibration_frames: Frames for static activation ranges
+
+    Returns:
+        Path of the quantized model
+    """
+    if quantize_dynamic is None:
+        raise RuntimeError("onnxruntime quantization tools are not installed")
+    if mode not in QUANT_MODES:
+        raise ValueError(f"Unknown quantization mode: {mode}. Use: {', '.join(QUANT_MODES)}")
+
+    fp32_path = exported_model_path(model_path, BACKEND_ONNXRUNTIME)
+    if not fp32_path.exists():
+        fp32_path = export_model(model_path, BACKEND_ONNXRUNTIME)
+
+    output_path = model_path.with_name(f"{model_path.stem}.int8-{mode}.onnx")
+    logger.info(f"⚙️  Quantizing {fp32_path.name} ({mode}) -> {output_path.name}")
+
+    if mode == QUANT_DYNAMIC:
+        quantize_dynamic(str(fp32_path), str(output_path), weight_type=QuantType.QInt8)
+    else:
+        if not calibration_frames:
+            raise ValueError("Static quantization needs calibration frames")
+        input_name = OnnxRuntimeBackend(fp32_path).input_name
+        quantize_static(
+            str(fp32_path),
+            str(output_path),
+            FrameCalibrationReader(calibration_frames, input_name),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+            calibrate_method=CalibrationMethod.MinMax
+        )
+
+    return output_path
+
+
+def _vehicle_counts(backend: OnnxRuntimeBackend, frames: List[np.ndarray]) -> tuple:
+    """Per-frame vehicle counts and mean per-frame latency of a backend"""
+    detector = VehicleDetector(backend, "cpu")
+    detector.batch_sizer.enabled = False
+    detector.detect_vehicles(frames[:1])  # Warmup
+
+    counts = []
+    start_time = time.time()
+    for frame in frames:
+        counts.append(len(detector.detect_vehicles([frame])[0]))
+    latency = (time.time() - start_time) / len(frames)
+    return np.array(counts), latency
+
+
+def evaluate_quantized_model(
+    model_path: Path,
+    quantized_path: Path,
+    mode: str,
+    eval_frames: List[np.ndarray],
+    calibration_frames: int = 0
+) -> QuantizedModel:
+    """
+    Compare an INT8 model against its FP32 export on the same frames
+
+    Count agreement is 1 - sum(|int8 - fp32|) / sum(fp32) over per-frame
+    vehicle counts, so 1.0 means every frame has the same number of vehicles.
+
+    Args:
+        model_path: FP32 .pt checkpoint
+        quantized_path: INT8 ONNX model
+        mode: Quantization mode used
+        eval_frames: Held-out frames
+        calibration_frames: Number of calibration frames used
+
+    Returns:
+        Evaluated model, ready to register
+    """
+    fp32_backend = OnnxRuntimeBackend(exported_model_path(model_path, BACKEND_ONNXRUNTIME))
+    int8_backend = OnnxRuntimeBackend(quantized_path)
+
+    fp32_counts, fp32_latency = _vehicle_counts(fp32_backend, eval_frames)
+    int8_counts, int8_latency = _vehicle_counts(int8_backend, eval_frames)
+
+    total = max(int(fp32_counts.sum()), 1)
+    agreement = max(0.0, 1.0 - float(np.abs(int8_counts - fp32_counts).sum()) / total)
+
+    return QuantizedModel(
+        path=quantized_path,
+        base_model=model_path.name,
+        mode=mode,
+        count_agreement=agreement,
+        fp32_latency=fp32_latency,
+        int8_latency=int8_latency,
+        calibration_frames=calibration_frames,
+        created_at=time.time()
+    )
\ No newline at end of file
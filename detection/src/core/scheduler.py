@@ -0,0 +1,227 @@
+"""
+Shared inference scheduling across video sources
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+import asyncio
+import time
+from typing import Dict, List, Optional, Set, Tuple
+import numpy as np
+
+from config.settings import get_config
+from src.utils.logging_config import AGGREGATE, get_logger
+from src.utils.helpers import PerformanceTracker
+from src.core.detector import DETECTION_DTYPE, VehicleDetector
+from src.core.executors import run_inference
+
+config = get_config()
+logger = get_logger("scheduler")
+
+
+class InferenceScheduler:
+    """Batches frames from many sources into shared forward passes"""
+
+    def __init__(self, detector: VehicleDetector):
+        self.detector = detector
+
+        # One outstanding request per source: (frames, future, submitted_at)
+        self.pending: Dict[str, Tuple[List[np.ndarray], asyncio.Future, float]] = {}
+        self.sources: List[str] = []
+        self.idle_sources: Set[str] = set()
+        self._next_source = 0
+        self._wakeup: Optional[asyncio.Event] = None
+
+        # Per-source fairness accounting
+        self.frames_served: Dict[str, int] = {}
+        self.wait_trackers: Dict[str, PerformanceTracker] = {}
+        self.batch_tracker = PerformanceTracker()
+
+        self.is_running = False
+        self.task: Optional[asyncio.Task] = None
+
+    def register_source(self, source_id: str):
+        """Register a source taking part in round-robin scheduling"""
+        if source_id not in self.sources:
+            self.sources.append(source_id)
+            self.frames_served[source_id] = 0
+            self.wait_trackers[source_id] = PerformanceTracker()
+            logger.info(f"📷 Source registered with scheduler: {source_id}")
+
+    def unregister_source(self, source_id: str):
+        """Remove a source from scheduling"""
+        if source_id in self.sources:
+            self.sources.remove(source_id)
+            self.idle_sources.discard(source_id)
+            self._next_source = 0
+
+    def set_source_idle(self, source_id: str, idle: bool):
+        """Exclude idle sources from batch sizing"""
+        if idle:
+            self.idle_sources.add(source_id)
+        else:
+            self.idle_sources.discard(source_id)
+
+    @property
+    def active_sources(self) -> int:
+        """Number of sources currently producing frames"""
+        return max(1, len(self.sources) - len(self.idle_sources))
+
+    @property
+    def capacity(self) -> int:
+        """
+        Frames per combined batch
+        
+        At least one request per active source, so sources share a forward
+        pass even when the detector batch size is 1 (CPU).
+        """
+        return max(self.detector.batch_size, self.active_sources)
+
+    def source_batch_size(self) -> int:
+        """Frames each source should submit so combined batches match the detector"""
+        return max(1, self.detector.batch_size // self.active_sources)
+
+    async def submit(self, source_id: str, frames: List[np.ndarray]) -> List[np.ndarray]:
+        """
+        Queue frames for detection and wait for their results
+
+        Args:
+            source_id: Submitting source
+            frames: Frames from that source
+
+        Returns:
+            Detections array per frame
+        """
+        self.register_source(source_id)
+        future = asyncio.get_running_loop().create_future()
+
+        # A newer request supersedes one that has not been scheduled yet
+        previous = self.pending.get(source_id)
+        if previous and not previous[1].done():
+            previous[1].set_result([np.empty(0, dtype=DETECTION_DTYPE) for _ in previous[0]])
+
+        self.pending[source_id] = (frames, future, time.time())
+        if self._wakeup:
+            self._wakeup.set()
+        return await future
+
+    def _collect_batch(self) -> List[Tuple[str, List[np.ndarray], asyncio.Future]]:
+        """Pick pending requests round-robin until the combined batch is full"""
+        capacity = self.capacity
+        batch = []
+        total = 0
+
+        for offset in range(len(self.sources)):
+            source_id = self.sources[(self._next_source + offset) % len(self.sources)]
+            request = self.pending.get(source_id)
+            if request is None:
+                continue
+
+            frames, future, submitted_at = request
+            if batch and total + len(frames) > capacity:
+                continue
+
+            del self.pending[source_id]
+            self.wait_trackers[source_id].add_sample(time.time() - submitted_at)
+            batch.append((source_id, frames, future))
+            total += len(frames)
+            if total >= capacity:
+                break
+
+        # Start the next round after the first source served this time
+        if batch:
+            self._next_source = (self.sources.index(batch[0][0]) + 1) % len(self.sources)
+
+        return batch
+
+    async def run(self):
+        """Scheduling loop"""
+        logger.info("🚀 Starting inference scheduler")
+        self.is_running = True
+        self._wakeup = asyncio.Event()
+        try:
+            while self.is_running:
+                if not self.pending:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+
+                # Give other sources a moment to join this batch
+                if len(self.pending) < self.active_sources and config.SCHEDULER_BATCH_WINDOW > 0:
+                    await asyncio.sleep(config.SCHEDULER_BATCH_WINDOW)
+
+                batch = self._collect_batch()
+                if not batch:
+                    continue
+
+                frames = [frame for _, source_frames, _ in batch for frame in source_frames]
+                start_time = time.time()
+
+                try:
+                    detections = await run_inference(self.detector, frames)
+                except Exception as e:
+                    logger.error(f"🚨 Scheduled detection failed: {e}", extra=AGGREGATE)
+                    for _, _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+
+                self.batch_tracker.add_sample(time.time() - start_time, len(frames), len(frames))
+
+                # Hand each source its slice of the batch
+                index = 0
+                for source_id, source_frames, future in batch:
+                    size = len(source_frames)
+                    self.frames_served[source_id] += size
+                    if not future.done():
+                        future.set_result(detections[index:index + size])
+                    index += size
+
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.is_running = False
+            for frames, future, _ in self.pending.values():
+                if not future.done():
+                    future.cancel()
+            self.pending.clear()
+            logger.info("🛑 Inference scheduler stopped")
+
+    def start(self):
+        """Start the scheduling loop"""
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Stop the scheduling loop"""
+        self.is_running = False
+        if self.task and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    def get_stats(self) -> dict:
+        """Get scheduling statistics"""
+        batch_stats = self.batch_tracker.get_stats()
+        return {
+            "sources": len(self.sources),
+            "idle_sources": sorted(self.idle_sources),
+            "detector_batch_size": self.detector.batch_size,
+            "capacity": self.capacity,
+            "source_batch_size": self.source_batch_size(),
+            "pending_requests": len(self.pending),
+            "batches": {
+                "avg_time": batch_stats["avg_time"],
+                "avg_frames": batch_stats["avg_count"],
+                "fps": batch_stats["fps"]
+            },
+            "per_source": {
+                source_id: {
+                    "frames_served": self.frames_served.get(source_id, 0),
+                    "avg_wait": self.wait_trackers[source_id].average_time
+                }
+                for source_id in self.sources
+            }
+        }
@@ -0,0 +1,226 @@
+"""
+Shared-memory ring buffer of video frames between processes
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Tuple
+import weakref
+import cv2
+import numpy as np
+
+from src.utils.logging_config import get_logger
+
+logger = get_logger("shared_ring")
+
+HEADER_ALIGN = 64
+
+
+class _SlotLease:
+    """
+    Owner of a leased slot's frame view
+
+    NumPy makes this object the base of the view and of every array
+    derived from it (crops, reshapes), so the slot is released only
+    when the last of them is collected.
+    """
+
+    def __init__(self, ring: "SharedFrameRing", slot: int):
+        frame = ring.frames[slot]
+        self.__array_interface__ = frame.__array_interface__
+        self._frame = frame  # Keeps the mapping alive
+        self._ring = ring
+        self.slot = slot
+
+    def __del__(self):
+        self._ring.release(self.slot)
+
+
+class SharedFrameRing:
+    """
+    Fixed number of preallocated HxWx3 uint8 frame slots in one shared segment
+
+    A single writer fills free slots round-robin and stamps each with a
+    sequence number; readers in any process map the same segment and
+    use frames in place. A slot's sequence is -1 while it is being
+    written, so a reader can check that a frame it holds has not been
+    overwritten (is_current) before trusting the result.
+
+    Written slots stay leased to the reading side until lease() hands the
+    frame out and every array viewing it is gone, so frames in use
+    downstream are never overwritten. When all slots are leased write()
+    returns None and the writer waits: a ring smaller than the frames in
+    flight slows decoding down instead of corrupting frames.
+
+    Header layout (int64): [last sequence, sequence of slot 0, slot 1, ...,
+    lease of slot 0, slot 1, ...]
+    """
+
+    # Rings mapped in this process, for locate()
+    _mapped: Dict[str, "SharedFrameRing"] = {}
+
+    def __init__(self, slots: int, height: int, width: int, name: Optional[str] = None):
+        """
+        Args:
+            slots: Number of frame slots
+            height: Frame height
+            width: Frame width
+            name: Existing segment to attach to (None = create a new one)
+        """
+        self.slots = max(1, slots)
+        self.shape = (height, width, 3)
+        self.frame_bytes = height * width * 3
+        self.data_offset = -(-8 * (2 * self.slots + 1) // HEADER_ALIGN) * HEADER_ALIGN
+        self.owner = name is None
+
+        size = self.data_offset + self.slots * self.frame_bytes
+        self.segment = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        self.name = self.segment.name
+
+        self.header = np.ndarray((2 * self.slots + 1,), np.int64, self.segment.buf, 0)
+        self.leases = self.header[self.slots + 1:]
+        self.frames = np.ndarray((self.slots,) + self.shape, np.uint8, self.segment.buf, self.data_offset)
+        self._base = self.frames.ctypes.data
+        self._cursor = 0
+        self._held: "weakref.WeakValueDictionary[int, _SlotLease]" = weakref.WeakValueDictionary()
+        if self.owner:
+            self.header[:] = 0
+        SharedFrameRing._mapped[self.name] = self
+
+        # Statistics (writer side)
+        self.resized = 0
+
+    @classmethod
+    def attach(cls, name: str, slots: int, height: int, width: int) -> "SharedFrameRing":
+        """Map a ring created by another process (cached per process)"""
+        ring = cls._mapped.get(name)
+        if ring is None:
+            ring = cls(slots, height, width, name=name)
+        return ring
+
+    @property
+    def spec(self) -> Tuple[str, int, int, int]:
+        """Arguments for attach() in another process"""
+        return self.name, self.slots, self.shape[0], self.shape[1]
+
+    @property
+    def last_sequence(self) -> int:
+        return int(self.header[0])
+
+    def write(self, frame: np.ndarray) -> Optional[Tuple[int, int]]:
+        """
+        Copy a frame into the next free slot (single writer only)
+
+        Frames of another size are resized to the slot size. The slot
+        stays leased until the reading side releases it.
+
+        Returns:
+            Tuple of (slot, sequence), None while every slot is leased
+        """
+        for offset in range(self.slots):
+            slot = (self._cursor + offset) % self.slots
+            if not self.leases[slot]:
+                break
+        else:
+            return None
+        self._cursor = (slot + 1) % self.slots
+
+        sequence = int(self.header[0]) + 1
+        self.leases[slot] = 1
+        self.header[slot + 1] = -1
+        if frame.shape == self.shape:
+            self.frames[slot] = frame
+        else:
+            cv2.resize(frame, (self.shape[1], self.shape[0]), dst=self.frames[slot], interpolation=cv2.INTER_AREA)
+            self.resized += 1
+        self.header[slot + 1] = sequence
+        self.header[0] = sequence
+        return slot, sequence
+
+    def read(self, slot: int, sequence: int) -> Optional[np.ndarray]:
+        """Frame in a slot as a zero-copy view, None if it was already overwritten"""
+        if not self.is_current(slot, sequence):
+            return None
+        return self.frames[slot]
+
+    def lease(self, slot: int, sequence: int) -> Optional[np.ndarray]:
+        """
+        Take over a written slot's lease (reading side, one process only)
+
+        Returns:
+            Zero-copy view that frees the slot once it and every array
+            derived from it are collected, None if the slot was overwritten
+        """
+        if not self.is_current(slot, sequence):
+            return None
+        lease = _SlotLease(self, slot)
+        self._held[slot] = lease
+        return np.asarray(lease)
+
+    def release(self, slot: int):
+        """Hand a slot back to the writer, e.g. for a written frame that is discarded"""
+        if self.header is not None:
+            self.leases[slot] = 0
+
+    def reclaim(self) -> int:
+        """
+        Release written slots no lease() view holds, after a writer restart
+
+        Returns:
+            Number of slots released
+        """
+        stale = [slot for slot in range(self.slots) if self.leases[slot] and slot not in self._held]
+        for slot in stale:
+            self.release(slot)
+        return len(stale)
+
+    def is_current(self, slot: int, sequence: int) -> bool:
+        """True while the slot still holds the given sequence"""
+        return int(self.header[slot + 1]) == sequence
+
+    def sequence(self, slot: int) -> int:
+        return int(self.header[slot + 1])
+
+    def locate(self, frame: np.ndarray) -> Optional[int]:
+        """Slot a whole-frame view of this ring points at, None for other arrays"""
+        if frame.shape != self.shape or frame.dtype != np.uint8:
+            return None
+        offset = frame.ctypes.data - self._base
+        if offset < 0 or offset % self.frame_bytes or offset // self.frame_bytes >= self.slots:
+            return None
+        return offset // self.frame_bytes
+
+    @classmethod
+    def find(cls, frame: np.ndarray) -> Optional[Tuple["SharedFrameRing", int]]:
+        """Ring and slot holding a frame, among rings mapped in this process"""
+        for ring in cls._mapped.values():
+            slot = ring.locate(frame)
+            if slot is not None:
+                return ring, slot
+        return None
+
+    def close(self):
+        """Unmap the ring; the creating process also frees the segment"""
+        SharedFrameRing._mapped.pop(self.name, None)
+        self.header = None
+        self.leases = None
+        self.frames = None
+        try:
+            self.segment.close()
+        except BufferError:
+            # Frames still referenced downstream keep the mapping alive until collected
+            logger.debug(f"🧹 Ring {self.name} still has live frames, unmapping later")
+        if self.owner:
+            self.segment.unlink()
+
+    def get_stats(self) -> dict:
+        return {
+            "name": self.name,
+            "slots": self.slots,
+            "frame_shape": list(self.shape),
+            "bytes": self.segment.size,
+            "last_sequence": self.last_sequence if self.header is not None else None,
+            "leased_slots": int(self.leases.sum()) if self.leases is not None else None,
+            "resized_writes": self.resized
+        }
\ No newline at end of file
@@ -0,0 +1,209 @@
+"""
+Video source registry for multi-camera ingest
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from config.settings import get_config
+from src.utils.logging_config import get_logger
+from src.utils.metrics import REGISTRY, MetricFamily
+from src.core.detector import VehicleDetector
+from src.core.broadcaster import VideoBroadcaster
+from src.core.scheduler import InferenceScheduler
+from src.core.quality_controller import QualityController
+from src.core.executors import get_executor_stats, shutdown_executors
+
+config = get_config()
+logger = get_logger("sources")
+
+
+def resolve_source_path(path: str) -> Union[str, int]:
+    """Map a configured source path to a cv2.VideoCapture argument"""
+    path = str(path)
+    if path.isdigit():
+        return int(path)  # Local camera index
+    return path
+
+
+def is_source_available(path: Union[str, int]) -> bool:
+    """Check that file sources exist; streams and devices are checked on open"""
+    if isinstance(path, int) or "://" in path:
+        return True
+    return Path(path).exists()
+
+
+class SourceRegistry:
+    """Owns one broadcaster per video source, all sharing one detector"""
+
+    def __init__(self, detector: VehicleDetector, device: str):
+        self.detector = detector
+        self.device = device
+        self.scheduler = InferenceScheduler(detector)
+        self.broadcasters: Dict[str, VideoBroadcaster] = {}
+        self.quality_controller = QualityController(detector, self.broadcasters)
+        REGISTRY.add_collector(self.collect_metrics)
+
+    def add_source(
+        self,
+        source_id: str,
+        path: str,
+        fps: Optional[int] = None,
+        roi: Optional[List] = None,
+        roi_crop: bool = False
+    ) -> VideoBroadcaster:
+        """
+        Register and open a video source
+
+        Args:
+            source_id: Camera identifier used in /ws/{camera_id}
+            path: File path, stream URL or camera index
+            fps: Per-source FPS target (defaults to config.TARGET_FPS)
+            roi: Region of interest polygons (None = whole frame)
+            roi_crop: Detect on the ROI bounding box instead of the full frame
+
+        Returns:
+            Broadcaster for the source
+        """
+        if source_id in self.broadcasters:
+            raise ValueError(f"Source already registered: {source_id}")
+
+        capture_path = resolve_source_path(path)
+        if not is_source_available(capture_path):
+            raise FileNotFoundError(f"Video source not found: {path}")
+
+        broadcaster = VideoBroadcaster(
+            capture_path,
+            self.detector,
+            self.device,
+            source_id=source_id,
+            target_fps=fps,
+            scheduler=self.scheduler,
+            roi=roi,
+            roi_crop=roi_crop
+        )
+        self.broadcasters[source_id] = broadcaster
+        self.scheduler.register_source(source_id)
+
+        logger.info(f"📷 Source added: {source_id} -> {path}")
+        return broadcaster
+
+    def load_from_config(self):
+        """Register every source listed in config.VIDEO_SOURCES"""
+        for source_id, source in config.VIDEO_SOURCES.items():
+            try:
+                self.add_source(
+                    source_id,
+                    source["path"],
+                    source.get("fps"),
+                    roi=source.get("roi"),
+                    roi_crop=source.get("roi_crop", False)
+                )
+            except Exception as e:
+                logger.error(f"❌ Failed to add source {source_id}: {e}")
+
+    def get(self, source_id: str) -> Optional[VideoBroadcaster]:
+        """Get broadcaster for a source"""
+        return self.broadcasters.get(source_id)
+
+    @property
+    def default(self) -> Optional[VideoBroadcaster]:
+        """Default source broadcaster (first registered if no explicit default)"""
+        if config.DEFAULT_SOURCE_ID in self.broadcasters:
+            return self.broadcasters[config.DEFAULT_SOURCE_ID]
+        return next(iter(self.broadcasters.values()), None)
+
+    def start(self):
+        """Start the scheduler, every source and the quality controller"""
+        self.scheduler.start()
+        for broadcaster in self.broadcasters.values():
+            broadcaster.start()
+        self.quality_controller.start()
+
+    async def stop(self):
+        """Stop the quality controller, every source, the scheduler and the stage executors"""
+        await self.quality_controller.stop()
+        for broadcaster in self.broadcasters.values():
+            await broadcaster.stop()
+        await self.scheduler.stop()
+        shutdown_executors()
+        REGISTRY.remove_collector(self.collect_metrics)
+
+    def __len__(self) -> int:
+        return len(self.broadcasters)
+
+    def collect_metrics(self) -> List[MetricFamily]:
+        """Counters and gauges read from the sources when /metrics is scraped"""
+        frames = MetricFamily("vehicle_detection_frames", "counter", "Frames captured", ("source",))
+        skipped = MetricFamily(
+            "vehicle_detection_inference_skipped_frames", "counter",
+            "Frames that reused earlier detections instead of running inference", ("source",)
+        )
+        dropped = MetricFamily(
+            "vehicle_detection_dropped_frames", "counter",
+            "Frames dropped by a full stage or client queue", ("source", "stage")
+        )
+        depth = MetricFamily("vehicle_detection_queue_depth", "gauge", "Items waiting in a stage queue", ("source", "stage"))
+        clients = MetricFamily("vehicle_detection_clients", "gauge", "Connected stream clients", ("source",))
+        backlog = MetricFamily(
+            "vehicle_detection_client_backlog", "gauge", "Messages waiting in a client send queue", ("source", "client")
+        )
+        fps = MetricFamily("vehicle_detection_broadcast_fps", "gauge", "Frames broadcast per second", ("source",))
+
+        for source_id, broadcaster in self.broadcasters.items():
+            frames.add((source_id,), broadcaster.frame_count)
+            skipped.add((source_id,), broadcaster.skipped_frames)
+            clients.add((source_id,), len(broadcaster.clients))
+            fps.add((source_id,), broadcaster.broadcast_tracker.fps)
+            for name, stage in broadcaster.stages.items():
+                if stage.input_queue:
+                    dropped.add((source_id, name), stage.input_queue.dropped)
+                    depth.add((source_id, name), stage.input_queue.qsize())
+            sessions = list(broadcaster.sessions.values())
+            dropped.add(
+                (source_id, "client"),
+                broadcaster.closed_client_drops + sum(session.frames_dropped for session in sessions)
+            )
+            for session in sessions:
+                backlog.add((source_id, session.client_id), session.queue.qsize())
+
+        model = self.detector.backend.model_name
+        batch_size = MetricFamily("vehicle_detection_batch_size", "gauge", "Current inference batch size", ("model",))
+        batch_size.add((model,), self.detector.batch_size)
+        pending = MetricFamily("vehicle_detection_scheduler_pending", "gauge", "Inference requests waiting for a batch")
+        pending.add((), len(self.scheduler.pending))
+        utilization = MetricFamily(
+            "vehicle_detection_executor_utilization", "gauge", "Busy fraction of a stage executor", ("executor",)
+        )
+        for stage, stats in get_executor_stats().items():
+            if stats and "utilization" in stats:
+                utilization.add((stage,), stats["utilization"])
+        quality = MetricFamily("vehicle_detection_quality_level", "gauge", "Index of the current quality ladder level")
+        quality.add((), self.quality_controller.ladder.index(self.quality_controller.level))
+
+        return [frames, skipped, dropped, depth, clients, backlog, fps, batch_size, pending, utilization, quality]
+
+    def get_stats(self) -> dict:
+        """Get per-source and scheduler statistics"""
+        return {
+            "sources": {
+                source_id: {
+                    "path": str(broadcaster.video_path),
+                    "target_fps": broadcaster.target_fps,
+                    "frame_count": broadcaster.frame_count,
+                    "current_vehicles": broadcaster.vehicle_count,
+                    "clients": len(broadcaster.clients),
+                    "is_running": broadcaster.is_running,
+                    "broadcast_fps": broadcaster.broadcast_tracker.fps,
+                    "motion_skip_rate": (
+                        broadcaster.motion_gate.get_stats()["skip_rate"] if broadcaster.motion_gate else None
+                    )
+                }
+                for source_id, broadcaster in self.broadcasters.items()
+            },
+            "scheduler": self.scheduler.get_stats(),
+            "executors": get_executor_stats(),
+            "quality": self.quality_controller.get_stats()
+        }
@@ -0,0 +1,310 @@
+"""
+Vehicle tracking between detections
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+import itertools
+from typing import List, Optional, Tuple
+import cv2
+import numpy as np
+
+from config.settings import get_config
+from src.core.detector import DETECTION_DTYPE
+from src.core.motion import small_grey
+
+config = get_config()
+
+# Detections with a persistent per-vehicle identity
+TRACK_DTYPE = np.dtype(DETECTION_DTYPE.descr + [("track_id", np.int32)])
+
+# Frames are compared at this size for the scene motion check
+MOTION_SIZE = (64, 36)
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IOU between (N, 4) and (M, 4) xyxy boxes"""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+
+def greedy_match(iou: np.ndarray, threshold: float) -> Tuple[List[Tuple[int, int]], List[int], List[int]]:
+    """
+    Match rows to columns by descending IOU
+
+    Returns:
+        Tuple of (matches, unmatched rows, unmatched columns)
+    """
+    matches = []
+    if iou.size:
+        rows, cols = np.unravel_index(np.argsort(-iou, axis=None), iou.shape)
+        used_rows, used_cols = set(), set()
+        for row, col in zip(rows.tolist(), cols.tolist()):
+            if iou[row, col] < threshold:
+                break
+            if row in used_rows or col in used_cols:
+                continue
+            matches.append((row, col))
+            used_rows.add(row)
+            used_cols.add(col)
+    matched_rows = {row for row, _ in matches}
+    matched_cols = {col for _, col in matches}
+    return (
+        matches,
+        [row for row in range(iou.shape[0]) if row not in matched_rows],
+        [col for col in range(iou.shape[1]) if col not in matched_cols]
+    )
+
+
+class KalmanBoxFilter:
+    """Constant-velocity Kalman filter over box center, width and height"""
+
+    # State: cx, cy, w, h and their velocities
+    F = np.eye(8, dtype=np.float64)
+    F[:4, 4:] = np.eye(4)
+    H = np.eye(4, 8, dtype=np.float64)
+
+    # Noise scaled by box size, as in SORT/ByteTrack
+    POSITION_STD = 1.0 / 20
+    VELOCITY_STD = 1.0 / 160
+
+    def __init__(self, box: np.ndarray):
+        self.x = np.zeros(8)
+        self.x[:4] = self._to_cxcywh(box)
+        w, h = self.x[2], self.x[3]
+        std = np.array([
+            2 * self.POSITION_STD * w, 2 * self.POSITION_STD * h,
+            2 * self.POSITION_STD * w, 2 * self.POSITION_STD * h,
+            10 * self.VELOCITY_STD * w, 10 * self.VELOCITY_STD * h,
+            10 * self.VELOCITY_STD * w, 10 * self.VELOCITY_STD * h
+        ])
+        self.P = np.diag(std ** 2)
+
+    @staticmethod
+    def _to_cxcywh(box: np.ndarray) -> np.ndarray:
+        x1, y1, x2, y2 = box
+        return np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1], dtype=np.float64)
+
+    @property
+    def box(self) -> np.ndarray:
+        """Current state as an xyxy box"""
+        cx, cy, w, h = self.x[:4]
+        return np.array([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2])
+
+    def predict(self):
+        """Advance the state by one frame"""
+        w, h = max(self.x[2], 1.0), max(self.x[3], 1.0)
+        q = np.array([
+            self.POSITION_STD * w, self.POSITION_STD * h, self.POSITION_STD * w, self.POSITION_STD * h,
+            self.VELOCITY_STD * w, self.VELOCITY_STD * h, self.VELOCITY_STD * w, self.VELOCITY_STD * h
+        ]) ** 2
+        self.x = self.F @ self.x
+        self.P = self.F @ self.P @ self.F.T + np.diag(q)
+        self.x[2:4] = np.maximum(self.x[2:4], 1.0)
+
+    def update(self, box: np.ndarray):
+        """Correct the state with a matched detection"""
+        w, h = max(self.x[2], 1.0), max(self.x[3], 1.0)
+        r = np.diag(np.array([self.POSITION_STD * w, self.POSITION_STD * h] * 2) ** 2)
+        innovation = self._to_cxcywh(box) - self.H @ self.x
+        s = self.H @ self.P @ self.H.T + r
+        gain = self.P @ self.H.T @ np.linalg.inv(s)
+        self.x = self.x + gain @ innovation
+        self.P = (np.eye(8) - gain @ self.H) @ self.P
+
+
+class Track:
+    """One tracked vehicle"""
+
+    def __init__(self, track_id: int, detection: np.void, detection_round: int):
+        self.track_id = track_id
+        self.last_round = detection_round
+        self.filter = KalmanBoxFilter(np.array([detection["x1"], detection["y1"], detection["x2"], detection["y2"]]))
+        self.class_id = int(detection["class_id"])
+        self.confidence = float(detection["confidence"])
+        self.hits = 1
+        self.frames_since_update = 0
+        self.reported = False  # Counted as a unique vehicle once first shown
+
+    def predict(self):
+        self.filter.predict()
+        self.frames_since_update += 1
+
+    def update(self, detection: np.void, detection_round: int):
+        self.last_round = detection_round
+        self.filter.update(np.array([detection["x1"], detection["y1"], detection["x2"], detection["y2"]]))
+        self.class_id = int(detection["class_id"])
+        self.confidence = float(detection["confidence"])
+        self.hits += 1
+        self.frames_since_update = 0
+
+
+class VehicleTracker:
+    """
+    Assigns persistent ids to vehicles and propagates boxes between detections
+
+    Association is ByteTrack-style: tracks are matched to high-confidence
+    detections first, then the remaining tracks get a second chance with
+    the low-confidence ones, so briefly occluded vehicles keep their id.
+    Matching is greedy by IOU, which is enough for traffic scenes with
+    tens of objects.
+
+    The detector runs every detect_interval frames (times the quality
+    controller's frame skip), or earlier when the scene changed more than
+    motion_threshold since the last detection; in between, the Kalman
+    filters carry the boxes forward.
+    """
+
+    def __init__(
+        self,
+        detect_interval: int = config.TRACK_DETECT_INTERVAL,
+        motion_threshold: float = config.TRACK_MOTION_THRESHOLD
+    ):
+        self.detect_interval = max(1, detect_interval)
+        self.motion_threshold = motion_threshold
+        self.tracks: List[Track] = []
+        self._ids = itertools.count(1)
+        self._reference: Optional[np.ndarray] = None
+        self._frames_since_detection = 0
+        self._bounds: Optional[np.ndarray] = None  # Last frame's max x, y for clipping
+
+        # Statistics
+        self.detections_run = 0
+        self.frames_propagated = 0
+        self.motion_triggers = 0
+        self.unique_vehicles = 0
+
+    def _motion(self, frame: np.ndarray) -> Tuple[np.ndarray, float]:
+        """Downscaled grey frame and its mean change since the last detection"""
+        small = small_grey(frame, MOTION_SIZE)
+        if self._reference is None:
+            return small, 1.0
+        return small, float(cv2.absdiff(small, self._reference).mean()) / 255.0
+
+    def needs_detection(self, frame: np.ndarray, frame_skip: int = 1) -> bool:
+        """
+        Decide whether a frame goes to the detector
+
+        Must be called once per frame, in order; frames it approves are
+        expected to be passed to update(), the others to propagate().
+        """
+        self._frames_since_detection += 1
+        height, width = frame.shape[:2]
+        self._bounds = np.array([width - 1, height - 1, width - 1, height - 1], dtype=np.float64)
+        small, motion = self._motion(frame)
+
+        first = self._reference is None
+        due = self._frames_since_detection >= self.detect_interval * max(1, frame_skip)
+        moved = motion > self.motion_threshold
+        if not (first or due or moved):
+            return False
+
+        if moved and not (due or first):
+            self.motion_triggers += 1
+        self._reference = small
+        self._frames_since_detection = 0
+        return True
+
+    def update(self, detections: np.ndarray) -> np.ndarray:
+        """
+        Advance all tracks and associate them with fresh detections
+
+        Args:
+            detections: Structured detections (DETECTION_DTYPE) for the frame
+
+        Returns:
+            Tracked detections (TRACK_DTYPE) for the frame
+        """
+        self.detections_run += 1
+        for track in self.tracks:
+            track.predict()
+
+        high = detections[detections["confidence"] >= config.TRACK_HIGH_CONFIDENCE]
+        low = detections[detections["confidence"] < config.TRACK_HIGH_CONFIDENCE]
+
+        # First pass: every track against confident detections
+        matches, unmatched_tracks, unmatched_high = greedy_match(
+            iou_matrix(self._track_boxes(self.tracks), self._detection_boxes(high)),
+            config.TRACK_MATCH_IOU
+        )
+        for track_index, det_index in matches:
+            self.tracks[track_index].update(high[det_index], self.detections_run)
+
+        # Second pass: leftover tracks against weak detections
+        remaining = [self.tracks[i] for i in unmatched_tracks]
+        matches, _, _ = greedy_match(
+            iou_matrix(self._track_boxes(remaining), self._detection_boxes(low)),
+            config.TRACK_MATCH_IOU
+        )
+        for track_index, det_index in matches:
+            remaining[track_index].update(low[det_index], self.detections_run)
+
+        # New tracks start from confident detections only (and are shown at once on the first frame)
+        for det_index in unmatched_high:
+            track = Track(next(self._ids), high[det_index], self.detections_run)
+            if self.detections_run == 1:
+                track.hits = config.TRACK_MIN_HITS
+            self.tracks.append(track)
+
+        self.tracks = [track for track in self.tracks if track.frames_since_update <= config.TRACK_MAX_AGE]
+        return self._output()
+
+    def propagate(self) -> np.ndarray:
+        """Carry tracks forward one frame without a detection"""
+        self.frames_propagated += 1
+        for track in self.tracks:
+            track.predict()
+        return self._output()
+
+    @staticmethod
+    def _track_boxes(tracks: List[Track]) -> np.ndarray:
+        return np.array([track.filter.box for track in tracks]).reshape(-1, 4)
+
+    @staticmethod
+    def _detection_boxes(detections: np.ndarray) -> np.ndarray:
+        return np.stack([detections[name] for name in ("x1", "y1", "x2", "y2")], axis=1).astype(np.float64)
+
+    def _output(self) -> np.ndarray:
+        """Confirmed tracks seen by the latest detection, as TRACK_DTYPE rows"""
+        visible = [
+            track for track in self.tracks
+            if track.hits >= config.TRACK_MIN_HITS and track.last_round == self.detections_run
+        ]
+        output = np.empty(len(visible), dtype=TRACK_DTYPE)
+        if not visible:
+            return output
+
+        boxes = self._track_boxes(visible)
+        if self._bounds is not None:
+            np.clip(boxes, 0, self._bounds, out=boxes)
+        output["x1"], output["y1"], output["x2"], output["y2"] = boxes.T
+        output["confidence"] = [track.confidence for track in visible]
+        output["class_id"] = [track.class_id for track in visible]
+        output["track_id"] = [track.track_id for track in visible]
+        for track in visible:
+            if not track.reported:
+                track.reported = True
+                self.unique_vehicles += 1
+        return output
+
+    def get_stats(self) -> dict:
+        """Get tracking statistics"""
+        frames = self.detections_run + self.frames_propagated
+        return {
+            "detect_interval": self.detect_interval,
+            "motion_threshold": self.motion_threshold,
+            "active_tracks": len(self.tracks),
+            "unique_vehicles": self.unique_vehicles,
+            "detections_run": self.detections_run,
+            "frames_propagated": self.frames_propagated,
+            "motion_triggers": self.motion_triggers,
+            "inference_skip_rate": self.frames_propagated / frames if frames else 0.0
+        }
\ No newline at end of file
@@ -4,6 +4,7 @@ Author: Alims-Repo
 Date: 2025-06-17
 """
 
+import argparse
 import sys
 import os
 from pathlib import Path
@@ -12,19 +13,41 @@ from pathlib import Path
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
+from config.settings import get_config
 from src.utils.logging_config import setup_logging
 from src.server.app import VehicleDetectionServer
 
+config = get_config()
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Vehicle Detection Server")
+    parser.add_argument(
+        "--rebenchmark", action="store_true",
+        help="Ignore the cached device benchmark and benchmark again before serving"
+    )
+    parser.add_argument(
+        "--rebenchmark-background", action="store_true",
+        help="Serve with the cached winner and refresh the benchmark cache in the background"
+    )
+    return parser.parse_args()
+
 
 def main():
     """Main entry point"""
+    args = parse_args()
+
     # Setup logging
     logger = setup_logging()
     logger.info("🚀 Vehicle Detection Server")
 
     try:
         # Create and run server
-        server = VehicleDetectionServer()
+        server = VehicleDetectionServer(
+            rebenchmark=args.rebenchmark,
+            background_rebenchmark=args.rebenchmark_background or config.BACKGROUND_REBENCHMARK
+        )
         server.run()
     except KeyboardInterrupt:
         logger.info("👋 Server stopped by user")
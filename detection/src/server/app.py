@@ -4,19 +4,25 @@ Author: Alims-Repo
 Date: 2025-06-17
 """
 
+import asyncio
 import json
+import time
 import traceback
 from typing import Dict, Any, Optional
 import aiohttp
 from aiohttp import web
 
 from config.settings import get_config
-from src.utils.logging_config import get_logger
+from src.utils.logging_config import AGGREGATE, get_logger
 from src.core.device_optimizer import DeviceOptimizer
 from src.core.detector import VehicleDetector
 from src.core.broadcaster import VideoBroadcaster
+from src.core.sources import SourceRegistry
+from src.core.protocol import VIEW_BOXES, WS_SUBPROTOCOLS, negotiate_protocol, negotiate_view
+from src.core.frame_cache import StreamOptions
 from src.server.handlers import WebSocketHandlers, HTTPHandlers
 from src.server.enhanced_handlers import EnhancedHTTPHandlers  # Import enhanced handlers
+from src.server.profiling import ProfilingHandlers
 
 config = get_config()
 logger = get_logger("app")
@@ -25,17 +31,22 @@ logger = get_logger("app")
 class VehicleDetectionServer:
     """Main server application with enhanced controls"""
     
-    def __init__(self):
+    def __init__(self, rebenchmark: bool = False, background_rebenchmark: bool = config.BACKGROUND_REBENCHMARK):
         self.app = web.Application()
-        self.broadcaster: Optional[VideoBroadcaster] = None
+        self.rebenchmark = rebenchmark
+        self.background_rebenchmark = background_rebenchmark
+        self.rebenchmark_task: Optional[asyncio.Future] = None
+        self.sources: Optional[SourceRegistry] = None
+        self.broadcaster: Optional[VideoBroadcaster] = None  # Default source
         self.detector: Optional[VehicleDetector] = None
-        self.model = None
+        self.backend = None
         self.device = None
         
         # Handlers
         self.ws_handlers: Optional[WebSocketHandlers] = None
         self.http_handlers: Optional[HTTPHandlers] = None
         self.enhanced_handlers: Optional[EnhancedHTTPHandlers] = None  # Add enhanced handlers
+        self.profiling_handlers: Optional[ProfilingHandlers] = ProfilingHandlers() if config.PROFILING else None
         
         self._setup_routes()
         self._setup_middleware()
@@ -44,12 +55,18 @@ class VehicleDetectionServer:
         """Setup web routes"""
         # WebSocket endpoint
         self.app.router.add_get("/ws", self.websocket_handler)
+        self.app.router.add_get("/ws/{camera_id}", self.websocket_handler)
         
-        # HTTP endpoints - will be configured after handlers are created
-        self.app.on_startup.append(self._setup_http_routes)
+        # Admin profiling: time-boxed captures against the running pipeline
+        if self.profiling_handlers:
+            self.app.router.add_get("/admin/profile", self.profiling_handlers.get_status)
+            self.app.router.add_post("/admin/profile/{kind}", self.profiling_handlers.capture)
         
         # Lifecycle hooks
         self.app.on_startup.append(self.on_startup)
+        
+        # HTTP endpoints - configured after on_startup has created the handlers
+        self.app.on_startup.append(self._setup_http_routes)
         self.app.on_shutdown.append(self.on_shutdown)
     
     async def _setup_http_routes(self, app):
@@ -59,7 +76,10 @@ class VehicleDetectionServer:
             self.app.router.add_get("/health", self.http_handlers.health_check)
             self.app.router.add_get("/stats", self.http_handlers.get_stats)
             self.app.router.add_get("/performance", self.http_handlers.get_performance)
+            self.app.router.add_get("/metrics", self.http_handlers.get_metrics)
+            self.app.router.add_get("/trace", self.http_handlers.get_trace)
             self.app.router.add_get("/api", self.http_handlers.api_info)
+            self.app.router.add_get("/sources", self.http_handlers.get_sources)
 
         if self.enhanced_handlers:
             # Enhanced control endpoints
@@ -105,10 +125,13 @@ class VehicleDetectionServer:
         
         @web.middleware
         async def logging_middleware(request, handler):
-            """Request logging middleware"""
-            logger.info(f"📡 {request.method} {request.path} from {request.remote}")
+            """Request logging middleware: one line per request"""
+            start_time = time.time()
             response = await handler(request)
-            logger.info(f"📤 {request.method} {request.path} -> {response.status}")
+            logger.info(
+                f"📡 {request.method} {request.path} -> {response.status} "
+                f"in {(time.time() - start_time) * 1000:.1f}ms from {request.remote}"
+            )
             return response
 
         self.app.middlewares.append(cors_handler)
@@ -117,17 +140,35 @@ class VehicleDetectionServer:
     
     async def websocket_handler(self, request) -> web.WebSocketResponse:
         """Handle WebSocket connections"""
+        camera_id = request.match_info.get("camera_id")
+        broadcaster = self.broadcaster
+        if camera_id is not None:
+            broadcaster = self.sources.get(camera_id) if self.sources else None
+            if broadcaster is None:
+                raise web.HTTPNotFound(text=f"Unknown camera: {camera_id}")
+        
         ws = web.WebSocketResponse(
             heartbeat=config.WS_HEARTBEAT,
-            timeout=config.WS_TIMEOUT
+            timeout=config.WS_TIMEOUT,
+            protocols=tuple(WS_SUBPROTOCOLS)
         )
         await ws.prepare(request)
         
-        # Add client to broadcaster
-        if self.broadcaster:
-            self.broadcaster.add_client(ws)
+        # Stream options: ?protocol= query wins over the negotiated subprotocol
+        try:
+            options = self._parse_stream_options(ws, request.query)
+        except ValueError as e:
+            await ws.close(code=1003, message=str(e).encode())
+            return ws
+        
+        # Add client to the source's broadcaster
+        if broadcaster:
+            broadcaster.add_client(ws, options)
         
-        logger.info(f"🔌 WebSocket connected from {request.remote}")
+        logger.info(
+            f"🔌 WebSocket connected from {request.remote} "
+            f"[{camera_id or config.DEFAULT_SOURCE_ID}, {options.format}]"
+        )
         
         try:
             async for msg in ws:
@@ -143,19 +184,41 @@ class VehicleDetectionServer:
                 traceback.print_exc()
         finally:
             # Remove client from broadcaster
-            if self.broadcaster:
-                self.broadcaster.remove_client(ws)
+            if broadcaster:
+                broadcaster.remove_client(ws)
             logger.info(f"🔌 WebSocket disconnected from {request.remote}")
         
         return ws
     
+    @staticmethod
+    def _parse_stream_options(ws: web.WebSocketResponse, query) -> StreamOptions:
+        """Build stream options from the handshake (protocol, view, quality, width)"""
+        protocol = negotiate_protocol(ws.ws_protocol, query.get("protocol"))
+        view = negotiate_view(query.get("view"))
+        if view == VIEW_BOXES:
+            return StreamOptions(protocol, view=view)  # No image to tune
+        
+        quality = None
+        if "quality" in query:
+            quality = int(query["quality"])
+            if not 10 <= quality <= 100:
+                raise ValueError("JPEG quality must be between 10 and 100")
+        
+        width = None
+        if "width" in query:
+            width = int(query["width"])
+            if width < 32:
+                raise ValueError("Width must be at least 32 pixels")
+        
+        return StreamOptions(protocol, quality, width, view)
+    
     async def _handle_websocket_message(self, ws: web.WebSocketResponse, data: str):
         """Handle incoming WebSocket messages"""
         try:
             message = json.loads(data)
             command = message.get("command")
             
-            logger.info(f"📨 WebSocket command: {command}")
+            logger.info(f"📨 WebSocket command: {command}", extra=AGGREGATE)
 
             if not self.ws_handlers:
                 await ws.send_json({"error": "Server not ready"})
@@ -188,38 +251,48 @@ class VehicleDetectionServer:
     async def on_startup(self, app):
         """Application startup"""
         logger.info("🚀 Starting M1 Pro Vehicle Detection Server...")
-        logger.info(f"📁 Video path: {config.VIDEO_PATH}")
+        logger.info(f"📁 Video sources: {', '.join(config.VIDEO_SOURCES)}")
         logger.info(f"🎯 Target FPS: {config.TARGET_FPS}")
         logger.info(f"🔧 Debug mode: {config.DEBUG}")
         
-        # Check video file
-        if not config.VIDEO_PATH.exists():
-            logger.error(f"❌ Video file not found: {config.VIDEO_PATH}")
-            logger.info("💡 Place your video file at: resources/1.mp4")
-            return
-        
         try:
             # Initialize model and device
             logger.info("🧠 Initializing AI model...")
-            self.model, self.device = DeviceOptimizer.find_optimal_config()
+            self.backend, self.device = DeviceOptimizer.find_optimal_config(rebenchmark=self.rebenchmark)
+            
+            # Serve with the cached winner while a fresh benchmark updates the cache
+            if self.background_rebenchmark and DeviceOptimizer.selection.get("source") == "cache":
+                loop = asyncio.get_running_loop()
+                self.rebenchmark_task = loop.run_in_executor(None, DeviceOptimizer.refresh_benchmark_cache)
             
             # Initialize detector
             logger.info("🔍 Setting up vehicle detector...")
-            self.detector = VehicleDetector(self.model, self.device)
+            self.detector = VehicleDetector(self.backend, self.device)
+            
+            # Initialize sources, all sharing the detector through one scheduler
+            logger.info("📡 Starting video broadcasters...")
+            self.sources = SourceRegistry(self.detector, self.device)
+            self.sources.load_from_config()
+            if not len(self.sources):
+                logger.error("❌ No video sources available")
+                logger.info("💡 Place your video file at: resources/1.mp4 or set VIDEO_SOURCES")
+                return
             
-            # Initialize broadcaster
-            logger.info("📡 Starting video broadcaster...")
-            self.broadcaster = VideoBroadcaster(config.VIDEO_PATH, self.detector, self.device)
-            self.broadcaster.start()
+            self.broadcaster = self.sources.default
+            self.sources.start()
             
             # Initialize handlers
             self.ws_handlers = WebSocketHandlers(self.broadcaster, self.detector, self.device)
-            self.http_handlers = HTTPHandlers(self.broadcaster, self.detector, self.device)
-            self.enhanced_handlers = EnhancedHTTPHandlers(self.broadcaster, self.detector, self.device)
+            self.http_handlers = HTTPHandlers(self.broadcaster, self.detector, self.device, self.sources)
+            self.enhanced_handlers = EnhancedHTTPHandlers(
+                self.broadcaster, self.detector, self.device, self.sources
+            )
             
             logger.info("✅ Server startup complete!")
             logger.info(f"🌐 Access the server at: http://{config.HOST}:{config.PORT}")
             logger.info(f"🔗 WebSocket endpoint: ws://{config.HOST}:{config.PORT}/ws")
+            for source_id in self.sources.broadcasters:
+                logger.info(f"   • ws://{config.HOST}:{config.PORT}/ws/{source_id}")
             logger.info(f"📊 Health check: http://{config.HOST}:{config.PORT}/health")
             logger.info("🎮 Control endpoints:")
             logger.info("   • POST /control/playback - Video playback control")
@@ -239,8 +312,8 @@ class VehicleDetectionServer:
         logger.info("🛑 Shutting down server...")
         
         try:
-            if self.broadcaster:
-                await self.broadcaster.stop()
+            if self.sources:
+                await self.sources.stop()
             
             logger.info("✅ Server shutdown complete")
         except Exception as e:
@@ -4,13 +4,13 @@ Author: Alims-Repo
 Date: 2025-06-17
 """
 
-import cv2
 import torch
 from aiohttp import web
 import json
 import asyncio
 from config.settings import get_config
 from src.utils.logging_config import get_logger
+from src.core.backends import UnsupportedDeviceError
 
 config = get_config()
 logger = get_logger("enhanced_handlers")
@@ -18,23 +18,32 @@ logger = get_logger("enhanced_handlers")
 class EnhancedHTTPHandlers:
     """Enhanced HTTP handlers with full control capabilities"""
 
-    def __init__(self, broadcaster, detector, device):
+    def __init__(self, broadcaster, detector, device, sources=None):
         self.broadcaster = broadcaster
         self.detector = detector
         self.device = device
+        self.sources = sources
         self._paused = False
 
+    def _get_broadcaster(self, data: dict):
+        """Resolve the broadcaster targeted by a request (default source if none given)"""
+        source_id = data.get("source")
+        if source_id and self.sources:
+            return self.sources.get(source_id)
+        return self.broadcaster
+
     async def control_playback(self, request) -> web.Response:
         """Control video playback"""
         try:
             data = await request.json()
             action = data.get("action")
+            broadcaster = self._get_broadcaster(data)
 
             logger.info(f"Playback control: {action}")
 
             if action == "pause":
-                if self.broadcaster:
-                    self.broadcaster.is_running = False
+                if broadcaster:
+                    broadcaster.is_running = False
                     self._paused = True
                 return web.json_response({
                     "status": "paused",
@@ -42,8 +51,8 @@ class EnhancedHTTPHandlers:
                 })
 
             elif action == "resume":
-                if self.broadcaster and self._paused:
-                    self.broadcaster.is_running = True
+                if broadcaster and self._paused:
+                    broadcaster.is_running = True
                     self._paused = False
                 return web.json_response({
                     "status": "resumed",
@@ -51,11 +60,10 @@ class EnhancedHTTPHandlers:
                 })
 
             elif action == "restart":
-                if self.broadcaster and self.broadcaster.cap:
-                    self.broadcaster.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                    self.broadcaster.frame_count = 0
+                if broadcaster:
+                    broadcaster.seek(0)
                     if self._paused:
-                        self.broadcaster.is_running = True
+                        broadcaster.is_running = True
                         self._paused = False
                 return web.json_response({
                     "status": "restarted",
@@ -64,9 +72,8 @@ class EnhancedHTTPHandlers:
 
             elif action == "seek":
                 frame_number = data.get("frame", 0)
-                if self.broadcaster and self.broadcaster.cap:
-                    self.broadcaster.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
-                    self.broadcaster.frame_count = frame_number
+                if broadcaster:
+                    broadcaster.seek(frame_number)
                 return web.json_response({
                     "status": f"seeked to frame {frame_number}",
                     "message": f"Video seeked to frame {frame_number}"
@@ -134,33 +141,34 @@ class EnhancedHTTPHandlers:
         try:
             data = await request.json()
             action = data.get("action")
+            broadcaster = self._get_broadcaster(data)
 
             logger.info(f"Broadcast control: {action}")
 
-            if action == "start" and self.broadcaster:
-                if not self.broadcaster.is_running:
-                    self.broadcaster.start()
+            if action == "start" and broadcaster:
+                if not broadcaster.is_running:
+                    broadcaster.start()
                 return web.json_response({
                     "status": "broadcasting started",
                     "message": "Video broadcasting started"
                 })
 
-            elif action == "stop" and self.broadcaster:
-                self.broadcaster.is_running = False
+            elif action == "stop" and broadcaster:
+                broadcaster.is_running = False
                 return web.json_response({
                     "status": "broadcasting stopped",
                     "message": "Video broadcasting stopped"
                 })
 
-            elif action == "disconnect_all" and self.broadcaster:
+            elif action == "disconnect_all" and broadcaster:
                 # Disconnect all clients
-                disconnected_count = len(self.broadcaster.clients)
-                for client in list(self.broadcaster.clients):
+                disconnected_count = len(broadcaster.clients)
+                for client in list(broadcaster.clients):
+                    broadcaster.remove_client(client)
                     try:
                         await client.close(code=1000, message="Disconnected by admin")
                     except:
                         pass
-                self.broadcaster.clients.clear()
 
                 return web.json_response({
                     "status": "all clients disconnected",
@@ -198,10 +206,13 @@ class EnhancedHTTPHandlers:
                     status=400
                 )
 
-            # Switch model device
-            if self.detector and self.detector.model:
+            # Switch model device (exported CPU backends refuse other devices)
+            if self.detector:
                 old_device = self.device
-                self.detector.model.to(target_device)
+                try:
+                    self.detector.set_device(target_device)
+                except UnsupportedDeviceError as e:
+                    return web.json_response({"error": str(e)}, status=400)
                 self.device = target_device
 
                 if target_device == "mps":
@@ -230,17 +241,20 @@ class EnhancedHTTPHandlers:
         if not self.broadcaster:
             return web.json_response({"error": "Broadcaster not available"}, status=503)
 
+        broadcaster = self._get_broadcaster(dict(request.query))
+        if not broadcaster:
+            return web.json_response({"error": "Unknown source"}, status=404)
+
         clients_info = []
-        for i, client in enumerate(self.broadcaster.clients):
-            clients_info.append({
-                "id": i,
-                "address": str(client),
-                "connected_at": "unknown",  # Could track this
-                "status": "active"
-            })
+        for i, session in enumerate(broadcaster.sessions.values()):
+            info = session.get_stats()
+            info.update({"id": i, "status": "active"})
+            clients_info.append(info)
 
         return web.json_response({
-            "total_clients": len(self.broadcaster.clients),
+            "source": broadcaster.source_id,
+            "total_clients": len(broadcaster.clients),
+            "frames_dropped": sum(info["frames_dropped"] for info in clients_info),
             "clients": clients_info,
             "controls": {
                 "disconnect_all": "POST /control/broadcast {action: 'disconnect_all'}",
@@ -11,7 +11,11 @@ import aiohttp
 from aiohttp import web
 
 from config.settings import get_config
-from src.utils.logging_config import get_logger
+from src.utils.logging_config import get_logger, get_logging_stats
+from src.utils.metrics import CONTENT_TYPE, REGISTRY
+from src.utils.tracing import TRACER
+from src.core.device_optimizer import DeviceOptimizer
+from src.core.executors import get_executor_stats
 
 config = get_config()
 logger = get_logger("handlers")
@@ -86,10 +90,11 @@ class WebSocketHandlers:
 class HTTPHandlers:
     """HTTP request handlers"""
     
-    def __init__(self, broadcaster, detector, device):
+    def __init__(self, broadcaster, detector, device, sources=None):
         self.broadcaster = broadcaster
         self.detector = detector
         self.device = device
+        self.sources = sources
     
     async def health_check(self, request) -> web.Response:
         """Health check endpoint"""
@@ -132,6 +137,8 @@ class HTTPHandlers:
             "jpeg_quality": config.JPEG_QUALITY,
             "batch_size_gpu": config.BATCH_SIZE_GPU,
             "batch_size_cpu": config.BATCH_SIZE_CPU,
+            "batch_size_max": config.BATCH_SIZE_MAX,
+            "adaptive_batching": config.ADAPTIVE_BATCHING,
             "mps_memory_fraction": config.MPS_MEMORY_FRACTION
         }
         
@@ -190,9 +197,43 @@ class HTTPHandlers:
         
         if self.broadcaster:
             performance_data["broadcast"] = self.broadcaster.broadcast_tracker.get_stats()
+        performance_data["device_selection"] = DeviceOptimizer.selection
+        if self.sources:
+            performance_data["quality"] = self.sources.quality_controller.get_stats()
+            performance_data["executors"] = get_executor_stats()
+        performance_data["tracing"] = TRACER.get_stats()
+        performance_data["logging"] = get_logging_stats()
         
         return web.json_response(performance_data)
     
+    async def get_sources(self, request) -> web.Response:
+        """Video sources and shared scheduler statistics"""
+        if not self.sources:
+            return web.json_response(
+                {"error": "Sources not initialized"}, 
+                status=503
+            )
+        
+        return web.json_response(self.sources.get_stats())
+    
+    async def get_metrics(self, request) -> web.Response:
+        """Prometheus metrics endpoint"""
+        return web.Response(text=REGISTRY.render(), headers={"Content-Type": CONTENT_TYPE})
+    
+    async def get_trace(self, request) -> web.Response:
+        """Buffered frame spans as Chrome trace JSON (open in ui.perfetto.dev)"""
+        try:
+            frame_id = int(request.query["frame"]) if "frame" in request.query else None
+            slowest = int(request.query.get("slowest", 0))
+        except ValueError:
+            return web.json_response({"error": "frame and slowest must be integers"}, status=400)
+        
+        trace = TRACER.export(request.query.get("source"), frame_id, slowest)
+        headers = {}
+        if request.query.get("download", "").lower() in ("1", "true"):
+            headers["Content-Disposition"] = f'attachment; filename="trace-{int(time.time())}.json"'
+        return web.json_response(trace, headers=headers)
+    
     async def api_info(self, request) -> web.Response:
         """API information endpoint"""
         api_info = {
@@ -206,8 +247,14 @@ class HTTPHandlers:
                 "GET /config": "Current configuration",
                 "POST /config": "Update configuration",
                 "GET /performance": "Detailed performance metrics",
+                "GET /metrics": "Prometheus metrics (stage latency histograms, drops, queue depths)",
+                "GET /trace": "Sampled per-frame spans as Chrome/Perfetto JSON (?source=&frame=&slowest=N&download=1)",
+                "GET /admin/profile": "Running and recent profile captures",
+                "POST /admin/profile/{cpu|torch|memory}": "Time-boxed profile capture, returned as a download (?seconds=&format=text)",
                 "GET /api": "API information",
-                "WS /ws": "WebSocket for real-time streaming"
+                "GET /sources": "Video sources and scheduler statistics",
+                "WS /ws": "WebSocket for real-time streaming (?protocol=json|binary&view=annotated|raw|boxes&quality=&width=)",
+                "WS /ws/{camera_id}": "WebSocket stream for a specific camera"
             },
             "websocket_commands": {
                 "get_stats": "Get current statistics",
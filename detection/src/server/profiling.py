@@ -0,0 +1,393 @@
+"""
+On-demand profiling of the running server
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+import asyncio
+import cProfile
+import hmac
+import io
+import ipaddress
+import json
+import marshal
+import os
+import pickle
+import pstats
+import tempfile
+import threading
+import time
+import tracemalloc
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional
+import torch
+from aiohttp import web
+
+from config.settings import get_config
+from src.utils.logging_config import get_logger
+from src.core.executors import STAGE_INFERENCE, StageExecutor
+
+config = get_config()
+logger = get_logger("profiling")
+
+PROFILE_CPU = "cpu"  # cProfile: event loop thread and stage workers
+PROFILE_TORCH = "torch"  # torch.profiler around every forward pass
+PROFILE_MEMORY = "memory"  # tracemalloc snapshot of allocations made during the capture
+PROFILE_KINDS = (PROFILE_CPU, PROFILE_TORCH, PROFILE_MEMORY)
+
+TRACEMALLOC_FRAMES = 25  # stack depth kept per allocation
+SUMMARY_ROWS = 60
+
+
+class ProfilerBusyError(RuntimeError):
+    """Raised when a capture is requested while another one is running"""
+
+
+class ProfileArtifact(NamedTuple):
+    """Result of a capture, served as a download"""
+    kind: str
+    filename: str
+    content_type: str
+    body: bytes
+    started_at: float
+    seconds: float
+
+
+class _HookedCapture(ABC):
+    """
+    Capture running inside stage executor tasks through StageExecutor.task_hook
+
+    Tasks still running when the capture stops are waited for (drain), so
+    results are only read once no worker touches them.
+    """
+
+    def __init__(self):
+        self.stopped = False
+        self._inflight = 0
+        self._idle = threading.Condition()
+
+    def run_task(self, stage: str, func, args):
+        with self._idle:
+            if self.stopped:
+                return func(*args)
+            self._inflight += 1
+        try:
+            return self._run(stage, func, args)
+        finally:
+            with self._idle:
+                self._inflight -= 1
+                self._idle.notify_all()
+
+    @abstractmethod
+    def _run(self, stage: str, func, args):
+        """Run one stage task under the capture and return its result"""
+
+    def start(self):
+        pass
+
+    def stop(self):
+        """Stop parts owned by the event loop thread"""
+        pass
+
+    def drain(self, timeout: float = 30.0):
+        """Stop taking tasks and wait for the running ones"""
+        with self._idle:
+            self.stopped = True
+            self._idle.wait_for(lambda: self._inflight == 0, timeout)
+
+
+class _CpuCapture(_HookedCapture):
+    """cProfile on the event loop thread plus one profile per stage worker thread"""
+
+    def __init__(self):
+        super().__init__()
+        self.main = cProfile.Profile()
+        self.threads: Dict[int, cProfile.Profile] = {}
+
+    def _run(self, stage: str, func, args):
+        ident = threading.get_ident()
+        profile = self.threads.get(ident)
+        if profile is None:
+            profile = self.threads.setdefault(ident, cProfile.Profile())
+        return profile.runcall(func, *args)
+
+    def start(self):
+        self.main.enable()
+
+    def stop(self):
+        self.main.disable()
+
+    def stats(self) -> pstats.Stats:
+        stats = pstats.Stats(self.main)
+        for profile in self.threads.values():
+            stats.add(profile)
+        return stats
+
+
+class _TorchCapture(_HookedCapture):
+    """
+    torch.profiler session per inference task
+
+    The profiler only sees ops on the thread that started it, so each
+    forward pass on the inference workers is profiled on its own and the
+    traces are merged. Sessions cannot overlap, so inference tasks run
+    one at a time while the capture is active.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            self.activities.append(torch.profiler.ProfilerActivity.CUDA)
+        self.directory = tempfile.mkdtemp(prefix="torch-profile-")
+        self.traces: List[str] = []
+        self.totals: Dict[str, List[float]] = {}  # op: [calls, self cpu us, total cpu us]
+        self._lock = threading.Lock()
+
+    def _run(self, stage: str, func, args):
+        if stage != STAGE_INFERENCE:
+            return func(*args)
+        with self._lock:
+            with torch.profiler.profile(activities=self.activities, record_shapes=True) as profile:
+                result = func(*args)
+            path = os.path.join(self.directory, f"task-{len(self.traces)}.json")
+            profile.export_chrome_trace(path)
+            self.traces.append(path)
+            for event in profile.key_averages():
+                totals = self.totals.setdefault(event.key, [0, 0.0, 0.0])
+                totals[0] += event.count
+                totals[1] += event.self_cpu_time_total
+                totals[2] += event.cpu_time_total
+        return result
+
+    def merged_trace(self) -> dict:
+        """One Chrome trace with the events of every profiled task"""
+        merged = {"traceEvents": [], "displayTimeUnit": "ms"}
+        for path in self.traces:
+            with open(path) as trace_file:
+                merged["traceEvents"].extend(json.load(trace_file).get("traceEvents", []))
+        return merged
+
+    def summary(self) -> str:
+        """Ops by self CPU time"""
+        lines = [
+            f"{len(self.traces)} forward passes profiled",
+            "",
+            f"{'self cpu ms':>12} {'total cpu ms':>13} {'calls':>8}  op"
+        ]
+        ranked = sorted(self.totals.items(), key=lambda item: item[1][1], reverse=True)
+        for op, (calls, self_us, total_us) in ranked[:SUMMARY_ROWS]:
+            lines.append(f"{self_us / 1000:12.2f} {total_us / 1000:13.2f} {calls:8d}  {op}")
+        return "\n".join(lines) + "\n"
+
+    def cleanup(self):
+        for path in self.traces:
+            os.remove(path)
+        os.rmdir(self.directory)
+
+
+class Profiler:
+    """
+    Runs one time-boxed capture at a time against the live pipeline
+
+    Nothing is installed while idle: the CPU and torch captures set
+    StageExecutor.task_hook only for their duration, tracemalloc is
+    started and stopped around the memory capture.
+    """
+
+    def __init__(self, max_seconds: float = config.PROFILE_MAX_SECONDS):
+        self.max_seconds = max_seconds
+        self.active: Optional[dict] = None
+        self.history = deque(maxlen=10)
+
+    async def capture(self, kind: str, seconds: float, text: bool = False) -> ProfileArtifact:
+        """
+        Profile the running server for a number of seconds
+
+        Args:
+            kind: cpu, torch or memory
+            seconds: Capture length, capped at max_seconds
+            text: Return a readable summary instead of the raw artifact
+
+        Returns:
+            Artifact to send to the client
+        """
+        if kind not in PROFILE_KINDS:
+            raise ValueError(f"Unknown profile kind: {kind}. Use: {', '.join(PROFILE_KINDS)}")
+        if kind == PROFILE_TORCH and config.INFERENCE_PROCESS:
+            raise ValueError("Model runs in an inference process (INFERENCE_PROCESS), torch capture is unavailable")
+        if self.active is not None:
+            raise ProfilerBusyError(f"A {self.active['kind']} capture is already running")
+        seconds = min(max(seconds, 0.1), self.max_seconds)
+
+        started_at = time.time()
+        self.active = {"kind": kind, "started_at": started_at, "seconds": seconds}
+        logger.info(f"🔬 Starting {kind} profile for {seconds:.1f}s")
+        try:
+            if kind == PROFILE_MEMORY:
+                artifact = await self._capture_memory(seconds, text)
+            else:
+                artifact = await self._capture_hooked(kind, seconds, text)
+        finally:
+            self.active = None
+
+        artifact = artifact._replace(started_at=started_at, seconds=seconds)
+        self.history.append({
+            "kind": kind,
+            "started_at": started_at,
+            "seconds": seconds,
+            "filename": artifact.filename,
+            "bytes": len(artifact.body)
+        })
+        logger.info(f"🔬 {kind} profile done: {artifact.filename} ({len(artifact.body)} bytes)")
+        return artifact
+
+    async def _capture_hooked(self, kind: str, seconds: float, text: bool) -> ProfileArtifact:
+        """cProfile or torch.profiler capture through the stage executor hook"""
+        capture = _CpuCapture() if kind == PROFILE_CPU else _TorchCapture()
+        loop = asyncio.get_running_loop()
+        StageExecutor.task_hook = capture.run_task
+        capture.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            StageExecutor.task_hook = None
+            capture.stop()
+            await loop.run_in_executor(None, capture.drain)
+
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        if kind == PROFILE_CPU:
+            stats = capture.stats()
+            if text:
+                body = await loop.run_in_executor(None, self._format_pstats, stats)
+                return ProfileArtifact(kind, f"cpu-{stamp}.txt", "text/plain", body, 0.0, 0.0)
+            # Same format as pstats.Stats.dump_stats, for snakeviz / pstats
+            body = await loop.run_in_executor(None, marshal.dumps, stats.stats)
+            return ProfileArtifact(kind, f"cpu-{stamp}.prof", "application/octet-stream", body, 0.0, 0.0)
+
+        try:
+            if text:
+                body = capture.summary().encode()
+                return ProfileArtifact(kind, f"torch-{stamp}.txt", "text/plain", body, 0.0, 0.0)
+            trace = await loop.run_in_executor(None, capture.merged_trace)
+            body = json.dumps(trace).encode()
+            return ProfileArtifact(kind, f"torch-{stamp}.json", "application/json", body, 0.0, 0.0)
+        finally:
+            capture.cleanup()
+
+    async def _capture_memory(self, seconds: float, text: bool) -> ProfileArtifact:
+        """Allocations made during the capture and still alive at its end"""
+        already_tracing = tracemalloc.is_tracing()
+        if not already_tracing:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        baseline = tracemalloc.take_snapshot() if already_tracing else None
+        try:
+            await asyncio.sleep(seconds)
+            snapshot = tracemalloc.take_snapshot()
+        finally:
+            if not already_tracing:
+                tracemalloc.stop()
+
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        loop = asyncio.get_running_loop()
+        if text:
+            body = await loop.run_in_executor(None, self._format_snapshot, snapshot, baseline)
+            return ProfileArtifact(PROFILE_MEMORY, f"memory-{stamp}.txt", "text/plain", body, 0.0, 0.0)
+        # Loadable with tracemalloc.Snapshot.load()
+        body = await loop.run_in_executor(None, pickle.dumps, snapshot, pickle.HIGHEST_PROTOCOL)
+        return ProfileArtifact(PROFILE_MEMORY, f"memory-{stamp}.tracemalloc", "application/octet-stream", body, 0.0, 0.0)
+
+    @staticmethod
+    def _format_pstats(stats: pstats.Stats) -> bytes:
+        output = io.StringIO()
+        stats.stream = output
+        stats.sort_stats("cumulative").print_stats(SUMMARY_ROWS)
+        return output.getvalue().encode()
+
+    @staticmethod
+    def _format_snapshot(snapshot: tracemalloc.Snapshot, baseline: Optional[tracemalloc.Snapshot]) -> bytes:
+        snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        if baseline is not None:
+            entries = snapshot.compare_to(baseline, "lineno")
+        else:
+            entries = snapshot.statistics("lineno")
+        total = sum(entry.size for entry in snapshot.statistics("filename"))
+        lines = [f"Traced memory: {total / 1024 / 1024:.1f} MiB", ""]
+        lines.extend(str(entry) for entry in entries[:SUMMARY_ROWS])
+        return ("\n".join(lines) + "\n").encode()
+
+    def get_stats(self) -> dict:
+        return {
+            "kinds": list(PROFILE_KINDS),
+            "max_seconds": self.max_seconds,
+            "active": self.active,
+            "history": list(self.history)
+        }
+
+
+class ProfilingHandlers:
+    """
+    Admin endpoints for profile captures
+
+    With ADMIN_TOKEN set, requests must carry it in X-Admin-Token. Without
+    it only loopback clients are served, and requests sent by a browser
+    (with an Origin header) are refused so a web page cannot start one.
+    """
+
+    TOKEN_HEADER = "X-Admin-Token"
+
+    def __init__(self, profiler: Optional[Profiler] = None, token: str = config.ADMIN_TOKEN):
+        self.profiler = profiler or Profiler()
+        self.token = token
+        if not token:
+            logger.warning("⚠️ ADMIN_TOKEN is not set, profiling endpoints only accept loopback clients")
+
+    def _refuse(self, request) -> Optional[web.Response]:
+        """Error response for a request that may not use the admin endpoints"""
+        if self.token:
+            supplied = request.headers.get(self.TOKEN_HEADER, "")
+            if hmac.compare_digest(supplied.encode(), self.token.encode()):
+                return None
+            return web.json_response({"error": f"Missing or wrong {self.TOKEN_HEADER}"}, status=401)
+
+        try:
+            loopback = ipaddress.ip_address(request.remote or "").is_loopback
+        except ValueError:
+            loopback = False
+        if loopback and "Origin" not in request.headers:
+            return None
+        return web.json_response({"error": "Admin endpoints are limited to localhost without ADMIN_TOKEN"}, status=403)
+
+    async def get_status(self, request) -> web.Response:
+        """Running capture and recent captures"""
+        refused = self._refuse(request)
+        if refused:
+            return refused
+        return web.json_response(self.profiler.get_stats())
+
+    async def capture(self, request) -> web.Response:
+        """Run a capture and return its artifact (?seconds=&format=text)"""
+        refused = self._refuse(request)
+        if refused:
+            return refused
+
+        try:
+            seconds = float(request.query.get("seconds", config.PROFILE_DEFAULT_SECONDS))
+        except ValueError:
+            return web.json_response({"error": "seconds must be a number"}, status=400)
+
+        try:
+            artifact = await self.profiler.capture(
+                request.match_info["kind"], seconds, request.query.get("format") == "text"
+            )
+        except ProfilerBusyError as e:
+            return web.json_response({"error": str(e)}, status=409)
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400)
+
+        return web.Response(
+            body=artifact.body,
+            content_type=artifact.content_type,
+            headers={"Content-Disposition": f'attachment; filename="{artifact.filename}"'}
+        )
\ No newline at end of file
@@ -0,0 +1,265 @@
+"""
+Per-stage benchmark suite replaying recorded traffic clips
+Author: Alims-Repo
+Date: 2025-06-17
+
+Usage:
+    python -m src.tools.benchmark --frames 300 --output logs/bench.json
+"""
+
+import argparse
+import json
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+import cv2
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+import src
+from config.settings import get_config
+from src.utils.logging_config import setup_logging
+from src.core.annotator import Annotator
+from src.core.backends import InferenceBackend, create_backend
+from src.core.benchmark_cache import host_fingerprint
+from src.core.decoder import create_decoder
+from src.core.detector import VehicleDetector
+from src.core.device_optimizer import DeviceOptimizer
+from src.core.protocol import PROTOCOL_BINARY, PROTOCOL_JSON, VIEW_ANNOTATED, VIEW_RAW, build_payload
+
+config = get_config()
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv")
+
+# Stages in pipeline order; preprocess and inference are timed per batch
+STAGES = ("decode", "preprocess", "inference", "postprocess", "annotate", "encode", "broadcast")
+BATCH_STAGES = ("preprocess", "inference")
+
+
+class StageTimer:
+    """Collects wall-clock samples per pipeline stage"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+
+    @contextmanager
+    def measure(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples[stage].append(time.perf_counter() - start)
+
+    def summary(self) -> dict:
+        return {stage: summarize(samples, stage) for stage, samples in self.samples.items()}
+
+
+def summarize(samples: List[float], stage: str = "") -> dict:
+    """Latency distribution of a stage, in milliseconds"""
+    if not samples:
+        return {"count": 0}
+    values = np.array(samples) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "per": "batch" if stage in BATCH_STAGES else "frame",
+        "count": len(values),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "max_ms": float(values.max()),
+        "total_s": float(values.sum() / 1000)
+    }
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def find_clips(paths: Optional[List[Path]]) -> List[Path]:
+    """Clips given on the command line, or every video in resources/"""
+    if paths:
+        return paths
+    resources = config.VIDEO_PATH.parent
+    return sorted(path for path in resources.iterdir() if path.suffix.lower() in VIDEO_EXTENSIONS)
+
+
+def replay_clip(
+    clip: Path,
+    detector: VehicleDetector,
+    annotator: Annotator,
+    timer: StageTimer,
+    batch_size: int,
+    max_frames: int
+) -> dict:
+    """
+    Push a clip through every stage, timing each one
+
+    Args:
+        clip: Video file
+        detector: Detector whose preprocessor and backend are measured
+        annotator: Annotator for the annotate stage
+        timer: Collects stage samples
+        batch_size: Frames per inference batch
+        max_frames: Stop after this many frames
+
+    Returns:
+        Frame and vehicle counts for the clip
+    """
+    decoder = create_decoder(str(clip))
+
+    frames_done = 0
+    vehicles = 0
+    encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), config.JPEG_QUALITY]
+
+    while frames_done < max_frames:
+        batch_frames = []
+        while len(batch_frames) < min(batch_size, max_frames - frames_done):
+            with timer.measure("decode"):
+                ret, frame = decoder.read()
+            if not ret:
+                timer.samples["decode"].pop()  # End of clip, not a decode
+                break
+            batch_frames.append(frame)
+        if not batch_frames:
+            break
+
+        with timer.measure("preprocess"):
+            batch, transforms = detector.preprocessor.prepare_batch(batch_frames, config.INPUT_SIZE)
+        with timer.measure("inference"):
+            raw = detector.backend.infer(batch)
+
+        for frame, data, transform in zip(batch_frames, raw, transforms):
+            with timer.measure("postprocess"):
+                detections = detector.postprocess_detections(data, frame.shape, transform)
+            with timer.measure("annotate"):
+                annotated = annotator.draw_detections(frame, detections)
+            with timer.measure("encode"):
+                _, buffer = cv2.imencode('.jpg', annotated, encode_params)
+                jpeg = buffer.tobytes()
+
+            # Build what fanout sends: legacy JSON and binary raw view
+            metadata = {
+                "vehicleCount": len(detections),
+                "timestamp": time.time(),
+                "frameCount": frames_done,
+                "frameSize": [frame.shape[1], frame.shape[0]],
+                "performance": {"avgDetectionTime": 0.0, "detectionFps": 0.0, "broadcastFps": 0.0}
+            }
+            with timer.measure("broadcast"):
+                build_payload(VIEW_ANNOTATED, PROTOCOL_JSON, jpeg, detections, metadata, detector.class_names)
+                build_payload(VIEW_RAW, PROTOCOL_BINARY, jpeg, detections, metadata, detector.class_names)
+
+            vehicles += len(detections)
+            frames_done += 1
+
+    decoder.release()
+    return {"clip": clip.name, "frames": frames_done, "vehicles": vehicles}
+
+
+def run_benchmark(
+    clips: List[Path],
+    backend: InferenceBackend,
+    batch_size: int,
+    max_frames: int,
+    warmup_frames: int = 8
+) -> dict:
+    """
+    Replay clips through all stages and build the report
+
+    Returns:
+        JSON-serializable report
+    """
+    detector = VehicleDetector(backend, backend.device)
+    detector.batch_sizer.enabled = False
+    annotator = Annotator(lambda: detector.class_names)
+
+    # Warm up allocators, kernels and the letterbox buffer outside the measurement
+    replay_clip(clips[0], detector, annotator, StageTimer(), batch_size, warmup_frames)
+
+    timer = StageTimer()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    clip_results = [
+        replay_clip(clip, detector, annotator, timer, batch_size, max_frames)
+        for clip in clips
+    ]
+    wall_time = time.perf_counter() - wall_start
+    cpu_time = time.process_time() - cpu_start
+
+    total_frames = sum(result["frames"] for result in clip_results)
+    return {
+        "version": src.__version__,
+        "created_at": time.time(),
+        "host": host_fingerprint(),
+        "backend": backend.describe(),
+        "input_size": config.INPUT_SIZE,
+        "decoder": config.DECODER,
+        "batch_size": batch_size,
+        "clips": clip_results,
+        "stages": timer.summary(),
+        "throughput_fps": total_frames / wall_time if wall_time > 0 else 0.0,
+        "wall_time_s": wall_time,
+        "cpu_time_s": cpu_time,
+        "cpu_percent": 100.0 * cpu_time / wall_time if wall_time > 0 else 0.0,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on recorded clips")
+    parser.add_argument("--clip", type=Path, action="append", help="Clip to replay (repeatable, default: resources/*)")
+    parser.add_argument("--frames", type=int, default=300, help="Max frames per clip")
+    parser.add_argument("--batch-size", type=int, default=config.BATCH_SIZE_CPU)
+    parser.add_argument("--backend", help="Backend to test (default: DeviceOptimizer selection)")
+    parser.add_argument("--model", type=Path, default=config.MODEL_PATHS[0], help="Checkpoint for --backend")
+    parser.add_argument("--device", default="cpu", help="Device for --backend")
+    parser.add_argument("--output", type=Path, help="JSON report path (default: logs/benchmark-<time>.json)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    """Run the suite and write the JSON report"""
+    args = parse_args(argv)
+    logger = setup_logging()
+
+    clips = find_clips(args.clip)
+    if not clips:
+        logger.error("❌ No clips found, place videos in resources/ or pass --clip")
+        return 1
+
+    if args.backend:
+        backend = create_backend(args.backend, args.model, args.device)
+    else:
+        backend, _ = DeviceOptimizer.find_optimal_config()
+
+    logger.info(f"⏱️  Replaying {len(clips)} clip(s) on {backend.name}/{backend.device.upper()}")
+    report = run_benchmark(clips, backend, max(1, args.batch_size), args.frames)
+
+    output = args.output or config.LOG_FILE.parent / time.strftime("benchmark-%Y%m%d-%H%M%S.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    logger.info(f"📊 Throughput: {report['throughput_fps']:.1f} FPS, "
+                f"CPU: {report['cpu_percent']:.0f}%, peak RSS: {report['peak_rss_mb'] or 0:.0f} MB")
+    for stage, stats in report["stages"].items():
+        if stats["count"]:
+            logger.info(f"   {stage:<12} p50 {stats['p50_ms']:7.2f}ms  p95 {stats['p95_ms']:7.2f}ms  "
+                        f"p99 {stats['p99_ms']:7.2f}ms  (per {stats['per']})")
+    logger.info(f"💾 Report written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,83 @@
+"""
+Build INT8 model variants and report accuracy vs speed
+Author: Alims-Repo
+Date: 2025-06-17
+
+Usage:
+    python -m src.tools.quantize --model model/yolov8n.pt --mode static
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+from config.settings import get_config
+from src.utils.logging_config import setup_logging
+from src.core.quantization import (
+    QUANT_MODES,
+    QUANT_STATIC,
+    evaluate_quantized_model,
+    quantize_model,
+    register_quantized_model,
+    split_video_frames
+)
+
+config = get_config()
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Quantize detection models to INT8")
+    parser.add_argument(
+        "--model", type=Path, action="append",
+        help="FP32 .pt checkpoint (repeatable, default: every model in MODEL_PATHS)"
+    )
+    parser.add_argument("--mode", choices=QUANT_MODES, default=QUANT_STATIC)
+    parser.add_argument("--video", type=Path, default=config.VIDEO_PATH, help="Calibration and evaluation video")
+    parser.add_argument("--calibration-frames", type=int, default=config.QUANTIZATION_CALIBRATION_FRAMES)
+    parser.add_argument("--eval-frames", type=int, default=32)
+    parser.add_argument("--no-register", action="store_true", help="Report only, do not add to the manifest")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    """Quantize, evaluate and register each model"""
+    args = parse_args(argv)
+    logger = setup_logging()
+
+    models = args.model or [path for path in config.MODEL_PATHS if path.exists()]
+    if not models:
+        logger.error("❌ No models to quantize")
+        return 1
+
+    try:
+        calibration, evaluation = split_video_frames(args.video, args.calibration_frames, args.eval_frames)
+    except (FileNotFoundError, ValueError) as e:
+        logger.error(f"❌ {e}")
+        return 1
+    logger.info(f"🎞️  {len(calibration)} calibration / {len(evaluation)} evaluation frames from {args.video.name}")
+
+    for model_path in models:
+        try:
+            quantized_path = quantize_model(model_path, args.mode, calibration)
+            result = evaluate_quantized_model(
+                model_path, quantized_path, args.mode, evaluation, len(calibration)
+            )
+        except Exception as e:
+            logger.error(f"✗ Failed to quantize {model_path.name}: {e}")
+            continue
+
+        within_budget = result.accuracy_loss <= config.QUANTIZATION_ACCURACY_BUDGET
+        logger.info(f"📊 {model_path.name} -> {quantized_path.name}:")
+        logger.info(f"   Count agreement: {result.count_agreement:.1%} "
+                    f"(budget: {1 - config.QUANTIZATION_ACCURACY_BUDGET:.1%}) {'✓' if within_budget else '✗'}")
+        logger.info(f"   Latency: FP32 {result.fp32_latency * 1000:.1f}ms -> "
+                    f"INT8 {result.int8_latency * 1000:.1f}ms ({result.speedup:.2f}x)")
+
+        if not args.no_register:
+            register_quantized_model(result)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -5,25 +5,38 @@ Date: 2025-06-17
 """
 
 import asyncio
+import math
 import time
 from typing import Any, Callable, TypeVar, List
 import functools
+import numpy as np
+
+from src.utils.logging_config import AGGREGATE, get_logger
+from src.utils.tracing import CATEGORY_FUNCTION, TRACER
+
+logger = get_logger("helpers")
 
 T = TypeVar('T')
 
 
+def _record_call(name: str, start_time: float, threshold: float):
+    """Log a slow call and trace it (slow calls always, others sampled)"""
+    end_time = time.time()
+    execution_time = end_time - start_time
+    slow = execution_time > threshold
+    if slow:
+        logger.warning(f"⚠️  {name} took {execution_time:.3f}s", extra=AGGREGATE)
+    if slow or TRACER.sample_call():
+        TRACER.add(name, start_time, end_time, category=CATEGORY_FUNCTION)
+
+
 def async_timer(func: Callable) -> Callable:
     """Decorator to time async functions"""
     @functools.wraps(func)
     async def wrapper(*args, **kwargs):
         start_time = time.time()
         result = await func(*args, **kwargs)
-        execution_time = time.time() - start_time
-        
-        # Log if function takes too long
-        if execution_time > 0.1:  # 100ms threshold
-            print(f"⚠️  {func.__name__} took {execution_time:.3f}s")
-        
+        _record_call(func.__name__, start_time, 0.1)  # 100ms threshold
         return result
     return wrapper
 
@@ -34,70 +47,206 @@ def timer(func: Callable) -> Callable:
     def wrapper(*args, **kwargs):
         start_time = time.time()
         result = func(*args, **kwargs)
-        execution_time = time.time() - start_time
-        
-        if execution_time > 0.05:  # 50ms threshold for sync functions
-            print(f"⚠️  {func.__name__} took {execution_time:.3f}s")
-        
+        _record_call(func.__name__, start_time, 0.05)  # 50ms threshold for sync functions
         return result
     return wrapper
 
 
+class LatencyHistogram:
+    """
+    Log-bucketed histogram for streaming percentiles
+
+    Buckets grow by GROWTH per step from MIN_VALUE, so a percentile is
+    accurate to about half a bucket (2.5%) over 1us - 100s. Samples can
+    be removed again, which keeps the histogram in sync with a window.
+    """
+
+    MIN_VALUE = 1e-6
+    MAX_VALUE = 100.0
+    GROWTH = 1.05
+
+    def __init__(self):
+        self._log_growth = math.log(self.GROWTH)
+        self.size = int(math.ceil(math.log(self.MAX_VALUE / self.MIN_VALUE) / self._log_growth)) + 1
+        self.buckets = np.zeros(self.size, dtype=np.int64)
+        self.total = 0
+
+    def bucket(self, value: float) -> int:
+        """Bucket index of a value"""
+        if value <= self.MIN_VALUE:
+            return 0
+        return min(self.size - 1, int(math.log(value / self.MIN_VALUE) / self._log_growth) + 1)
+
+    def add(self, bucket: int):
+        self.buckets[bucket] += 1
+        self.total += 1
+
+    def remove(self, bucket: int):
+        self.buckets[bucket] -= 1
+        self.total -= 1
+
+    def percentile(self, q: float) -> float:
+        """Approximate q-th percentile (0-100), the geometric middle of its bucket"""
+        if self.total <= 0:
+            return 0.0
+        rank = max(1, int(math.ceil(q / 100.0 * self.total)))
+        bucket = int(np.searchsorted(np.cumsum(self.buckets), rank))
+        if bucket == 0:
+            return self.MIN_VALUE
+        return self.MIN_VALUE * self.GROWTH ** (bucket - 0.5)
+
+
 class PerformanceTracker:
-    """Track performance metrics"""
+    """
+    Track performance metrics over the last max_samples samples
+
+    Samples live in fixed NumPy ring buffers with running sums, so adding
+    a sample and reading averages are O(1). A sample may stand for several
+    frames (a batch): fps is frames per wall-clock second over the last
+    fps_window seconds, and percentiles come from a histogram kept in step
+    with the window.
+    """
     
-    def __init__(self, max_samples: int = 100):
-        self.max_samples = max_samples
-        self.times = []
-        self.counts = []
+    def __init__(self, max_samples: int = 100, fps_window: float = 5.0):
+        self.max_samples = max(1, max_samples)
+        self.fps_window = fps_window
+        self._times = np.zeros(self.max_samples)
+        self._counts = np.zeros(self.max_samples)
+        self._stamps = np.zeros(self.max_samples)
+        self._frame_totals = np.zeros(self.max_samples)  # frames recorded up to and including each sample
+        self._buckets = np.zeros(self.max_samples, dtype=np.int32)
+        self._histogram = LatencyHistogram()
+        self._next = 0
+        self._size = 0
+        self._time_sum = 0.0
+        self._count_sum = 0.0
+        self.total_samples = 0
+        self.total_frames = 0
     
-    def add_sample(self, execution_time: float, count: int = 1):
-        """Add a performance sample"""
-        self.times.append(execution_time)
-        self.counts.append(count)
+    def add_sample(self, execution_time: float, count: int = 1, frames: int = 1):
+        """
+        Add a performance sample
         
-        # Keep only recent samples
-        if len(self.times) > self.max_samples:
-            self.times.pop(0)
-            self.counts.pop(0)
+        Args:
+            execution_time: Seconds the work took
+            count: Value averaged by average_count (items, vehicles, ...)
+            frames: Frames the sample covers, counted by fps
+        """
+        i = self._next
+        if self._size == self.max_samples:
+            # Evict the oldest sample from the sums and histogram
+            self._time_sum -= self._times[i]
+            self._count_sum -= self._counts[i]
+            self._histogram.remove(self._buckets[i])
+        else:
+            self._size += 1
+        
+        bucket = self._histogram.bucket(execution_time)
+        self._times[i] = execution_time
+        self._counts[i] = count
+        self._stamps[i] = time.time()
+        self.total_frames += frames
+        self._frame_totals[i] = self.total_frames
+        self._buckets[i] = bucket
+        self._histogram.add(bucket)
+        self._time_sum += execution_time
+        self._count_sum += count
+        self.total_samples += 1
+        
+        self._next = (i + 1) % self.max_samples
+        if self._next == 0:
+            # Re-sum once per lap so floating point drift cannot build up
+            self._time_sum = float(self._times.sum())
+            self._count_sum = float(self._counts.sum())
+    
+    def _ordered(self, values: np.ndarray) -> np.ndarray:
+        """Ring contents from oldest to newest"""
+        if self._size < self.max_samples:
+            return values[:self._size]
+        return np.concatenate((values[self._next:], values[:self._next]))
+    
+    @property
+    def times(self) -> List[float]:
+        """Recent execution times, oldest first"""
+        return self._ordered(self._times).tolist()
+    
+    @property
+    def counts(self) -> List[float]:
+        """Recent counts, oldest first"""
+        return self._ordered(self._counts).tolist()
+    
+    def recent_times(self, n: int) -> np.ndarray:
+        """The last n execution times, oldest first"""
+        n = min(n, self._size)
+        indices = (self._next - n + np.arange(n)) % self.max_samples
+        return self._times[indices]
     
     @property
     def average_time(self) -> float:
         """Get average execution time"""
-        return sum(self.times) / len(self.times) if self.times else 0.0
+        return self._time_sum / self._size if self._size else 0.0
     
     @property
     def average_count(self) -> float:
         """Get average count"""
-        return sum(self.counts) / len(self.counts) if self.counts else 0.0
+        return self._count_sum / self._size if self._size else 0.0
     
     @property
     def fps(self) -> float:
-        """Calculate FPS based on recent samples"""
-        if not self.times:
+        """Frames per wall-clock second over the last fps_window seconds"""
+        if self._size < 2:
             return 0.0
-        return 1.0 / self.average_time if self.average_time > 0 else 0.0
+        now = time.time()
+        since = now - self.fps_window
+        
+        # Stamps increase from the oldest slot on: binary search the first one in the window
+        oldest = self._next if self._size == self.max_samples else 0
+        low, high = 0, self._size
+        while low < high:
+            mid = (low + high) // 2
+            if self._stamps[(oldest + mid) % self.max_samples] < since:
+                low = mid + 1
+            else:
+                high = mid
+        if self._size - low < 2:
+            return 0.0
+        first = (oldest + low) % self.max_samples
+        elapsed = now - self._stamps[first]
+        # Frames recorded after the first sample in the window, which only marks its start
+        frames = self.total_frames - self._frame_totals[first]
+        return frames / elapsed if elapsed > 0 else 0.0
+    
+    def percentile(self, q: float) -> float:
+        """Approximate q-th percentile (0-100) of the recent execution times"""
+        return self._histogram.percentile(q)
     
     def get_stats(self) -> dict:
         """Get comprehensive statistics"""
-        if not self.times:
+        if not self._size:
             return {
                 "samples": 0,
                 "avg_time": 0.0,
                 "avg_count": 0.0,
                 "fps": 0.0,
                 "min_time": 0.0,
-                "max_time": 0.0
+                "max_time": 0.0,
+                "p50_time": 0.0,
+                "p95_time": 0.0,
+                "p99_time": 0.0
             }
         
+        window = self._times[:self._size]
         return {
-            "samples": len(self.times),
+            "samples": self._size,
             "avg_time": self.average_time,
             "avg_count": self.average_count,
             "fps": self.fps,
-            "min_time": min(self.times),
-            "max_time": max(self.times),
-            "recent_times": self.times[-10:]  # Last 10 samples
+            "min_time": float(window.min()),
+            "max_time": float(window.max()),
+            "p50_time": self.percentile(50),
+            "p95_time": self.percentile(95),
+            "p99_time": self.percentile(99),
+            "recent_times": self.recent_times(10).tolist()  # Last 10 samples
         }
 
 
@@ -106,7 +255,7 @@ async def run_with_timeout(coro, timeout: float, default_value=None):
     try:
         return await asyncio.wait_for(coro, timeout=timeout)
     except asyncio.TimeoutError:
-        print(f"⚠️  Operation timed out after {timeout}s")
+        logger.warning(f"⚠️  Operation timed out after {timeout}s", extra=AGGREGATE)
         return default_value
 
 
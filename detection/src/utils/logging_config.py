@@ -4,58 +4,192 @@ Author: Alims-Repo
 Date: 2025-06-17
 """
 
+import atexit
+import json
 import logging
 import logging.handlers
+import queue
 import sys
+import threading
+import time
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
 from config.settings import get_config
+from src.utils.metrics import REGISTRY, MetricFamily
 
 config = get_config()
 
+# extra= for hot-path messages, folded per call site by RepeatFilter
+AGGREGATE = {"aggregate": True}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["DroppingQueueHandler"] = None
+_flush_stop: Optional[threading.Event] = None
+_flush_thread: Optional[threading.Thread] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record (JSON lines)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName
+        }
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RepeatFilter(logging.Filter):
+    """
+    Rate limits records logged with extra=AGGREGATE, per call site
+
+    The first record from a line passes, the ones that follow within
+    interval seconds are only counted. The first record after the
+    interval passes again, with the number it stands for. Windows that
+    end without a further record are written out by flush(), which the
+    logging setup calls on a timer and at shutdown.
+    """
+
+    def __init__(self, interval: float = config.LOG_AGGREGATE_INTERVAL):
+        super().__init__()
+        self.interval = interval
+        self._sites: Dict[Tuple[str, int], list] = {}  # call site: [window start, suppressed, last suppressed record]
+        self._lock = threading.Lock()
+        self.suppressed_total = 0  # Counted when a window closes, so it only grows
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.interval <= 0 or not getattr(record, "aggregate", False):
+            return True
+
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            site = self._sites.get(key)
+            if site is not None and record.created - site[0] < self.interval:
+                site[1] += 1
+                site[2] = record
+                return False
+            if site is not None:
+                self.suppressed_total += site[1]
+            self._sites[key] = [record.created, 0, None]
+
+        suppressed = site[1] if site else 0
+        if suppressed:
+            record.suppressed = suppressed
+            record.msg = f"{record.msg} (+{suppressed} similar in {record.created - site[0]:.1f}s)"
+        return True
+
+    def flush(self, force: bool = False) -> List[logging.LogRecord]:
+        """
+        Close finished windows (every window when force is set)
+
+        Returns:
+            The last suppressed record of each window that had any,
+            standing for the others; they no longer carry the aggregate flag
+        """
+        now = time.time()
+        records = []
+        with self._lock:
+            for key, (start, suppressed, last) in list(self._sites.items()):
+                if not force and now - start < self.interval:
+                    continue
+                del self._sites[key]
+                if not suppressed:
+                    continue
+                last.aggregate = False
+                self.suppressed_total += suppressed - 1  # The last one is written
+                if suppressed > 1:
+                    last.suppressed = suppressed - 1
+                    last.msg = f"{last.msg} (+{suppressed - 1} similar in {last.created - start:.1f}s)"
+                records.append(last)
+        return records
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records instead of blocking when the writer falls behind"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self.repeat_filter: Optional[RepeatFilter] = None
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush_repeats(self, force: bool = False):
+        """Queue the summaries of finished repeat windows"""
+        if self.repeat_filter is not None:
+            for record in self.repeat_filter.flush(force):
+                self.handle(record)
+
 
 def setup_logging(
     log_level: Optional[str] = None,
     log_file: Optional[Path] = None,
-    console_output: bool = True
+    console_output: bool = True,
+    json_output: Optional[bool] = None
 ) -> logging.Logger:
     """
     Setup logging configuration
-    
+
+    Records are queued by the calling thread and written by a dedicated
+    listener thread, so console and file I/O never run on the event loop.
+
     Args:
         log_level: Logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
         log_file: Path to log file
         console_output: Whether to output to console
-    
+        json_output: Write JSON lines (defaults to LOG_FORMAT == "json")
+
     Returns:
         Configured logger
     """
-    
+    global _listener, _queue_handler, _flush_stop, _flush_thread
+
     # Use config defaults if not provided
     log_level = log_level or config.LOG_LEVEL
     log_file = log_file or config.LOG_FILE
-    
+    if json_output is None:
+        json_output = config.LOG_FORMAT == "json"
+
     # Create logger
     logger = logging.getLogger("vehicle_detection")
     logger.setLevel(getattr(logging, log_level.upper()))
-    
-    # Clear existing handlers
+
+    # Clear existing handlers and the previous writer thread
     logger.handlers.clear()
-    
+    stop_logging()
+
     # Create formatter
-    formatter = logging.Formatter(
-        fmt="%(asctime)s | %(levelname)-8s | %(name)s | %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S"
-    )
-    
+    if json_output:
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            fmt="%(asctime)s | %(levelname)-8s | %(name)s | %(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S"
+        )
+
+    handlers = []
+
     # Console handler
     if console_output:
         console_handler = logging.StreamHandler(sys.stdout)
         console_handler.setLevel(logging.INFO)
         console_handler.setFormatter(formatter)
-        logger.addHandler(console_handler)
-    
+        handlers.append(console_handler)
+
     # File handler with rotation
     if log_file:
         log_file.parent.mkdir(parents=True, exist_ok=True)
@@ -66,11 +200,83 @@ def setup_logging(
         )
         file_handler.setLevel(getattr(logging, log_level.upper()))
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
-    
+        handlers.append(file_handler)
+
+    # Callers only enqueue; the listener thread formats and writes
+    queue_handler = DroppingQueueHandler(queue.Queue(config.LOG_QUEUE_SIZE))
+    queue_handler.repeat_filter = RepeatFilter()
+    queue_handler.addFilter(queue_handler.repeat_filter)
+    logger.addHandler(queue_handler)
+    _queue_handler = queue_handler
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+    # Write out repeat windows that end without a further record
+    interval = queue_handler.repeat_filter.interval
+    if interval > 0:
+        _flush_stop = threading.Event()
+        _flush_thread = threading.Thread(
+            target=_flush_repeats, args=(queue_handler, _flush_stop, interval), name="log-flush", daemon=True
+        )
+        _flush_thread.start()
+
     return logger
 
 
+def _flush_repeats(queue_handler: DroppingQueueHandler, stop: threading.Event, interval: float):
+    """Flush thread loop"""
+    while not stop.wait(interval):
+        queue_handler.flush_repeats()
+
+
+def stop_logging():
+    """Flush pending repeat counts and queued records, and stop the writer thread"""
+    global _listener, _flush_stop, _flush_thread
+    if _flush_thread is not None:
+        _flush_stop.set()
+        _flush_thread.join()
+        _flush_stop = _flush_thread = None
+    if _queue_handler is not None:
+        _queue_handler.flush_repeats(force=True)
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
+
+
+def get_logging_stats() -> dict:
+    """Writer queue and aggregation counters"""
+    if _queue_handler is None:
+        return {"queued": 0, "dropped": 0, "suppressed": 0}
+    return {
+        "queued": _queue_handler.queue.qsize(),
+        "queue_size": _queue_handler.queue.maxsize,
+        "dropped": _queue_handler.dropped,
+        "suppressed": _queue_handler.repeat_filter.suppressed_total,
+        "aggregate_interval": _queue_handler.repeat_filter.interval
+    }
+
+
+def collect_metrics() -> List[MetricFamily]:
+    """Log counters for /metrics"""
+    stats = get_logging_stats()
+    dropped = MetricFamily(
+        "vehicle_detection_log_records_dropped", "counter", "Log records dropped because the writer queue was full"
+    )
+    suppressed = MetricFamily(
+        "vehicle_detection_log_records_suppressed", "counter", "Repeated log records folded into a summary line"
+    )
+    dropped.add((), stats["dropped"])
+    suppressed.add((), stats["suppressed"])
+    return [dropped, suppressed]
+
+
+REGISTRY.add_collector(collect_metrics)
+
+
 def get_logger(name: str) -> logging.Logger:
     """Get a child logger"""
     return logging.getLogger("vehicle_detection").getChild(name)
\ No newline at end of file
@@ -0,0 +1,282 @@
+"""
+Prometheus metrics with in-process aggregation
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import math
+
+# Seconds, from sub-millisecond decode/send up to multi-second stalls
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.0075, 0.01, 0.015, 0.02, 0.03, 0.05,
+    0.075, 0.1, 0.15, 0.25, 0.5, 1.0, 2.5
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# A scrape-time sample: (metric name suffix, labels, value)
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(ABC):
+    """Named metric family with optional labels; children are created on first use"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        """
+        Child for a label combination
+
+        Callers on the hot path should keep the returned child instead of
+        looking it up per observation.
+        """
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            # setdefault keeps one child if two threads race on creation
+            child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def remove(self, *values: str):
+        """Drop a label combination, e.g. for a removed source"""
+        self._children.pop(tuple(str(value) for value in values), None)
+
+    @abstractmethod
+    def _new_child(self):
+        """Empty child for a new label combination"""
+
+    def samples(self) -> Iterable[Sample]:
+        for key, child in list(self._children.items()):
+            labels = dict(zip(self.labelnames, key))
+            for suffix, extra, value in child.samples():
+                yield suffix, {**labels, **extra}, value
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def samples(self) -> Iterable[Sample]:
+        yield "_total", {}, self.value
+
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def samples(self) -> Iterable[Sample]:
+        yield "", {}, self.value
+
+
+class _HistogramChild:
+    """
+    Fixed-bucket histogram
+
+    observe() is a bisect and three increments, with no lock: updates
+    rely on the GIL, and a rare lost increment between two writer
+    threads is accepted so the frame loop never waits on a scrape.
+    """
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self) -> Iterable[Sample]:
+        counts = list(self.counts)
+        cumulative = 0
+        for bound, count in zip(self.bounds + (math.inf,), counts):
+            cumulative += count
+            yield "_bucket", {"le": _format_value(bound)}, cumulative
+        yield "_sum", {}, self.sum
+        yield "_count", {}, cumulative
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+
+class MetricFamily:
+    """Metric built at scrape time by a collector"""
+
+    def __init__(self, name: str, kind: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.kind = kind
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._samples: List[Sample] = []
+
+    def add(self, labelvalues: Sequence[str], value: float):
+        suffix = "_total" if self.kind == "counter" else ""
+        self._samples.append((suffix, dict(zip(self.labelnames, (str(v) for v in labelvalues))), value))
+
+    def samples(self) -> Iterable[Sample]:
+        return self._samples
+
+
+class MetricsRegistry:
+    """
+    Metrics exposed on /metrics in the Prometheus text format
+
+    Hot-path code updates registered metrics directly. State that is
+    already counted elsewhere (queue depths, drop counters, client
+    backlogs) is read by collectors only when scraped, so it costs
+    nothing between scrapes.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[MetricFamily]]] = []
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable[MetricFamily]]):
+        """Register a callable returning MetricFamily objects at scrape time"""
+        if collector not in self._collectors:
+            self._collectors.append(collector)
+
+    def remove_collector(self, collector: Callable[[], Iterable[MetricFamily]]):
+        if collector in self._collectors:
+            self._collectors.remove(collector)
+
+    def render(self) -> str:
+        """Text exposition of every metric and collector"""
+        families = list(self._metrics.values())
+        for collector in list(self._collectors):
+            families.extend(collector())
+
+        lines = []
+        for family in families:
+            lines.append(f"# HELP {family.name} {family.documentation}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for suffix, labels, value in family.samples():
+                lines.append(f"{family.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Per-source stages: decode, capture, inference (including scheduling), encode, fanout, send
+SOURCE_STAGE_SECONDS = REGISTRY.histogram(
+    "vehicle_detection_source_stage_seconds",
+    "Latency of a pipeline stage for one frame or batch of a source",
+    ("source", "stage")
+)
+
+# Per-model stages inside the detector: preprocess, inference, postprocess
+MODEL_STAGE_SECONDS = REGISTRY.histogram(
+    "vehicle_detection_model_stage_seconds",
+    "Latency of a detector stage for one batch",
+    ("model", "stage")
+)
+
+MODEL_FRAMES = REGISTRY.counter(
+    "vehicle_detection_model_frames",
+    "Frames run through the detector",
+    ("model",)
+)
+
+
+def observe_stages(histogram: Histogram, label: str, stage_times: Optional[Dict[str, float]]):
+    """Observe a {stage: seconds} mapping under one first label"""
+    if not stage_times:
+        return
+    for stage, seconds in stage_times.items():
+        histogram.labels(label, stage).observe(seconds)
\ No newline at end of file
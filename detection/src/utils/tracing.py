@@ -0,0 +1,228 @@
+"""
+Per-frame tracing with Chrome trace / Perfetto export
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+import itertools
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from config.settings import get_config
+
+config = get_config()
+
+CATEGORY_FRAME = "frame"  # Pipeline work for one frame id
+CATEGORY_FUNCTION = "function"  # Timed helper calls
+
+# name, category, start, end (time.time() seconds), pid, tid, source, frame id, args
+Span = Tuple[str, str, float, float, int, int, Optional[str], Optional[int], Optional[dict]]
+
+
+class Tracer:
+    """
+    Fixed-size in-memory span buffer
+
+    Writers claim a slot from an itertools counter (atomic under the GIL)
+    and store one tuple, so recording never takes a lock and the oldest
+    spans are overwritten once the buffer is full. Frames are sampled by
+    id, so every stage makes the same decision for a frame without
+    passing a flag along the pipeline. Timestamps are time.time(), which
+    is comparable between the decode, inference and server processes.
+    """
+
+    def __init__(
+        self,
+        capacity: int = config.TRACE_BUFFER_SIZE,
+        sample_rate: float = config.TRACE_SAMPLE_RATE,
+        enabled: bool = config.TRACING
+    ):
+        self.capacity = max(1, capacity)
+        self._spans: List[Optional[Span]] = [None] * self.capacity
+        self._index = itertools.count()
+        self._calls = itertools.count()
+        self.recorded = 0
+        self.configure(sample_rate, enabled)
+
+    def configure(self, sample_rate: Optional[float] = None, enabled: Optional[bool] = None):
+        """Change sampling at runtime"""
+        if sample_rate is not None:
+            self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+            self.every = round(1.0 / self.sample_rate) if self.sample_rate > 0 else 0
+        if enabled is not None:
+            self.enabled = enabled
+
+    def sampled(self, frame_id: int) -> bool:
+        """True for frames whose spans are recorded"""
+        return self.enabled and self.every > 0 and frame_id % self.every == 0
+
+    def sample_call(self) -> bool:
+        """Sampling decision for spans that do not belong to a frame"""
+        return self.enabled and self.every > 0 and next(self._calls) % self.every == 0
+
+    def add(
+        self,
+        name: str,
+        start: float,
+        end: float,
+        source: Optional[str] = None,
+        frame_id: Optional[int] = None,
+        category: str = CATEGORY_FRAME,
+        pid: Optional[int] = None,
+        tid: Optional[int] = None,
+        args: Optional[dict] = None
+    ):
+        """
+        Record a finished span
+
+        Args:
+            name: Span name (decode, infer, encode, send, ...)
+            start: Start time, time.time() seconds
+            end: End time, time.time() seconds
+            source: Source id
+            frame_id: Frame the work belongs to
+            category: Span category
+            pid: Process that did the work (default: this one)
+            tid: Thread that did the work (default: the calling thread)
+            args: Extra values shown with the span
+        """
+        if not self.enabled:
+            return
+        index = next(self._index)
+        self._spans[index % self.capacity] = (
+            name, category, start, end,
+            pid if pid is not None else os.getpid(),
+            tid if tid is not None else threading.get_ident(),
+            source, frame_id, args
+        )
+        self.recorded = index + 1
+
+    @contextmanager
+    def span(self, name: str, source: Optional[str] = None, frame_id: Optional[int] = None, **args):
+        """Record the enclosed block when its frame is sampled"""
+        if frame_id is None or not self.sampled(frame_id):
+            yield
+            return
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.time(), source, frame_id, args=args or None)
+
+    def spans(self) -> List[Span]:
+        """Buffered spans, oldest first"""
+        return sorted((span for span in list(self._spans) if span is not None), key=lambda span: span[2])
+
+    def clear(self):
+        self._spans = [None] * self.capacity
+
+    def export(
+        self,
+        source: Optional[str] = None,
+        frame_id: Optional[int] = None,
+        slowest: int = 0
+    ) -> dict:
+        """
+        Buffered spans as a Chrome trace (JSON object format)
+
+        Spans become complete ("X") events on the thread that ran them,
+        and the spans of each frame are chained with flow arrows, so
+        Perfetto or chrome://tracing show a frame's path across threads
+        and processes.
+
+        Args:
+            source: Only this source
+            frame_id: Only this frame
+            slowest: Only the N frames with the longest decode-to-send time
+
+        Returns:
+            Trace dictionary, ready for json.dumps
+        """
+        spans = [
+            span for span in self.spans()
+            if (source is None or span[6] == source) and (frame_id is None or span[7] == frame_id)
+        ]
+
+        frames: Dict[Tuple[str, int], List[Span]] = defaultdict(list)
+        for span in spans:
+            if span[7] is not None:
+                frames[(span[6], span[7])].append(span)
+
+        if slowest > 0:
+            ranked = sorted(
+                frames.items(),
+                key=lambda item: max(span[3] for span in item[1]) - min(span[2] for span in item[1]),
+                reverse=True
+            )
+            frames = dict(ranked[:slowest])
+            spans = sorted((span for frame_spans in frames.values() for span in frame_spans), key=lambda span: span[2])
+
+        events = []
+        for name, category, start, end, pid, tid, span_source, span_frame, args in spans:
+            event_args = dict(args) if args else {}
+            if span_source is not None:
+                event_args["source"] = span_source
+            if span_frame is not None:
+                event_args["frame"] = span_frame
+            events.append({
+                "name": name, "cat": category, "ph": "X",
+                "ts": start * 1e6, "dur": max(end - start, 0.0) * 1e6,
+                "pid": pid, "tid": tid, "args": event_args
+            })
+
+        for flow_id, ((flow_source, flow_frame), frame_spans) in enumerate(frames.items(), 1):
+            if len(frame_spans) < 2:
+                continue
+            for position, span in enumerate(frame_spans):
+                phase = "s" if position == 0 else "f" if position == len(frame_spans) - 1 else "t"
+                event = {
+                    "name": f"frame {flow_source}:{flow_frame}", "cat": CATEGORY_FRAME, "ph": phase,
+                    "id": flow_id, "ts": span[2] * 1e6, "pid": span[4], "tid": span[5]
+                }
+                if phase == "f":
+                    event["bp"] = "e"
+                events.append(event)
+
+        events.extend(self._metadata(spans))
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "sample_rate": self.sample_rate,
+                "spans": len(spans),
+                "frames": len(frames)
+            }
+        }
+
+    @staticmethod
+    def _metadata(spans: List[Span]) -> List[dict]:
+        """Process and thread names for the ids in the trace"""
+        own_pid = os.getpid()
+        threads = {thread.ident: thread.name for thread in threading.enumerate()}
+        events = []
+        for pid in {span[4] for span in spans}:
+            events.append({
+                "name": "process_name", "ph": "M", "pid": pid,
+                "args": {"name": "server" if pid == own_pid else f"worker {pid}"}
+            })
+        for pid, tid in {(span[4], span[5]) for span in spans}:
+            name = threads.get(tid) if pid == own_pid else None
+            if name:
+                events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}})
+        return events
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "capacity": self.capacity,
+            "recorded": self.recorded,
+            "buffered": sum(1 for span in self._spans if span is not None)
+        }
+
+
+TRACER = Tracer()
\ No newline at end of file
@@ -0,0 +1,10 @@
+"""
+Test configuration: make the service packages importable
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,97 @@
+"""
+Tests for BenchmarkCache keys and storage
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+import platform
+
+import pytest
+
+pytest.importorskip("torch")
+
+from config.settings import get_config
+from src.core.benchmark_cache import BenchmarkCache
+
+config = get_config()
+
+
+@pytest.fixture
+def models(tmp_path):
+    paths = [tmp_path / "yolov8n.pt", tmp_path / "yolov8s.pt"]
+    for path in paths:
+        path.write_bytes(path.name.encode())
+    return paths
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return BenchmarkCache(tmp_path / "benchmark_cache.json")
+
+
+def test_key_is_stable(cache, models):
+    assert cache.key(models) == cache.key(list(reversed(models)))
+
+
+def test_changed_model_file_changes_the_key(cache, models):
+    key = cache.key(models)
+    models[0].write_bytes(b"retrained weights")
+    assert cache.key(models) != key
+
+
+def test_settings_change_the_key(cache, models, monkeypatch):
+    key = cache.key(models)
+    monkeypatch.setattr(config, "INPUT_SIZE", config.INPUT_SIZE + 32)
+    assert cache.key(models) != key
+
+    monkeypatch.undo()
+    monkeypatch.setattr(config, "INFERENCE_BACKENDS", ["ultralytics"])
+    assert cache.key(models) != key
+
+
+def test_missing_models_are_left_out(cache, models):
+    assert cache.key(models + [models[0].parent / "missing.pt"]) == cache.key(models)
+
+
+def test_put_get_clear(cache, models):
+    key = cache.key(models)
+    assert cache.get(key) is None
+
+    cache.put(key, {"backend": "onnx"}, [{"backend": "onnx", "fps": 30.0}])
+    assert cache.get(key)["winner"] == {"backend": "onnx"}
+    assert cache.get("other") is None
+
+    cache.clear()
+    assert cache.get(key) is None
+
+
+def test_unreadable_cache_is_ignored(cache):
+    cache.path.write_text("{not json")
+    assert cache.get("anything") is None
+
+
+def test_backend_exports_change_the_key(cache, models, monkeypatch):
+    monkeypatch.setattr(config, "INFERENCE_BACKENDS", ["ultralytics", "onnxruntime", "openvino"])
+    key = cache.key(models)
+
+    onnx = models[0].with_suffix(".onnx")
+    onnx.write_bytes(b"exported graph")
+    with_onnx = cache.key(models)
+    assert with_onnx != key
+    onnx.write_bytes(b"re-exported graph")
+    assert cache.key(models) != with_onnx
+
+    key = cache.key(models)
+    openvino = models[0].parent / "yolov8n_openvino_model"
+    openvino.mkdir()
+    (openvino / "yolov8n.bin").write_bytes(b"weights")
+    with_openvino = cache.key(models)
+    assert with_openvino != key
+    (openvino / "yolov8n.bin").write_bytes(b"new weights")
+    assert cache.key(models) != with_openvino
+
+
+def test_key_does_not_depend_on_the_hostname(cache, models, monkeypatch):
+    key = cache.key(models)
+    monkeypatch.setattr(platform, "node", lambda: "another-host")
+    assert cache.key(models) == key
@@ -0,0 +1,73 @@
+"""
+Tests for VideoBroadcaster idle handling
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+
+from config.settings import get_config
+from src.core.broadcaster import VideoBroadcaster
+
+config = get_config()
+
+
+class FakeScheduler:
+    """Records the idle flags a broadcaster reports"""
+
+    def __init__(self):
+        self.idle = {}
+
+    def set_source_idle(self, source_id: str, idle: bool):
+        self.idle[source_id] = idle
+
+    def source_batch_size(self) -> int:
+        return 1
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "clip.avi"
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 10, (64, 48))
+    for _ in range(5):
+        writer.write(np.zeros((48, 64, 3), np.uint8))
+    writer.release()
+    return path
+
+
+@pytest.fixture
+def broadcaster(video, monkeypatch):
+    monkeypatch.setattr(config, "IDLE_MODE", "keepalive")
+    monkeypatch.setattr(config, "IDLE_KEEPALIVE_INTERVAL", 0.01)
+    detector = SimpleNamespace(batch_size=1, class_names={})
+    return VideoBroadcaster(video, detector, "cpu", source_id="cam", scheduler=FakeScheduler())
+
+
+def test_client_connecting_during_a_keepalive_frame_leaves_idle(broadcaster):
+    frame = np.zeros((48, 64, 3), np.uint8)
+    reads = []
+
+    async def read_frame():
+        reads.append(broadcaster.idle_since is not None)
+        if len(reads) == 1:
+            # Keepalive read: a client connects meanwhile, no wakeup pending
+            broadcaster.clients.add("client")
+            return True, frame
+        broadcaster.is_running = False
+        return False, None
+
+    broadcaster.read_frame = read_frame
+    broadcaster.is_running = True
+    asyncio.run(broadcaster.capture_stage())
+
+    assert reads == [True, False]
+    assert broadcaster.keepalive_frames == 1
+    assert broadcaster.idle_since is None
+    assert broadcaster.scheduler.idle["cam"] is False
@@ -0,0 +1,104 @@
+"""
+Tests for LatencyHistogram and PerformanceTracker
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+import pytest
+
+from src.utils import helpers
+from src.utils.helpers import LatencyHistogram, PerformanceTracker
+
+
+class FakeClock:
+    """Stands in for time.time() inside the helpers module"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(helpers.time, "time", fake.time)
+    return fake
+
+
+def test_histogram_percentiles_within_a_bucket():
+    histogram = LatencyHistogram()
+    for value in (0.001, 0.002, 0.003, 0.004, 0.1):
+        histogram.add(histogram.bucket(value))
+
+    assert histogram.percentile(50) == pytest.approx(0.003, rel=0.05)
+    assert histogram.percentile(100) == pytest.approx(0.1, rel=0.05)
+
+
+def test_histogram_remove_and_bounds():
+    histogram = LatencyHistogram()
+    assert histogram.percentile(50) == 0.0
+
+    bucket = histogram.bucket(0.5)
+    histogram.add(bucket)
+    histogram.remove(bucket)
+    assert histogram.total == 0
+    assert histogram.percentile(99) == 0.0
+
+    assert histogram.bucket(0.0) == 0
+    assert histogram.bucket(1e9) == histogram.size - 1
+
+
+def test_tracker_averages_evict_oldest_samples():
+    tracker = PerformanceTracker(max_samples=3)
+    for execution_time, count in ((1.0, 10), (2.0, 20), (3.0, 30), (4.0, 40)):
+        tracker.add_sample(execution_time, count)
+
+    assert tracker.times == [2.0, 3.0, 4.0]
+    assert tracker.average_time == pytest.approx(3.0)
+    assert tracker.average_count == pytest.approx(30.0)
+    assert tracker.recent_times(2).tolist() == [3.0, 4.0]
+    assert tracker.total_samples == 4
+
+
+def test_tracker_percentiles_follow_the_window():
+    tracker = PerformanceTracker(max_samples=10)
+    for _ in range(10):
+        tracker.add_sample(1.0)
+    for _ in range(10):
+        tracker.add_sample(0.01)
+
+    stats = tracker.get_stats()
+    assert stats["p99_time"] == pytest.approx(0.01, rel=0.05)
+    assert stats["max_time"] == pytest.approx(0.01)
+
+
+def test_tracker_fps_counts_frames_of_batched_samples(clock):
+    tracker = PerformanceTracker(fps_window=5.0)
+    for _ in range(5):
+        tracker.add_sample(0.05, count=3, frames=4)
+        clock.now += 0.5
+
+    # Four samples of four frames after the first one, over 2.5s
+    assert tracker.fps == pytest.approx(16 / 2.5)
+
+
+def test_tracker_fps_ignores_samples_outside_the_window(clock):
+    tracker = PerformanceTracker(fps_window=1.0)
+    tracker.add_sample(0.01)
+    clock.now += 10.0
+    for _ in range(3):
+        tracker.add_sample(0.01)
+        clock.now += 0.1
+
+    assert tracker.fps == pytest.approx(2 / 0.3)
+
+    clock.now += 10.0
+    assert tracker.fps == 0.0
+
+
+def test_tracker_empty_stats():
+    stats = PerformanceTracker().get_stats()
+    assert stats["samples"] == 0
+    assert stats["fps"] == 0.0
@@ -0,0 +1,74 @@
+"""
+Tests for RepeatFilter
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+import logging
+
+from src.utils.logging_config import AGGREGATE, RepeatFilter
+
+
+def record(created: float, message: str = "send failed", lineno: int = 10, aggregate: bool = True) -> logging.LogRecord:
+    fields = {"msg": message, "pathname": "clients.py", "lineno": lineno, "created": created}
+    if aggregate:
+        fields.update(AGGREGATE)
+    return logging.makeLogRecord(fields)
+
+
+def test_repeats_within_the_interval_are_counted():
+    repeat_filter = RepeatFilter(interval=10.0)
+    assert repeat_filter.filter(record(100.0))
+    assert not any(repeat_filter.filter(record(100.0 + i)) for i in range(1, 4))
+    assert repeat_filter.suppressed_total == 0  # Window still open
+
+    after = record(111.0)
+    assert repeat_filter.filter(after)
+    assert after.suppressed == 3
+    assert after.getMessage() == "send failed (+3 similar in 11.0s)"
+    assert repeat_filter.suppressed_total == 3
+
+
+def test_call_sites_are_folded_separately():
+    repeat_filter = RepeatFilter(interval=10.0)
+    assert repeat_filter.filter(record(100.0, lineno=10))
+    assert repeat_filter.filter(record(100.0, lineno=20))
+    assert not repeat_filter.filter(record(101.0, lineno=10))
+
+
+def test_records_without_the_flag_always_pass():
+    repeat_filter = RepeatFilter(interval=10.0)
+    assert all(repeat_filter.filter(record(100.0, aggregate=False)) for _ in range(5))
+
+
+def test_zero_interval_disables_folding():
+    repeat_filter = RepeatFilter(interval=0)
+    assert all(repeat_filter.filter(record(100.0)) for _ in range(5))
+
+
+def test_flush_writes_the_last_suppressed_record():
+    repeat_filter = RepeatFilter(interval=10.0)
+    repeat_filter.filter(record(100.0, "error 0"))
+    for i in range(1, 4):
+        repeat_filter.filter(record(100.0 + i, f"error {i}"))
+    assert repeat_filter.suppressed_total == 0
+
+    flushed = repeat_filter.flush(force=True)
+    assert [entry.getMessage() for entry in flushed] == ["error 3 (+2 similar in 3.0s)"]
+    assert flushed[0].suppressed == 2
+    assert repeat_filter.suppressed_total == 2
+
+    # The summary passes the filter, and the window starts over
+    assert repeat_filter.filter(flushed[0])
+    assert repeat_filter.filter(record(105.0))
+    assert repeat_filter.flush(force=True) == []
+    assert repeat_filter.suppressed_total == 2  # Never decreases
+
+
+def test_flush_keeps_open_windows():
+    repeat_filter = RepeatFilter(interval=3600.0)
+    now = logging.makeLogRecord({}).created
+    repeat_filter.filter(record(now))
+    repeat_filter.filter(record(now))
+    assert repeat_filter.flush() == []
+    assert len(repeat_filter.flush(force=True)) == 1
@@ -0,0 +1,96 @@
+"""
+Tests for MotionGate
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+import numpy as np
+import pytest
+
+from src.core.motion import MOTION_MOG2, MotionGate, RegionOfInterest
+
+HEIGHT, WIDTH = 90, 160
+
+
+def frame(level: int = 0, patch: int = 0) -> np.ndarray:
+    """Flat frame with a brighter patch in the top-left quarter"""
+    image = np.full((HEIGHT, WIDTH, 3), level, np.uint8)
+    image[:HEIGHT // 2, :WIDTH // 2] = min(level + patch, 255)
+    return image
+
+
+def detect_first(gate: MotionGate, image: np.ndarray):
+    assert gate.has_motion(image)
+    gate.mark_detected()
+
+
+def test_first_frame_counts_as_motion():
+    assert MotionGate().has_motion(frame())
+
+
+def test_static_frames_are_skipped():
+    gate = MotionGate(max_reuse=0)
+    detect_first(gate, frame())
+    assert not any(gate.has_motion(frame()) for _ in range(5))
+    assert gate.frames_static == 5
+    assert gate.get_stats()["skip_rate"] == pytest.approx(5 / 6)
+
+
+def test_change_counts_as_motion():
+    gate = MotionGate(max_reuse=0)
+    detect_first(gate, frame())
+    assert gate.has_motion(frame(patch=100))
+
+
+def test_slow_drift_adds_up_against_the_detected_frame():
+    gate = MotionGate(max_reuse=0, pixel_threshold=15)
+    detect_first(gate, frame())
+
+    # Each step changes less than the threshold, the sum does not
+    moving = [gate.has_motion(frame(patch=5 * step)) for step in range(1, 6)]
+    assert moving == [False, False, False, True, True]
+
+
+def test_reference_moves_only_on_detection():
+    gate = MotionGate(max_reuse=0)
+    detect_first(gate, frame())
+    assert gate.has_motion(frame(patch=100))
+    assert gate.has_motion(frame(patch=100))  # Not detected yet: still differs
+    gate.mark_detected()
+    assert not gate.has_motion(frame(patch=100))
+
+
+def test_detection_is_forced_after_max_reuse():
+    gate = MotionGate(max_reuse=3)
+    detect_first(gate, frame())
+
+    plan = []
+    for _ in range(8):
+        detect = gate.has_motion(frame()) or gate.refresh_due()
+        if detect:
+            gate.mark_detected()
+        plan.append(detect)
+    assert plan == [False, False, False, True, False, False, False, True]
+    assert gate.forced_refreshes == 2
+    assert gate.frames_static == 6  # Forced detections are not skipped frames
+
+
+def test_changes_outside_the_roi_are_ignored():
+    # ROI is the bottom-right quarter, the patch is top-left
+    roi = RegionOfInterest([[(0.5, 0.5), (1.0, 0.5), (1.0, 1.0), (0.5, 1.0)]])
+    gate = MotionGate(roi, max_reuse=0)
+    detect_first(gate, frame())
+    assert not gate.has_motion(frame(patch=200))
+
+
+def test_unknown_method_is_rejected():
+    with pytest.raises(ValueError):
+        MotionGate(method="optical-flow")
+
+
+def test_mog2_learns_a_static_background():
+    gate = MotionGate(method=MOTION_MOG2, max_reuse=0)
+    for _ in range(30):
+        gate.has_motion(frame())
+    assert not gate.has_motion(frame())
+    assert gate.has_motion(frame(patch=200))
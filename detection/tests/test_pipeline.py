@@ -0,0 +1,60 @@
+"""
+Tests for DropOldestQueue
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+import asyncio
+
+from src.core.pipeline import DropOldestQueue
+
+
+def test_full_queue_drops_the_oldest_item():
+    queue = DropOldestQueue(2)
+    for item in (1, 2, 3):
+        queue.put_nowait(item)
+
+    assert queue.dropped == 1
+    assert queue.qsize() == 2
+    assert queue.get_nowait() == 2
+    assert queue.get_nowait() == 3
+    assert queue.get_nowait() is None
+
+
+def test_maxsize_is_at_least_one():
+    queue = DropOldestQueue(0)
+    queue.put_nowait("a")
+    queue.put_nowait("b")
+    assert queue.get_nowait() == "b"
+    assert queue.dropped == 1
+
+
+def test_get_waits_for_a_put():
+    async def scenario():
+        queue = DropOldestQueue(1)
+        getter = asyncio.ensure_future(queue.get())
+        await asyncio.sleep(0)
+        assert not getter.done()
+        queue.put_nowait("frame")
+        return await asyncio.wait_for(getter, 1.0)
+
+    assert asyncio.run(scenario()) == "frame"
+
+
+def test_get_with_timeout_returns_none_when_empty():
+    async def scenario():
+        queue = DropOldestQueue(1)
+        missing = await queue.get_with_timeout(0.01)
+        queue.put_nowait(1)
+        return missing, await queue.get_with_timeout(0.01)
+
+    assert asyncio.run(scenario()) == (None, 1)
+
+
+def test_clear():
+    queue = DropOldestQueue(3)
+    queue.put_nowait(1)
+    queue.put_nowait(2)
+    queue.clear()
+    assert queue.qsize() == 0
+    assert queue.get_nowait() is None
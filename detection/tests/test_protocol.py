@@ -0,0 +1,85 @@
+"""
+Tests for the binary frame protocol
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+from src.core.protocol import (
+    BOX_DTYPE, FLAG_ANNOTATED, FLAG_BOXES, FLAG_IMAGE, PROTOCOL_BINARY, PROTOCOL_JSON,
+    VIEW_ANNOTATED, VIEW_BOXES, VIEW_RAW, build_payload, pack_binary_frame, unpack_binary_frame
+)
+
+JPEG = b"\xff\xd8fake jpeg\xff\xd9"
+
+
+def make_boxes() -> np.ndarray:
+    boxes = np.zeros(2, BOX_DTYPE)
+    for name, values in zip(BOX_DTYPE.names, ((1, 50), (2, 60), (30, 90), (40, 99), (0.9, 0.4), (2, 7))):
+        boxes[name] = values
+    return boxes
+
+
+def make_metadata() -> dict:
+    return {
+        "vehicleCount": 2,
+        "timestamp": 1718600000.5,
+        "frameCount": 42,
+        "frameSize": (640, 360),
+        "performance": {"avgDetectionTime": 0.02, "detectionFps": 25.0, "broadcastFps": 29.5}
+    }
+
+
+def test_pack_unpack_round_trip():
+    boxes = make_boxes()
+    data = pack_binary_frame(
+        JPEG, 2, 1718600000.5, 42, 0.02, 25.0, 29.5,
+        flags=FLAG_IMAGE | FLAG_BOXES, boxes=boxes, frame_size=(640, 360)
+    )
+    frame = unpack_binary_frame(data)
+
+    assert frame["vehicleCount"] == 2
+    assert frame["timestamp"] == 1718600000.5
+    assert frame["frameCount"] == 42
+    assert frame["performance"]["avgDetectionTime"] == pytest.approx(0.02)
+    assert frame["performance"]["detectionFps"] == pytest.approx(25.0)
+    assert frame["frameSize"] == (640, 360)
+    assert not frame["annotated"]
+    np.testing.assert_array_equal(frame["boxes"], boxes)
+    assert bytes(frame["image"]) == JPEG
+
+
+def test_boxes_only_frame_has_no_image():
+    data = pack_binary_frame(None, 0, 0.0, 1, 0.0, 0.0, 0.0, flags=FLAG_BOXES, boxes=None)
+    frame = unpack_binary_frame(data)
+    assert len(frame["boxes"]) == 0
+    assert "image" not in frame
+
+
+def test_unpack_rejects_foreign_data():
+    data = bytearray(pack_binary_frame(JPEG, 0, 0.0, 1, 0.0, 0.0, 0.0))
+    data[:4] = b"XXXX"
+    with pytest.raises(ValueError):
+        unpack_binary_frame(bytes(data))
+
+
+@pytest.mark.parametrize("view, flags", [
+    (VIEW_ANNOTATED, FLAG_IMAGE | FLAG_ANNOTATED),
+    (VIEW_RAW, FLAG_IMAGE | FLAG_BOXES),
+    (VIEW_BOXES, FLAG_BOXES)
+])
+def test_binary_payload_flags_per_view(view, flags):
+    jpeg = None if view == VIEW_BOXES else JPEG
+    frame = unpack_binary_frame(build_payload(view, PROTOCOL_BINARY, jpeg, make_boxes(), make_metadata(), {}))
+    assert frame["flags"] == flags
+
+
+def test_json_payload_labels_unknown_classes_by_id():
+    message = json.loads(build_payload(VIEW_BOXES, PROTOCOL_JSON, None, make_boxes(), make_metadata(), {2: "car"}))
+    assert message["classIds"] == [2, 7]
+    assert message["classes"] == {"2": "car", "7": "7"}
+    assert message["frameCount"] == 42
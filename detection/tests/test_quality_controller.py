@@ -0,0 +1,108 @@
+"""
+Tests for QualityController decisions
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+
+from config.settings import get_config
+from src.core.backends import InferenceBackend
+from src.core.detector import VehicleDetector
+from src.core.quality_controller import QualityController
+
+config = get_config()
+
+OVERLOADED = {"inference_p95": 1.0, "encode_p95": 0.001, "fps_ratio": 1.0, "dropped": 0}
+HEALTHY = {"inference_p95": 0.01, "encode_p95": 0.001, "fps_ratio": 1.0, "dropped": 0}
+
+
+@pytest.fixture
+def controller(monkeypatch):
+    monkeypatch.setattr(config, "QUALITY_LADDER", [{"input_size": 640}, {"input_size": 480}, {"input_size": 320}])
+    monkeypatch.setattr(config, "QUALITY_COOLDOWN", 6.0)
+    monkeypatch.setattr(config, "QUALITY_UPGRADE_HOLD", 3)
+    return QualityController(SimpleNamespace(backend=None), {})
+
+
+def step(controller: QualityController, observation: dict, now: float):
+    """decide(), then apply the level the way apply() would"""
+    level = controller.decide(observation, now)
+    if level is not None:
+        controller.level = level
+    return level
+
+
+def test_steps_down_on_a_missed_slo(controller):
+    level = step(controller, OVERLOADED, now=100.0)
+    assert level.index == 1
+    assert controller.decisions[-1]["direction"] == "down"
+
+
+def test_cooldown_holds_the_next_change(controller):
+    step(controller, OVERLOADED, now=100.0)
+    assert step(controller, OVERLOADED, now=103.0) is None
+    assert step(controller, OVERLOADED, now=107.0).index == 2
+    assert step(controller, OVERLOADED, now=120.0) is None  # Already at the cheapest rung
+
+
+def test_steps_up_only_after_sustained_headroom(controller):
+    step(controller, OVERLOADED, now=100.0)
+    assert step(controller, HEALTHY, now=110.0) is None
+    assert step(controller, HEALTHY, now=112.0) is None
+    assert step(controller, HEALTHY, now=114.0).index == 0
+    assert controller.decisions[-1]["direction"] == "up"
+
+
+def test_within_slo_without_headroom_resets_the_streak(controller):
+    marginal = dict(HEALTHY, inference_p95=config.QUALITY_SLO_INFERENCE * 0.9)
+    step(controller, OVERLOADED, now=100.0)
+
+    step(controller, HEALTHY, now=110.0)
+    step(controller, HEALTHY, now=112.0)
+    assert step(controller, marginal, now=114.0) is None
+    assert controller.healthy_streak == 0
+    assert step(controller, HEALTHY, now=116.0) is None
+
+
+def test_nobody_watching_holds_the_level(controller):
+    step(controller, OVERLOADED, now=100.0)
+    assert step(controller, None, now=200.0) is None
+    assert controller.level.index == 1
+
+
+def test_dropped_frames_count_as_a_violation(controller):
+    assert controller.violations(dict(HEALTHY, dropped=3)) == ["3 frames dropped before inference"]
+
+
+class RecordingBackend(InferenceBackend):
+    """Returns no detections and records the batch shapes it was given"""
+
+    name = "recording"
+
+    def __init__(self):
+        super().__init__("recording.pt")
+        self.shapes = []
+
+    def infer(self, batch):
+        self.shapes.append(tuple(batch.shape))
+        return [np.zeros((0, 6), np.float32) for _ in range(len(batch))]
+
+
+def test_apply_takes_effect_at_the_next_batch(monkeypatch):
+    monkeypatch.setattr(config, "QUALITY_LADDER", [{"input_size": 640}, {"input_size": 320}])
+    detector = VehicleDetector(RecordingBackend(), "cpu")
+    controller = QualityController(detector, {})
+
+    asyncio.run(controller.apply(controller.ladder[1]))
+    assert detector.input_size == 640  # Untouched until the inference thread picks it up
+
+    detector.detect_vehicles([np.zeros((48, 64, 3), np.uint8)])
+    assert detector.input_size == 320
+    assert detector.backend.shapes[-1][-2:] == (320, 320)
@@ -0,0 +1,59 @@
+"""
+Tests for calibration and evaluation frame sampling
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+import cv2
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+
+from src.core.quantization import sample_video_frames, split_video_frames
+
+
+def write_video(path, count):
+    """Write a clip whose frame i is filled with gray level 8 * i"""
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 10, (64, 48))
+    for i in range(count):
+        writer.write(np.full((48, 64, 3), 8 * i, np.uint8))
+    writer.release()
+    return path
+
+
+def frame_index(frame) -> int:
+    return int(round(frame.mean() / 8))
+
+
+def test_split_sets_are_disjoint_when_video_is_short(tmp_path):
+    # 2 * count >= total used to give identical sets
+    video = write_video(tmp_path / "clip.avi", 12)
+    calibration, evaluation = split_video_frames(video, 6, 6)
+
+    calibration_ids = [frame_index(frame) for frame in calibration]
+    evaluation_ids = [frame_index(frame) for frame in evaluation]
+    assert len(calibration_ids) == 6 and len(evaluation_ids) == 6
+    assert not set(calibration_ids) & set(evaluation_ids)
+
+
+def test_split_spreads_both_sets_over_the_video(tmp_path):
+    video = write_video(tmp_path / "clip.avi", 30)
+    calibration, evaluation = split_video_frames(video, 8, 4)
+
+    calibration_ids = [frame_index(frame) for frame in calibration]
+    evaluation_ids = [frame_index(frame) for frame in evaluation]
+    assert not set(calibration_ids) & set(evaluation_ids)
+    assert min(evaluation_ids) < 10 and max(evaluation_ids) >= 20
+
+
+def test_split_rejects_video_too_short_for_both_sets(tmp_path):
+    video = write_video(tmp_path / "clip.avi", 10)
+    with pytest.raises(ValueError, match="disjoint"):
+        split_video_frames(video, 8, 4)
+
+
+def test_sample_returns_every_frame_of_a_short_video(tmp_path):
+    video = write_video(tmp_path / "clip.avi", 5)
+    frames = sample_video_frames(video, 8)
+    assert [frame_index(frame) for frame in frames] == [0, 1, 2, 3, 4]
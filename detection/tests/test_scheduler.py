@@ -0,0 +1,75 @@
+"""
+Tests for InferenceScheduler batch collection
+Author: Alims-Repo
+Date: 2025-06-17
+"""
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+
+from src.core.scheduler import InferenceScheduler
+
+
+def make_scheduler(batch_size: int, sources=("a", "b", "c")) -> InferenceScheduler:
+    scheduler = InferenceScheduler(SimpleNamespace(batch_size=batch_size))
+    for source_id in sources:
+        scheduler.register_source(source_id)
+    return scheduler
+
+
+def submit(scheduler: InferenceScheduler, source_id: str, frames: int = 1):
+    scheduler.pending[source_id] = ([np.zeros((2, 2, 3), np.uint8)] * frames, None, 0.0)
+
+
+def served(batch) -> list:
+    return [source_id for source_id, _, _ in batch]
+
+
+def test_sources_share_a_batch_on_cpu():
+    scheduler = make_scheduler(batch_size=1)
+    for source_id in "abc":
+        submit(scheduler, source_id)
+
+    assert scheduler.capacity == 3
+    assert served(scheduler._collect_batch()) == ["a", "b", "c"]
+    assert scheduler.pending == {}
+
+
+def test_idle_sources_do_not_count_towards_capacity():
+    scheduler = make_scheduler(batch_size=1)
+    scheduler.set_source_idle("c", True)
+    assert scheduler.capacity == 2
+
+
+def test_rounds_rotate_the_first_source():
+    scheduler = make_scheduler(batch_size=2)
+    rounds = []
+    for _ in range(3):
+        for source_id in "abc":
+            submit(scheduler, source_id, frames=2)
+        rounds.append(served(scheduler._collect_batch()))
+        scheduler.pending.clear()
+
+    # Requests of 2 frames: only one fits per batch, each source leads in turn
+    assert rounds == [["a"], ["b"], ["c"]]
+
+
+def test_requests_that_do_not_fit_wait_for_the_next_round():
+    scheduler = make_scheduler(batch_size=4)
+    submit(scheduler, "a", frames=3)
+    submit(scheduler, "b", frames=2)
+    submit(scheduler, "c", frames=1)
+
+    assert served(scheduler._collect_batch()) == ["a", "c"]
+    assert served(scheduler._collect_batch()) == ["b"]
+
+
+def test_source_batch_size_splits_the_detector_batch():
+    scheduler = make_scheduler(batch_size=8)
+    assert scheduler.source_batch_size() == 2
+    scheduler.unregister_source("c")
+    assert scheduler.source_batch_size() == 4